@@ -2,22 +2,57 @@
 NETISエージェント - Streamlit Webアプリケーション
 """
 import streamlit as st
-from src.search_agent import NETISSearchAgent
+from src.search_agent import NETISSearchAgent, AgentCaches
+from src.facet_counter import FACET_FIELDS
+from src.intent_router import INTENT_SEARCH, INTENT_DETAIL, INTENT_COMPARE
+from src import metrics
+from src.profiling import profiler_from_env
+from contextlib import nullcontext
+import os
 import sys
+import uuid
 from pathlib import Path
 
 # srcディレクトリをパスに追加
 sys.path.insert(0, str(Path(__file__).parent))
 
+# メトリクスの集計と /metrics の公開（NETIS_METRICS / NETIS_METRICS_PORT、再実行しても1回だけ起動）
+metrics.configure_from_env()
+SHOW_METRICS_PANEL = os.getenv('NETIS_METRICS_PANEL', '0') == '1'
+if SHOW_METRICS_PANEL:
+    metrics.enable()
+
+
+@st.cache_resource
+def get_shared_caches() -> AgentCaches:
+    """全セッションで共有するキャッシュ（プロセスで1つ）"""
+    return AgentCaches()
+
 
 def init_session_state():
     """セッション状態の初期化"""
     if 'agent' not in st.session_state:
-        st.session_state.agent = NETISSearchAgent()
+        # 検索結果・応答などのキャッシュはセッション間で共有し、別のセッションの同じ質問にも再利用する
+        st.session_state.agent = NETISSearchAgent(caches=get_shared_caches())
     if 'messages' not in st.session_state:
         st.session_state.messages = []
     if 'search_results' not in st.session_state:
         st.session_state.search_results = []
+    if 'search_cursor' not in st.session_state:
+        st.session_state.search_cursor = None
+    if 'last_search' not in st.session_state:
+        st.session_state.last_search = None
+    if 'category_facets' not in st.session_state:
+        st.session_state.category_facets = []
+    if 'profiler' not in st.session_state:
+        # 1ターンごとのプロファイル（NETIS_PROFILE=cprofile / sampling、セッションごとに出力先を分ける）
+        st.session_state.profiler = profiler_from_env(f"session-{uuid.uuid4().hex[:12]}")
+
+
+def load_more_results():
+    """直前の検索の続きのページを取得して結果に追加（最初のページを取得したカーソルから続きだけを取得）"""
+    page = st.session_state.search_cursor.next_page()
+    st.session_state.search_results = st.session_state.search_results + page
 
 
 def display_search_results(results):
@@ -32,6 +67,8 @@ def display_search_results(results):
         with st.expander(f"【{i}】{result['tech_name']}", expanded=(i <= 3)):
             # URL
             st.markdown(f"🔗 [NETISページを開く]({result['url']})")
+            if result.get('duplicates'):
+                st.caption(f"ほぼ同一の登録技術 {result['duplicates']}件を省略しています")
 
             # アブストラクト
             st.markdown("**概要**")
@@ -46,10 +83,22 @@ def display_search_results(results):
             if categories:
                 st.markdown(f"**分類:** {' > '.join(categories)}")
 
+            # 事前計算した近傍グラフから類似技術を表示
+            if st.button("類似技術", key=f"similar_{i}"):
+                similar_results = st.session_state.agent.similar(result['id'])
+                if similar_results:
+                    for similar in similar_results:
+                        st.markdown(f"- [{similar['tech_name']}]({similar['url']})（類似度 {similar['score']:.2f}）")
+                else:
+                    st.info("類似技術のデータがありません。")
+
             # 詳細情報トグル
             show_details = st.checkbox(f"詳細を表示", key=f"detail_{i}")
 
             if show_details:
+                # 長文フィールドは表示時にIDで取得
+                result.update(st.session_state.agent.get_details([result['id']]).get(result['id'], {}))
+
                 if result.get('innovation'):
                     st.markdown("**新規性・期待される効果**")
                     st.write(result['innovation'])
@@ -93,20 +142,66 @@ def main():
         st.markdown("---")
         st.subheader("絞り込み（オプション）")
 
+        # 直前の検索結果（表示中の上位件数）の中での分類ごとの件数を選択肢に表示
+        # 分類で絞り込んだ検索ではその分類しか残らないため、絞り込み前の選択肢を使い続ける
+        last_search = st.session_state.last_search
+        if last_search is None or last_search[1] is None:
+            st.session_state.category_facets = st.session_state.agent.last_facets.get("category1", [])
+        facet_counts = {f["value"]: f["count"] for f in st.session_state.category_facets}
+        category_options = ["すべて"] + (
+            list(facet_counts.keys()) or ["道路維持修繕工", "トンネル補修補強工", "仮設工", "舗装工"]
+        )
+
         filter_category = st.selectbox(
             "分類で絞り込み",
-            ["すべて", "道路維持修繕工", "トンネル補修補強工", "仮設工", "舗装工"],
-            index=0
+            category_options,
+            help="括弧内は表示中の検索結果のうちその分類に該当する件数",
+            index=0,
+            format_func=lambda v: f"{v} ({facet_counts[v]})" if v in facet_counts else v
         )
 
+        evaluation_facets = st.session_state.agent.last_facets.get("evaluation", [])
+        if evaluation_facets:
+            st.markdown("**事後評価の内訳**")
+            for facet in evaluation_facets:
+                st.markdown(f"- {facet['value']}: {facet['count']}件")
+
+        # ツール呼び出しモード
+        st.markdown("---")
+        use_tools = st.toggle(
+            "ツール呼び出しモード",
+            value=st.session_state.agent.agent_mode == "tools",
+            help="検索・詳細取得・件数集計をAIがツールとして必要な時だけ呼び出します"
+        )
+        st.session_state.agent.agent_mode = "tools" if use_tools else "router"
+
         # 会話リセットボタン
         if st.button("会話をリセット"):
             st.session_state.agent.reset_conversation()
             st.session_state.messages = []
             st.session_state.search_results = []
+            st.session_state.search_cursor = None
+            st.session_state.last_search = None
             st.success("会話をリセットしました")
             st.rerun()
 
+        # キャッシュ統計
+        with st.expander("キャッシュ・トークン統計"):
+            st.json(st.session_state.agent.get_cache_stats())
+            st.json(st.session_state.agent.get_usage_stats())
+
+        # 段階ごとの所要時間・トークン数・推定コスト（NETIS_METRICS_PANEL=1）
+        if SHOW_METRICS_PANEL:
+            with st.expander("メトリクス"):
+                snapshot = metrics.REGISTRY.snapshot()
+                st.markdown("**段階ごとの所要時間**")
+                st.dataframe(snapshot["histograms"].get("netis_stage_duration_seconds", []), hide_index=True)
+                for name in ("netis_tokens_total", "netis_estimated_cost_usd_total",
+                             "netis_search_requests_total", "netis_cache_hit_ratio"):
+                    if snapshot["values"].get(name):
+                        st.markdown(f"**{name}**")
+                        st.dataframe(snapshot["values"][name], hide_index=True)
+
         # 使い方ガイド
         st.markdown("---")
         st.subheader("使い方")
@@ -140,54 +235,113 @@ def main():
             with st.chat_message("user"):
                 st.markdown(prompt)
 
-            # エージェント処理
-            with st.chat_message("assistant"):
+            # エージェント処理（意図判定・検索・結果の整形・応答生成までを1ターンとしてプロファイル）
+            profiler = st.session_state.profiler
+            turn_profile = (
+                profiler.stage(f"turn-{len(profiler.results) + 1:03d}") if profiler is not None else nullcontext()
+            )
+            searched = False
+            with st.chat_message("assistant"), turn_profile:
                 with st.spinner("検索中..."):
-                    # 検索キーワードを含む場合は検索実行
-                    search_keywords = ['探して', '検索', '教えて', '技術', '工法', '対策', 'ありますか', 'ください']
-                    needs_search = any(keyword in prompt for keyword in search_keywords)
-
-                    if needs_search:
+                    # 発話の意図をローカルで判定（検索・詳細・比較・雑談）
+                    route = st.session_state.agent.route_intent(
+                        prompt, num_results=len(st.session_state.search_results)
+                    )
+
+                    if st.session_state.agent.agent_mode == "tools":
+                        # 検索の要否・詳細取得はモデルがツール呼び出しで判断
+                        st.session_state.agent.last_search_results = st.session_state.search_results
+                        response = st.session_state.agent.run_agent_turn(prompt)
+                        if st.session_state.agent.last_search_results is not st.session_state.search_results:
+                            st.session_state.search_results = st.session_state.agent.last_search_results
+                            st.session_state.last_search = None
+                            st.session_state.search_cursor = None
+                        if st.session_state.agent.last_tool_timings:
+                            with st.expander("ツール呼び出し"):
+                                st.json(st.session_state.agent.last_tool_timings)
+                    elif route["intent"] == INTENT_SEARCH:
                         # フィルタ構築
                         filter_expr = None
                         if filter_category != "すべて":
-                            filter_expr = f"category1 eq '{filter_category}'"
+                            escaped = filter_category.replace("'", "''")
+                            filter_expr = f"category1 eq '{escaped}'"
 
-                        # 検索実行
+                        # 検索実行（ファセット件数も同じ検索で取得）
                         results = st.session_state.agent.search(
                             query=prompt,
                             top=top_k,
-                            filters=filter_expr
+                            filters=filter_expr,
+                            facets=FACET_FIELDS
                         )
                         st.session_state.search_results = results
-
-                        # 検索結果を整形
-                        results_text = st.session_state.agent.format_search_results_for_display(results)
-
-                        # AIによる応答生成
-                        context = f"以下の検索結果を踏まえて応答してください:\n\n{results_text}\n\nユーザーの質問: {prompt}"
-                        response = st.session_state.agent.chat(context)
+                        st.session_state.last_search = (prompt, filter_expr)
+                        st.session_state.search_cursor = st.session_state.agent.last_cursor
+                        searched = True
+
+                        # 類似クエリのヒットで応答も保存済みならLLM呼び出しを省略
+                        # （NETIS_SEMANTIC_CACHE_REUSE_RESPONSES=1 の場合のみ）
+                        response = st.session_state.agent._cached_semantic_response()
+                        if response is not None:
+                            st.session_state.agent.memory.add(
+                                "user", prompt,
+                                context_ref=st.session_state.agent.format_results_reference(results)
+                            )
+                            st.session_state.agent.memory.add("assistant", response)
+                        else:
+                            # 検索結果を整形
+                            results_text = st.session_state.agent.format_search_results_for_llm(results)
+
+                            # AIによる応答生成（古くなった検索結果は履歴上で短い参照に置き換わる）
+                            context = f"以下の検索結果を踏まえて応答してください:\n\n{results_text}"
+                            response = st.session_state.agent.chat(
+                                f"ユーザーの質問: {prompt}",
+                                context=context,
+                                context_ref=st.session_state.agent.format_results_reference(results)
+                            )
+                            st.session_state.agent._store_semantic_response(response)
                     else:
-                        # 通常の会話
-                        # 検索結果がある場合はコンテキストに含める
-                        if st.session_state.search_results:
-                            results_context = "\n\n直前の検索結果:\n"
-                            for i, r in enumerate(st.session_state.search_results, 1):
-                                results_context += f"{i}. {r['tech_name']}\n"
-                            response = st.session_state.agent.chat(results_context + "\n\n" + prompt)
+                        # 定型の詳細表示・比較表はLLMを使わずに直前の検索結果から作成
+                        response = None
+                        if route["intent"] in (INTENT_DETAIL, INTENT_COMPARE):
+                            response = st.session_state.agent.answer_followup(
+                                prompt, route, results=st.session_state.search_results
+                            )
+
+                        # 詳細・比較・通常の会話は再検索せず、検索結果があればコンテキストに含める
+                        if response is not None:
+                            pass
+                        elif st.session_state.search_results:
+                            results_context = st.session_state.agent.build_followup_context(
+                                st.session_state.search_results, route["targets"]
+                            )
+                            response = st.session_state.agent.chat(prompt, context=results_context)
                         else:
                             response = st.session_state.agent.chat(prompt)
 
                     st.markdown(response)
 
+            if profiler is not None:
+                profiler.write_summary()
+
             # アシスタントメッセージを保存
             st.session_state.messages.append({"role": "assistant", "content": response})
 
+            # サイドバーはこの検索より前に描画済みのため、新しい結果のファセット件数で描画し直す
+            if searched:
+                st.rerun()
+
     with col2:
         st.subheader("検索結果")
 
         if st.session_state.search_results:
             display_search_results(st.session_state.search_results)
+
+            # 表示済みのページは再検索せず、続きのページだけ取得
+            cursor = st.session_state.search_cursor
+            if cursor is not None and cursor.has_more:
+                if st.button("さらに読み込む"):
+                    load_more_results()
+                    st.rerun()
         else:
             st.info("検索を実行すると、ここに結果が表示されます")
 
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+MMR再ランキング（src/diversifier.py）の処理時間を候補数を変えて計測するスクリプト
+
+ほぼ同一の候補の集まりを含む合成の候補行列（float32、連続した行列）を作り、
+top件を選ぶまでの時間のp50/p95を、正規化済み・未正規化の候補それぞれで計測する。
+どちらかのp50が--budget-msを超えた候補数があれば終了コード1を返す（目安は数百件の候補で1ms未満）。
+
+使用方法:
+    python scripts/bench_mmr.py [--sizes 50 100 300] [--dimensions 1536] [--top 10] [--budget-ms 1.0]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.diversifier import mmr_rerank  # noqa: E402
+
+
+def make_pool(size, dimensions, rng):
+    """
+    合成の候補を作成（10件ほどずつ同じ中心の近くに置き、同じ製品系列の変種を模す）
+
+    Returns:
+        (クエリ, 正規化した候補の行列)
+    """
+    centers = rng.standard_normal((max(size // 10, 1), dimensions)).astype(np.float32)
+    pool = centers[rng.integers(0, len(centers), size)]
+    pool = pool + 0.3 * rng.standard_normal((size, dimensions)).astype(np.float32)
+    pool /= np.linalg.norm(pool, axis=1, keepdims=True)
+    query = centers[0] + 0.5 * rng.standard_normal(dimensions).astype(np.float32)
+    return query, np.ascontiguousarray(pool, dtype=np.float32)
+
+
+def measure(function, repeat):
+    """関数をrepeat回実行して (p50, p95) をミリ秒で返す（最初の数回は計測しない）"""
+    for _ in range(10):
+        function()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return float(np.percentile(samples, 50)), float(np.percentile(samples, 95))
+
+
+def main():
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="MMR再ランキングの処理時間の計測")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 100, 300])
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--lambda-mult", type=float, default=0.7)
+    parser.add_argument("--repeat", type=int, default=300)
+    parser.add_argument("--budget-ms", type=float, default=1.0, help="p50の上限（超えたら終了コード1）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'pool':>6} {'normalized p50':>15} {'p95':>7} {'raw p50':>9} {'p95':>7}")
+    print("-" * 50)
+
+    over_budget = []
+    for size in args.sizes:
+        query, pool = make_pool(size, args.dimensions, rng)
+        # 検索エージェントは取得時に正規化したベクトルを渡す（normalized=True）
+        normalized = measure(
+            lambda: mmr_rerank(query, pool, top=args.top, lambda_mult=args.lambda_mult, normalized=True),
+            args.repeat
+        )
+        # 正規化していない候補ではノルムの計算が加わる
+        raw_pool = pool * rng.uniform(0.5, 2.0, (size, 1)).astype(np.float32)
+        raw = measure(
+            lambda: mmr_rerank(query, raw_pool, top=args.top, lambda_mult=args.lambda_mult),
+            args.repeat
+        )
+        print(f"{size:>6} {normalized[0]:>15.3f} {normalized[1]:>7.3f} {raw[0]:>9.3f} {raw[1]:>7.3f}")
+        if max(normalized[0], raw[0]) > args.budget_ms:
+            over_budget.append(size)
+
+    if over_budget:
+        print(f"\nOver budget ({args.budget_ms} ms p50): pool sizes {over_budget}")
+        sys.exit(1)
+    print(f"\nAll pool sizes within {args.budget_ms} ms (p50)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+MinHash/LSHによる重複クラスタリングの処理時間を、合成コーパスの件数を変えて計測するスクリプト
+
+実データのsearchable_textを元に、一部の文字を置き換えた「ほぼ同一」の変種を混ぜた
+合成コーパスを作り、件数に対する処理時間の伸びと、埋め込んだ重複の検出率を確認する
+（小さい件数では全ペア比較の処理時間も計測して比較する）
+
+使用方法:
+    python scripts/bench_near_duplicate.py [--sizes 1000 2000 4000 8000] [--duplicate-rate 0.2]
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.near_duplicate import MinHasher, cluster_signatures, shingles  # noqa: E402
+
+
+def mutate(text, rate, rng):
+    """テキストの一部の文字を置き換えた変種を作成"""
+    chars = list(text)
+    for i in range(len(chars)):
+        if rng.random() < rate:
+            chars[i] = rng.choice(text)
+    return "".join(chars)
+
+
+def make_corpus(base_texts, size, duplicate_rate, rng):
+    """
+    合成コーパスを作成
+
+    Returns:
+        (テキストのリスト, 各テキストの元になった原本の番号)
+    """
+    texts, origins = [], []
+    num_originals = max(1, int(size * (1 - duplicate_rate)))
+    for i in range(num_originals):
+        # 原本は実データのテキストを組み合わせて件数を増やす
+        a, b = rng.sample(base_texts, 2)
+        texts.append(a[:len(a) // 2] + b[len(b) // 2:] + f" 第{i}版")
+        origins.append(i)
+    while len(texts) < size:
+        origin = rng.randrange(num_originals)
+        texts.append(mutate(texts[origin], 0.01, rng))
+        origins.append(origin)
+    return texts, origins
+
+
+def brute_force_pairs(texts):
+    """全ペアのJaccard類似度を計算（比較用、O(n^2)）"""
+    sets = [set(shingles(t).tolist()) for t in texts]
+    count = 0
+    for i in range(len(sets)):
+        for j in range(i + 1, len(sets)):
+            union = len(sets[i] | sets[j])
+            if union and len(sets[i] & sets[j]) / union >= 0.8:
+                count += 1
+    return count
+
+
+def main():
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="MinHash/LSH重複クラスタリングのスケーリング計測")
+    parser.add_argument("--documents", default="data/processed/netis_documents.json")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000, 4000, 8000])
+    parser.add_argument("--duplicate-rate", type=float, default=0.2)
+    parser.add_argument("--brute-force-max", type=int, default=500, help="全ペア比較を計測する最大件数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.documents, 'r', encoding='utf-8') as f:
+        base_texts = [doc['searchable_text'] for doc in json.load(f) if doc['searchable_text']]
+
+    rng = random.Random(args.seed)
+    hasher = MinHasher()
+
+    print(f"{'docs':>7} {'minhash(s)':>11} {'lsh(s)':>8} {'total(s)':>9} {'us/doc':>8} {'recall':>7} {'brute(s)':>9}")
+    print("-" * 66)
+
+    for size in args.sizes:
+        texts, origins = make_corpus(base_texts, size, args.duplicate_rate, rng)
+
+        start = time.perf_counter()
+        signatures = hasher.signatures(texts)
+        signature_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        labels = cluster_signatures(signatures)
+        cluster_time = time.perf_counter() - start
+
+        # 埋め込んだ変種のうち原本と同じクラスタに入った割合
+        origins = np.asarray(origins)
+        labels = np.asarray(labels)
+        variants = np.flatnonzero(origins != np.arange(len(origins)))
+        recall = float((labels[variants] == labels[origins[variants]]).mean()) if len(variants) else 1.0
+
+        brute = "-"
+        if size <= args.brute_force_max:
+            start = time.perf_counter()
+            brute_force_pairs(texts)
+            brute = f"{time.perf_counter() - start:.2f}"
+
+        total = signature_time + cluster_time
+        print(f"{size:>7} {signature_time:>11.2f} {cluster_time:>8.2f} {total:>9.2f} "
+              f"{total / size * 1e6:>8.0f} {recall:>7.3f} {brute:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+検索結果をプロンプトに渡す際のトークン数を、従来の表示用フォーマット
+（エージェントと共通のformat_results_for_display）とLLM用の圧縮フォーマットで比較するスクリプト
+
+ネットワークを使わず、処理済みJSONに対する簡易キーワード検索で
+典型的なクエリの検索結果を再現して比較する
+
+使用方法:
+    python scripts/compare_context_tokens.py [--top 10] [--budget N]
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.context_packer import pack_results_for_llm, format_results_for_display  # noqa: E402
+from src.token_counter import count_tokens  # noqa: E402
+
+
+TYPICAL_QUERIES = [
+    ["トンネル", "漏水"],
+    ["橋梁", "防食"],
+    ["舗装", "補修"],
+    ["防草"],
+    ["剥落", "コンクリート"],
+    ["環境", "騒音"],
+]
+
+
+def keyword_search(documents, terms, top):
+    """searchable_textに含まれる語の数で並べる簡易検索"""
+    scored = []
+    for doc in documents:
+        score = sum(doc['searchable_text'].count(term) for term in terms)
+        if score:
+            scored.append((score, doc))
+    scored.sort(key=lambda x: -x[0])
+    return [doc for _, doc in scored[:top]]
+
+
+def main():
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="プロンプト用フォーマットのトークン数比較")
+    parser.add_argument("--documents", default="data/processed/netis_documents.json")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget", type=int, default=None, help="全体のトークン予算（省略時は件数に応じて決定）")
+    args = parser.parse_args()
+
+    with open(args.documents, 'r', encoding='utf-8') as f:
+        documents = json.load(f)
+
+    print(f"{'query':<16} {'mode':<8} {'display':>8} {'packed':>8} {'ratio':>6}")
+    print("-" * 52)
+
+    totals = {False: [0, 0], True: [0, 0]}
+    for terms in TYPICAL_QUERIES:
+        results = keyword_search(documents, terms, args.top)
+        for details in (False, True):
+            before = count_tokens(format_results_for_display(results, show_details=details))
+            after = count_tokens(pack_results_for_llm(results, token_budget=args.budget, include_details=details))
+            totals[details][0] += before
+            totals[details][1] += after
+            mode = "detail" if details else "list"
+            print(f"{' '.join(terms):<16} {mode:<8} {before:>8} {after:>8} {before / max(after, 1):>5.1f}x")
+
+    print("-" * 52)
+    for details, (before, after) in totals.items():
+        mode = "detail" if details else "list"
+        print(f"{'TOTAL':<16} {mode:<8} {before:>8} {after:>8} {before / max(after, 1):>5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
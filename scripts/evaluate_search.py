@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+ゴールデンセットで検索の関連度と待ち時間を評価するスクリプト
+
+data/eval/golden_queries.jsonl のクエリをNETISSearchAgent.searchで並列に実行し、
+構成ごとに recall@k / MRR / nDCG@k と待ち時間（p50/p95/p99）を表示する。
+
+構成:
+    hybrid    全文検索 + ベクトル検索（既定）
+    vector    ベクトル検索のみ
+    keyword   全文検索のみ
+    mmr       hybrid + MMRによる多様化
+    dims256   hybrid + 256次元に縮めたエンベディング
+
+バックエンド:
+    fake   ローカルのスタンドイン（src/fake_azure.py）を起動し、処理済みJSONを投入して評価（既定）
+    azure  .envのAzure AI Searchをそのまま使う。dims構成は {AZURE_SEARCH_INDEX_NAME}-d{次元数}
+           のインデックス（EMBEDDING_DIMENSIONSを設定してupload_to_search.pyで作成）を使う
+
+使用方法:
+    python scripts/evaluate_search.py [--backend fake] [--configs hybrid,vector,keyword,mmr,dims256] [--k 10]
+
+注意:
+    同梱のゴールデンセットは技術名・概要の語句一致で自動ラベル付けしたもので、
+    語句一致で順位を決めるkeyword構成に有利な偏りがある。構成間の比較は目安とし、
+    人手で確認したラベルに置き換えてから判断すること。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.evaluation import load_golden_queries, evaluate_ranking  # noqa: E402
+
+
+ROOT = Path(__file__).parent.parent
+DEFAULT_GOLDEN_PATH = ROOT / "data" / "eval" / "golden_queries.jsonl"
+
+# 同梱ゴールデンセットのラベル付け方法に由来する偏り（レポートにも表示する）
+GOLDEN_LABEL_BIAS_NOTE = (
+    "Note: the bundled golden set was labeled automatically by term matching, "
+    "which favors the keyword config. Treat cross-config comparisons as indicative only."
+)
+
+# 構成名 → search()の引数と次元数
+CONFIGS = {
+    "hybrid": {"mode": "hybrid", "diversify": False, "dimensions": None},
+    "vector": {"mode": "vector", "diversify": False, "dimensions": None},
+    "keyword": {"mode": "keyword", "diversify": False, "dimensions": None},
+    "mmr": {"mode": "hybrid", "diversify": True, "dimensions": None},
+    "dims256": {"mode": "hybrid", "diversify": False, "dimensions": 256},
+}
+
+
+def set_dimensions(dimensions):
+    """エンベディングの次元数を環境変数で切り替える（Noneならモデルの既定）"""
+    if dimensions:
+        os.environ["EMBEDDING_DIMENSIONS"] = str(dimensions)
+    else:
+        os.environ.pop("EMBEDDING_DIMENSIONS", None)
+
+
+def index_name_for(base_name, dimensions):
+    """次元数ごとのインデックス名"""
+    return f"{base_name}-d{dimensions}" if dimensions else base_name
+
+
+def seed_fake_index(index_name, dimensions, documents):
+    """スタンドインのインデックスを作成し、エンベディング付きのドキュメントを投入"""
+    from src.embedding_generator import create_embedding_generator
+    from src.search_indexer import AzureSearchIndexer
+
+    set_dimensions(dimensions)
+    indexer = AzureSearchIndexer(index_name=index_name)
+    indexer.create_index()
+    generator = create_embedding_generator()
+    vectors = generator.generate_embeddings_batch(
+        [doc["searchable_text"] for doc in documents], delay=0.0
+    )
+    indexer.upload_documents(
+        [dict(doc, searchable_text_vector=vector) for doc, vector in zip(documents, vectors)],
+        batch_size=len(documents)
+    )
+
+
+def run_config(name, config, golden, base_index, k, workers, semantic_cache=False):
+    """1構成でゴールデンセットの全クエリを実行して評価"""
+    from src.search_agent import NETISSearchAgent
+
+    set_dimensions(config["dimensions"])
+    os.environ["AZURE_SEARCH_INDEX_NAME"] = index_name_for(base_index, config["dimensions"])
+    # セマンティックキャッシュはヒット時に別クエリの結果を返すため、指定時のみ有効にして評価する
+    os.environ["NETIS_SEMANTIC_CACHE"] = "1" if semantic_cache else "0"
+    agent = NETISSearchAgent()
+
+    def run_query(item):
+        start = time.perf_counter()
+        results = agent.search(
+            item["query"], top=k, mode=config["mode"], diversify=config["diversify"], record=False
+        )
+        elapsed = time.perf_counter() - start
+        metrics = evaluate_ranking([r["id"] for r in results], item["relevant"], k)
+        return dict(metrics, query=item["query"], latency_ms=elapsed * 1000.0)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        per_query = list(executor.map(run_query, golden))
+
+    latencies = np.asarray([q["latency_ms"] for q in per_query])
+    return {
+        "config": dict(config),
+        "recall": float(np.mean([q["recall"] for q in per_query])),
+        "mrr": float(np.mean([q["mrr"] for q in per_query])),
+        "ndcg": float(np.mean([q["ndcg"] for q in per_query])),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "queries": per_query,
+    }
+
+
+def main():
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="ゴールデンセットによる検索の評価")
+    parser.add_argument("--golden", default=str(DEFAULT_GOLDEN_PATH))
+    parser.add_argument("--backend", default="fake", choices=["fake", "azure"])
+    parser.add_argument("--configs", default=",".join(CONFIGS), help="評価する構成（カンマ区切り）")
+    parser.add_argument("--k", type=int, default=10, help="評価する上位件数")
+    parser.add_argument("--workers", type=int, default=4, help="並列に実行するクエリ数")
+    parser.add_argument("--embedding-provider", default="local", choices=["azure", "local"],
+                        help="fakeバックエンドでのエンベディング（localはプロセス内で生成）")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="fakeバックエンドに加える遅延")
+    parser.add_argument("--semantic-cache", action="store_true",
+                        help="セマンティックキャッシュを有効にして評価する（類似クエリのヒットが指標・待ち時間に反映される）")
+    parser.add_argument("--output", default=None, help="結果を保存するJSON")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.configs.split(",") if name.strip()]
+    unknown = [name for name in names if name not in CONFIGS]
+    if unknown:
+        parser.error(f"unknown configs: {', '.join(unknown)}")
+
+    golden = load_golden_queries(args.golden)
+    print(f"Loaded {len(golden)} golden queries from {args.golden}")
+
+    server = None
+    if args.backend == "fake":
+        from src.fake_azure import FakeAzureServer, FakeServiceConfig
+        server = FakeAzureServer(config=FakeServiceConfig(latency_ms=args.latency_ms)).start()
+        os.environ.update(server.environment(index_name="netis-eval"))
+        os.environ["EMBEDDING_PROVIDER"] = args.embedding_provider
+        with open(ROOT / "data" / "processed" / "netis_documents.json", "r", encoding="utf-8") as f:
+            documents = json.load(f)
+        for dimensions in sorted({CONFIGS[name]["dimensions"] or 0 for name in names}):
+            seed_fake_index(index_name_for("netis-eval", dimensions), dimensions, documents)
+    else:
+        from dotenv import load_dotenv
+        load_dotenv()
+    base_index = os.getenv("AZURE_SEARCH_INDEX_NAME", "netis-index")
+
+    report = {}
+    try:
+        for name in names:
+            report[name] = run_config(
+                name, CONFIGS[name], golden, base_index, args.k, args.workers, args.semantic_cache
+            )
+    finally:
+        if server is not None:
+            server.stop()
+
+    k = args.k
+    print(f"\n{'config':<10} {f'recall@{k}':>10} {'MRR':>7} {f'nDCG@{k}':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    print("-" * 66)
+    for name, result in report.items():
+        print(f"{name:<10} {result['recall']:>10.3f} {result['mrr']:>7.3f} {result['ndcg']:>8.3f} "
+              f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}")
+    note = GOLDEN_LABEL_BIAS_NOTE if Path(args.golden).resolve() == DEFAULT_GOLDEN_PATH.resolve() else None
+    if note:
+        print(f"\n{note}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"backend": args.backend, "k": k, "golden": args.golden,
+                       "semantic_cache": args.semantic_cache, "note": note, "configs": report},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\nSaved results to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
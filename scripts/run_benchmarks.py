@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+取り込みから会話までの各段階の処理時間を計測するベンチマーク
+
+ローカルのスタンドイン（src/fake_azure.py）を起動し、以下の段階を計測する:
+    excel_load       Excelの読み込み
+    convert          クリーンアップと検索ドキュメントへの変換
+    embed            エンベディング生成（16件ずつ）
+    upload           インデックスへの投入（10件ずつ）
+    search_cold      キャッシュを空にした状態での検索
+    search_warm      同じクエリの再検索（キャッシュヒット）
+    chat_ttft        チャットのストリーミング応答の最初のトークンまでの時間
+    process_query    会話1ターン全体（検索・詳細・比較・雑談）
+
+各段階についてp50/p95/p99・スループット・ピークRSSをJSONに保存し、
+--compareで以前の結果と比べてp95が閾値を超えて悪化した段階があれば終了コード1を返す。
+
+peak_rss_mb_cumulativeはプロセス開始からのピーク（ru_maxrss）で、それまでの段階の分も含む。
+段階ごとのピークは--memoryを付けるとtracemallocで計測してpeak_traced_mbに保存する
+（Pythonが確保したメモリのみ。計測中は処理が遅くなるため、p95の比較には使わないこと）。
+
+使用方法:
+    python scripts/run_benchmarks.py [--repeat 3] [--latency-ms 20] [--output benchmark_results/HEAD.json]
+    python scripts/run_benchmarks.py --memory
+    python scripts/run_benchmarks.py --compare benchmark_results/<前回>.json [--threshold 0.2]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.fake_azure import FakeAzureServer, FakeServiceConfig  # noqa: E402
+
+
+ROOT = Path(__file__).parent.parent
+
+BENCHMARK_QUERIES = [
+    "トンネルの漏水対策技術を教えて",
+    "橋梁の防食塗装",
+    "舗装のひび割れ補修",
+    "防草対策の工法を探してください",
+    "コンクリートの剥落防止技術",
+    "騒音を抑える施工方法",
+]
+
+# process_queryで再生する会話（検索 → 詳細 → 比較 → 雑談）
+BENCHMARK_CONVERSATION = [
+    "トンネルの漏水対策技術を教えて",
+    "2番目について詳しく",
+    "1番と3番を比較して",
+    "ありがとう",
+]
+
+
+def peak_rss_mb() -> float:
+    """プロセス開始からのピークRSS（MB、Linuxのru_maxrssはKB単位、段階ごとには戻らない）"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / 1024.0 if sys.platform != "darwin" else usage / (1024.0 * 1024.0)
+
+
+def summarize(samples, items, wall_seconds):
+    """計測値を集計"""
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    return {
+        "count": len(samples),
+        "items": items,
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "throughput_per_s": round(items / wall_seconds, 3) if wall_seconds > 0 else None,
+        "peak_rss_mb_cumulative": round(peak_rss_mb(), 1),
+    }
+
+
+def timed(function, *args, **kwargs):
+    """関数を実行して (戻り値, 経過秒) を返す"""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+class BenchmarkRunner:
+    """各段階を順に計測するクラス（失敗した段階は記録して次へ進む）"""
+
+    def __init__(self, args):
+        self.args = args
+        self.results = {}
+        self.documents = None
+        self.agent = None
+
+    def run_stage(self, name, function):
+        """1段階を計測して結果を記録"""
+        print(f"[{name}] ...", end=" ", flush=True)
+        if self.args.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            samples, items = function()
+        except Exception as e:
+            self.results[name] = {"error": f"{type(e).__name__}: {e}"}
+            print(f"skipped ({type(e).__name__}: {e})")
+            return
+        finally:
+            traced_peak = None
+            if self.args.memory:
+                _, traced_peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+        summary = summarize(samples, items, time.perf_counter() - start)
+        memory = f"RSS {summary['peak_rss_mb_cumulative']} MB (cumulative)"
+        if traced_peak is not None:
+            summary["peak_traced_mb"] = round(traced_peak / 1024 / 1024, 1)
+            memory += f" / traced {summary['peak_traced_mb']} MB"
+        self.results[name] = summary
+        print(f"p50 {summary['p50_ms']:.1f} ms / p95 {summary['p95_ms']:.1f} ms / "
+              f"{summary['throughput_per_s']} items/s / {memory}")
+
+    # ---- 各段階 ----
+
+    def stage_excel_load(self):
+        from src.data_processor import NETISDataProcessor
+        samples = []
+        for _ in range(self.args.repeat):
+            processor = NETISDataProcessor(str(ROOT / "netisデータ.xlsx"))
+            _, elapsed = timed(processor.load_excel)
+            samples.append(elapsed)
+        self.processor = processor
+        return samples, len(processor.df) * self.args.repeat
+
+    def stage_convert(self):
+        samples = []
+        raw = self.processor.df.copy()
+        for _ in range(self.args.repeat):
+            self.processor.df = raw.copy()
+            start = time.perf_counter()
+            self.processor.clean_data()
+            documents = self.processor.convert_to_search_documents()
+            samples.append(time.perf_counter() - start)
+        self.documents = documents
+        return samples, len(documents) * self.args.repeat
+
+    def load_documents(self):
+        """Excelの段階を実行できない環境では処理済みJSONを使う"""
+        if self.documents is None:
+            with open(ROOT / "data" / "processed" / "netis_documents.json", "r", encoding="utf-8") as f:
+                self.documents = json.load(f)
+        return self.documents
+
+    def stage_embed(self):
+        from src.embedding_generator import create_embedding_generator
+        documents = self.load_documents()[:self.args.max_documents]
+        generator = create_embedding_generator()
+        texts = [doc["searchable_text"] for doc in documents]
+        samples, vectors = [], []
+        for i in range(0, len(texts), 16):
+            batch_vectors, elapsed = timed(generator.generate_embeddings, texts[i:i + 16])
+            vectors.extend(batch_vectors)
+            samples.append(elapsed)
+        for doc, vector in zip(documents, vectors):
+            doc["searchable_text_vector"] = vector
+        self.embedded = documents
+        return samples, len(texts)
+
+    def stage_upload(self):
+        from azure.search.documents import SearchClient
+        from src.search_indexer import AzureSearchIndexer
+        indexer = AzureSearchIndexer()
+        indexer.create_index()
+        # upload_documentsはバッチ間で待機するため、SDKの呼び出しだけを計測する
+        client = SearchClient(indexer.endpoint, indexer.index_name, indexer.credential)
+        samples = []
+        for i in range(0, len(self.embedded), 10):
+            _, elapsed = timed(client.upload_documents, documents=self.embedded[i:i + 10])
+            samples.append(elapsed)
+        return samples, len(self.embedded)
+
+    def get_agent(self):
+        if self.agent is None:
+            from src.search_agent import NETISSearchAgent
+            self.agent = NETISSearchAgent()
+        return self.agent
+
+    def stage_search_cold(self):
+        agent = self.get_agent()
+        samples = []
+        for _ in range(self.args.repeat):
+            for query in BENCHMARK_QUERIES:
+                agent.search_cache.clear()
+                if agent.semantic_cache is not None:
+                    agent.semantic_cache.clear()
+                _, elapsed = timed(agent.search, query, top=10)
+                samples.append(elapsed)
+        return samples, len(samples)
+
+    def stage_search_warm(self):
+        agent = self.get_agent()
+        samples = []
+        for _ in range(self.args.repeat):
+            for query in BENCHMARK_QUERIES:
+                _, elapsed = timed(agent.search, query, top=10)
+                samples.append(elapsed)
+        return samples, len(samples)
+
+    def stage_chat_ttft(self):
+        agent = self.get_agent()
+        samples = []
+        for _ in range(self.args.repeat):
+            for query in BENCHMARK_QUERIES:
+                messages = [
+                    {"role": "system", "content": agent._build_system_prompt()},
+                    {"role": "user", "content": query}
+                ]
+                start = time.perf_counter()
+                stream = agent.openai_client.chat.completions.create(
+                    model=agent.deployment_name, messages=messages, stream=True, max_tokens=1500
+                )
+                first = None
+                for chunk in stream:
+                    if first is None and chunk.choices and chunk.choices[0].delta.content:
+                        first = time.perf_counter() - start
+                samples.append(first if first is not None else time.perf_counter() - start)
+        return samples, len(samples)
+
+    def stage_process_query(self):
+        agent = self.get_agent()
+        samples = []
+        for _ in range(self.args.repeat):
+            agent.reset_conversation()
+            # 2回目以降が応答・検索キャッシュにヒットしないよう、毎回空の状態から会話する
+            agent.search_cache.clear()
+            agent.detail_cache.clear()
+            if agent.semantic_cache is not None:
+                agent.semantic_cache.clear()
+            if agent.response_cache is not None:
+                agent.response_cache.clear()
+            for turn in BENCHMARK_CONVERSATION:
+                _, elapsed = timed(agent.process_query, turn)
+                samples.append(elapsed)
+        return samples, len(samples)
+
+    def run(self):
+        self.run_stage("excel_load", self.stage_excel_load)
+        if "excel_load" in self.results and "error" not in self.results["excel_load"]:
+            self.run_stage("convert", self.stage_convert)
+        self.run_stage("embed", self.stage_embed)
+        if "embed" in self.results and "error" not in self.results["embed"]:
+            self.run_stage("upload", self.stage_upload)
+        self.run_stage("search_cold", self.stage_search_cold)
+        self.run_stage("search_warm", self.stage_search_warm)
+        self.run_stage("chat_ttft", self.stage_chat_ttft)
+        self.run_stage("process_query", self.stage_process_query)
+        return self.results
+
+
+def git_commit() -> str:
+    """現在のコミットの短縮ハッシュ"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current, baseline, threshold):
+    """
+    以前の結果とp95を比較して表示
+
+    Returns:
+        悪化した段階の名前のリスト
+    """
+    regressions = []
+    print(f"\n{'stage':<16} {'base p95':>10} {'new p95':>10} {'change':>8}")
+    print("-" * 48)
+    for stage, result in current["stages"].items():
+        base = baseline.get("stages", {}).get(stage, {})
+        if "p95_ms" not in result or "p95_ms" not in base:
+            continue
+        change = result["p95_ms"] / base["p95_ms"] - 1.0 if base["p95_ms"] else 0.0
+        mark = ""
+        if change > threshold:
+            regressions.append(stage)
+            mark = "  REGRESSION"
+        print(f"{stage:<16} {base['p95_ms']:>10.1f} {result['p95_ms']:>10.1f} {change:>+7.0%}{mark}")
+    return regressions
+
+
+def main():
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="NETIS検索エージェントのベンチマーク")
+    parser.add_argument("--repeat", type=int, default=3, help="各段階の繰り返し回数")
+    parser.add_argument("--max-documents", type=int, default=None, help="エンベディング・投入に使う最大件数")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="スタンドインに加える遅延")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--embedding-provider", default="azure", choices=["azure", "local"],
+                        help="azureはスタンドインのエンベディングAPIを経由、localはプロセス内で生成")
+    parser.add_argument("--output", default=None, help="結果のJSON（省略時はbenchmark_results/<commit>.json）")
+    parser.add_argument("--compare", default=None, help="比較対象の以前の結果JSON")
+    parser.add_argument("--threshold", type=float, default=0.2, help="悪化とみなすp95の増加率")
+    parser.add_argument("--memory", action="store_true",
+                        help="段階ごとのピークメモリをtracemallocで計測（処理が遅くなる）")
+    args = parser.parse_args()
+
+    config = FakeServiceConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        throttle_rate=args.throttle_rate, failure_rate=args.failure_rate
+    )
+    workdir = tempfile.mkdtemp(prefix="netis-bench-")
+
+    with FakeAzureServer(config=config) as server:
+        os.environ.update(server.environment(index_name="netis-bench"))
+        os.environ["EMBEDDING_PROVIDER"] = args.embedding_provider
+        # 実行環境のキャッシュ・設定ファイルの影響を受けないようにする
+        os.environ["NETIS_INDEX_VERSION_PATH"] = str(Path(workdir) / "index_version.json")
+        os.environ["NETIS_SIMILARITY_GRAPH_PATH"] = str(Path(workdir) / "similar_technologies.npz")
+
+        print(f"Fake Azure services: {server.url} (latency {args.latency_ms} ms)")
+        stages = BenchmarkRunner(args).run()
+        with server.state.lock:
+            server_stats = json.loads(json.dumps(server.state.stats))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "server": server_stats,
+        "stages": stages,
+    }
+
+    output = Path(args.output or ROOT / "benchmark_results" / f"{report['commit']}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved results to: {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions (p95 +{args.threshold:.0%} or more): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+チャットモデルに公開するツール（search / get_details / facet）の定義と実行
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import List, Dict, Any, Optional, Tuple, TYPE_CHECKING
+import json
+import time
+from src.context_packer import pack_results_for_llm
+from src.facet_counter import FACET_FIELDS
+from src import tracing
+
+if TYPE_CHECKING:
+    from src.search_agent import NETISSearchAgent
+
+
+# ツール使用時にシステムプロンプトへ追加する指示
+TOOL_USAGE_PROMPT = """
+
+【ツールの使い方】
+- 新しい技術を探す時だけ search を使う（複数の観点がある場合は並列に呼んでよい）
+- 直前の検索結果の詳細・比較には get_details を使い、再検索しない
+- 絞り込みを提案する時は facet で分類ごとの件数を確認する
+- 挨拶やお礼にはツールを使わずに答える"""
+
+# ツール定義（毎回同一の内容にしてプロンプトキャッシュの共通先頭部分に含める）
+TOOL_DEFINITIONS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "search",
+            "description": "NETISの技術をハイブリッド検索する。新しい技術を探す時だけ使い、直前の結果への質問には使わない。",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string", "description": "検索クエリ（日本語）"},
+                    "top": {"type": "integer", "description": "取得件数（1〜20）", "default": 10},
+                    "category": {"type": "string", "description": "主分類（category1）での絞り込み値（任意）"}
+                },
+                "required": ["query"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_details",
+            "description": "直前の検索結果のうち指定した番号の技術の詳細（効果・適用条件・適用範囲・留意事項）を取得する。",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "numbers": {
+                        "type": "array",
+                        "items": {"type": "integer"},
+                        "description": "検索結果の番号（#N のN）"
+                    }
+                },
+                "required": ["numbers"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "facet",
+            "description": "直前の検索結果の分類・事後評価ごとの件数を取得する。絞り込みを提案する時に使う。",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "fields": {
+                        "type": "array",
+                        "items": {"type": "string", "enum": FACET_FIELDS},
+                        "description": "集計するフィールド"
+                    }
+                }
+            }
+        }
+    }
+]
+
+
+class AgentToolExecutor:
+    """モデルが1ターンで発行したツール呼び出しを並列に実行するクラス"""
+
+    def __init__(self, agent: "NETISSearchAgent", max_workers: int = 4):
+        """
+        初期化
+
+        Args:
+            agent: ツールの実処理を行うエージェント
+            max_workers: 並列実行の最大数
+        """
+        self.agent = agent
+        self.max_workers = max_workers
+
+    def execute(self, tool_calls: List[Any]) -> Tuple[List[Dict[str, str]], List[Dict[str, Any]]]:
+        """
+        ツール呼び出しを並列に実行
+
+        同じターンの複数のsearchは結果を発行順に統合して1つの番号付き結果にする。
+        get_details / facet は実行前の検索結果を参照する。
+
+        Args:
+            tool_calls: chat.completionsのレスポンスのtool_calls
+
+        Returns:
+            (toolロールのメッセージのリスト, ツールごとの実行時間の記録)
+        """
+        previous_results = list(self.agent.last_search_results)
+        calls = []
+        for call in tool_calls:
+            try:
+                arguments = json.loads(call.function.arguments or "{}")
+            except ValueError:
+                arguments = {}
+            calls.append((call.id, call.function.name, arguments))
+
+        def run(name: str, arguments: Dict[str, Any]) -> Tuple[Any, float]:
+            start = time.perf_counter()
+            with tracing.span("tool." + name) as span:
+                try:
+                    result = self._dispatch(name, arguments, previous_results)
+                except Exception as e:
+                    result = {"error": str(e)}
+                    span.set(error=str(e))
+            return result, time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(copy_context().run, run, name, arguments) for _, name, arguments in calls]
+            outcomes = [future.result() for future in futures]
+
+        # 複数のsearchの結果を発行順に統合（重複は最初の出現を採用）
+        merged: List[Dict[str, Any]] = []
+        positions: Dict[str, int] = {}
+        for (_, name, _), (result, _) in zip(calls, outcomes):
+            if name == "search" and isinstance(result, list):
+                for item in result:
+                    if item["id"] not in positions:
+                        positions[item["id"]] = len(merged) + 1
+                        merged.append(item)
+        if merged:
+            self.agent.last_search_results = merged
+
+        messages = []
+        timings = []
+        for (call_id, name, arguments), (result, elapsed) in zip(calls, outcomes):
+            if name == "search" and isinstance(result, list):
+                content = pack_results_for_llm(result, numbers=[positions[r["id"]] for r in result])
+            elif isinstance(result, str):
+                content = result
+            else:
+                content = json.dumps(result, ensure_ascii=False)
+            messages.append({"role": "tool", "tool_call_id": call_id, "content": content})
+            timings.append({"name": name, "arguments": arguments, "seconds": elapsed})
+
+        return messages, timings
+
+    def _dispatch(
+        self,
+        name: str,
+        arguments: Dict[str, Any],
+        previous_results: List[Dict[str, Any]]
+    ) -> Any:
+        """ツール名に応じて処理を実行"""
+        if name == "search":
+            return self._search(arguments)
+        if name == "get_details":
+            return self._get_details(arguments, previous_results)
+        if name == "facet":
+            return self._facet(arguments, previous_results)
+        return {"error": f"unknown tool: {name}"}
+
+    def _search(self, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """searchツール"""
+        top = max(1, min(int(arguments.get("top", 10) or 10), 20))
+        filters = None
+        category = arguments.get("category")
+        if category:
+            escaped = str(category).replace("'", "''")
+            filters = f"category1 eq '{escaped}'"
+        # 同じターンのsearchは並列に実行されるため、エージェントの状態は更新せず戻り値だけを使う
+        return self.agent.search(arguments.get("query", ""), top=top, filters=filters, record=False)
+
+    def _get_details(self, arguments: Dict[str, Any], previous_results: List[Dict[str, Any]]) -> str:
+        """get_detailsツール"""
+        numbers = [
+            int(n) for n in arguments.get("numbers", [])
+            if isinstance(n, (int, float, str)) and str(n).isdigit() and 1 <= int(n) <= len(previous_results)
+        ]
+        if not numbers:
+            return "該当する番号の検索結果がありません。"
+        selected = [previous_results[n - 1] for n in numbers]
+        self.agent.attach_details(selected)
+        return pack_results_for_llm(selected, include_details=True, numbers=numbers)
+
+    def _facet(
+        self,
+        arguments: Dict[str, Any],
+        previous_results: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """facetツール"""
+        fields: Optional[List[str]] = arguments.get("fields") or ["category1", "evaluation"]
+        # ツールの検索はself.last_facetsに記録しないため、手元の結果から数える
+        return self.agent._count_facets(previous_results, fields)
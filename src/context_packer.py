@@ -0,0 +1,192 @@
+"""
+検索結果をLLMのプロンプト用に圧縮して整形するモジュール
+"""
+import re
+from typing import List, Dict, Any, Optional
+from urllib.parse import urlparse, parse_qs
+from src.token_counter import count_tokens, truncate_to_tokens
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# NETISの記入様式の見出し行（①自然条件、②期待される効果は?など）
+_TEMPLATE_HEADING_RE = re.compile(r"^[①-⑳]")
+
+# 情報を持たない箇条書き
+_EMPTY_BULLETS = {"・特になし", "・なし", "特になし", "なし"}
+
+# 1件あたりに含めるフィールドと優先度順（ラベル, キー）
+SUMMARY_FIELDS = [("概要", "abstract")]
+DETAIL_FIELDS = [
+    ("効果", "innovation"),
+    ("条件", "conditions"),
+    ("範囲", "scope"),
+    ("留意", "notes")
+]
+
+
+def compact_text(text: str) -> str:
+    """記入様式の見出しや「特になし」を除き、改行・連続空白を1つの空白にまとめる"""
+    lines = []
+    for line in str(text or "").splitlines():
+        line = line.strip()
+        if not line or _TEMPLATE_HEADING_RE.match(line) or line in _EMPTY_BULLETS:
+            continue
+        lines.append(line)
+    return _WHITESPACE_RE.sub(" ", " ".join(lines)).strip()
+
+
+def short_id(result: Dict[str, Any]) -> str:
+    """
+    結果を参照するための短いIDを取得（NETIS登録番号、無ければドキュメントID）
+
+    Args:
+        result: 検索結果
+
+    Returns:
+        短いID（例: KK-240031）
+    """
+    url = result.get("url", "")
+    if url:
+        reg_no = parse_qs(urlparse(url).query).get("regNo", [""])[0].strip()
+        if reg_no:
+            return reg_no
+    return result.get("id", "")
+
+
+# 予算を指定しない場合の1件あたりのトークン数
+DEFAULT_TOKENS_PER_RESULT = 120
+DEFAULT_TOKENS_PER_RESULT_WITH_DETAILS = 400
+
+
+def format_results_for_display(results: List[Dict[str, Any]], show_details: bool = False) -> str:
+    """
+    検索結果を表示用にフォーマット（NETISSearchAgent.format_search_results_for_displayの整形部分）
+
+    Args:
+        results: 検索結果（show_detailsの場合は詳細フィールドを付与済みのもの）
+        show_details: 詳細情報を表示するか
+
+    Returns:
+        フォーマットされた文字列
+    """
+    if not results:
+        return "該当する技術が見つかりませんでした。"
+
+    output = f"\n検索結果: {len(results)}件の技術が見つかりました\n"
+    output += "=" * 80 + "\n\n"
+
+    for i, result in enumerate(results, 1):
+        output += f"【{i}】{result['tech_name']}\n"
+        output += f"URL: {result['url']}\n"
+        output += f"\n【概要】\n{result['abstract']}\n"
+
+        if show_details:
+            if result.get('innovation'):
+                output += f"\n【新規性・期待される効果】\n{result['innovation']}\n"
+            if result.get('conditions'):
+                output += f"\n【適用条件】\n{result['conditions']}\n"
+            if result.get('scope'):
+                output += f"\n【適用範囲】\n{result['scope']}\n"
+            if result.get('notes'):
+                output += f"\n【留意事項】\n{result['notes']}\n"
+
+        # 分類情報
+        categories = []
+        for j in range(1, 4):
+            cat = result.get(f'category{j}', '')
+            if cat:
+                categories.append(cat)
+        if categories:
+            output += f"\n【分類】{' > '.join(categories)}\n"
+
+        output += "\n" + "-" * 80 + "\n\n"
+
+    return output
+
+
+def pack_results_for_llm(
+    results: List[Dict[str, Any]],
+    token_budget: Optional[int] = None,
+    include_details: bool = False,
+    numbers: Optional[List[int]] = None
+) -> str:
+    """
+    検索結果をトークン予算内の密な形式に整形
+
+    - 結果には表示順の番号（#1, #2...）と登録番号を付け、フォローアップで参照できるようにする
+    - 直前の結果と同じ分類・評価は「同上」、他フィールドと重複するテキストは省略する
+    - 記入様式の見出しや「特になし」は除く
+    - 予算は件数で均等に割り当て、余った分は後続の結果に回す
+
+    Args:
+        results: 検索結果
+        token_budget: 全体の最大トークン数（省略時は件数に応じて決定）
+        include_details: 詳細フィールド（効果・条件・範囲・留意）も含めるか
+        numbers: 各結果の表示番号（一部の結果だけ渡す場合に元の番号を維持する）
+
+    Returns:
+        プロンプト用の文字列
+    """
+    if not results:
+        return "検索結果: 0件"
+
+    if token_budget is None:
+        per_result = DEFAULT_TOKENS_PER_RESULT_WITH_DETAILS if include_details else DEFAULT_TOKENS_PER_RESULT
+        token_budget = per_result * len(results)
+
+    header = f"検索結果{len(results)}件（#番号で参照）"
+    remaining = token_budget - count_tokens(header)
+    fields = SUMMARY_FIELDS + (DETAIL_FIELDS if include_details else [])
+
+    lines = [header]
+    seen_names = set()
+    previous_category = None
+    previous_evaluation = None
+
+    for i, result in enumerate(results, 1):
+        number = numbers[i - 1] if numbers else i
+        name = compact_text(result.get("tech_name", ""))
+        if name in seen_names:
+            # 同名の技術は重複として省略
+            continue
+        seen_names.add(name)
+
+        # 残り予算を残り件数で均等割り
+        per_result = remaining // (len(results) - i + 1)
+
+        # 分類は主分類（category1）のみ
+        category = compact_text(result.get("category1", ""))
+        meta = [f"#{number}", f"[{short_id(result)}]", name]
+        if category:
+            meta.append("分類:同上" if category == previous_category else f"分類:{category}")
+            previous_category = category
+        evaluation = compact_text(result.get("evaluation", ""))
+        if evaluation:
+            meta.append("評価:同上" if evaluation == previous_evaluation else f"評価:{evaluation}")
+            previous_evaluation = evaluation
+
+        head = " ".join(meta)
+        used = count_tokens(head)
+        block = [head]
+
+        # フィールドごとに残り予算を割り当てて切り詰める
+        texts = []
+        for label, key in fields:
+            text = compact_text(result.get(key, ""))
+            if not text or any(text in other for other in texts):
+                continue
+            texts.append(text)
+
+            field_budget = (per_result - used) // max(1, len(fields) - fields.index((label, key)))
+            if field_budget <= 4:
+                break
+            snippet = truncate_to_tokens(text, field_budget)
+            line = f" {label}:{snippet}"
+            used += count_tokens(line)
+            block.append(line)
+
+        lines.extend(block)
+        remaining -= used
+
+    return "\n".join(lines)
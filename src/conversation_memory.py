@@ -0,0 +1,156 @@
+"""
+トークン予算内に会話履歴を収めるためのモジュール
+"""
+from collections import deque
+from typing import List, Dict, Any, Optional, Callable
+from src.token_counter import count_tokens, MESSAGE_OVERHEAD_TOKENS
+
+
+class ConversationMemory:
+    """
+    会話履歴をトークン予算で管理するクラス
+    - 件数上限付きのリングバッファで保持
+    - 最新以外の検索結果ブロックは短い参照に置き換える
+    - 予算を超えた古いターンはまとめて削除（要約関数があれば要約に畳み込む）
+    - 削除・要約はadd()（またはcompact()）で行い、messages()は読み取りのみ
+      （プロンプトの組み立てで要約のLLM呼び出しが隠れて発生しないようにする）
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 4000,
+        max_entries: int = 50,
+        summarizer: Optional[Callable[[str, List[Dict[str, str]]], str]] = None,
+        trim_ratio: float = 0.7
+    ):
+        """
+        初期化
+
+        Args:
+            token_budget: 履歴全体（要約を含む）に使う最大トークン数
+            max_entries: 保持する最大メッセージ数
+            summarizer: (これまでの要約, 削除するメッセージ) → 新しい要約 を返す関数
+            trim_ratio: 予算超過時に予算の何割まで削るか
+        """
+        self.token_budget = token_budget
+        self.max_entries = max_entries
+        self.summarizer = summarizer
+        self.trim_ratio = trim_ratio
+        self.summary = ""
+        self._entries: deque = deque()
+
+    def add(
+        self,
+        role: str,
+        content: str,
+        context: Optional[str] = None,
+        context_ref: Optional[str] = None
+    ):
+        """
+        メッセージを追加し、予算を超えていれば古いメッセージを削除・要約する
+
+        Args:
+            role: "user" または "assistant"
+            content: メッセージ本文
+            context: 本文の前に付ける検索結果ブロック
+            context_ref: 検索結果ブロックが古くなった時に代わりに使う短い参照
+        """
+        entry = {
+            "role": role,
+            "content": content,
+            "context": context,
+            "context_ref": context_ref,
+            "tokens": count_tokens(content),
+            "context_tokens": count_tokens(context or ""),
+            "context_ref_tokens": count_tokens(context_ref or "")
+        }
+        self._entries.append(entry)
+
+        if len(self._entries) > self.max_entries:
+            self._evict(len(self._entries) - self.max_entries)
+        self.compact()
+
+    def _evict(self, count: int):
+        """古いメッセージを削除（要約関数があれば要約に畳み込む）"""
+        evicted = [self._entries.popleft() for _ in range(count)]
+        if self.summarizer is not None and evicted:
+            self.summary = self.summarizer(
+                self.summary,
+                [self._render(entry, full_context=False) for entry in evicted]
+            )
+
+    @staticmethod
+    def _render(entry: Dict[str, Any], full_context: bool) -> Dict[str, str]:
+        """エントリをAPI送信用のメッセージに変換"""
+        block = entry["context"] if full_context else entry["context_ref"]
+        content = f"{block}\n\n{entry['content']}" if block else entry["content"]
+        return {"role": entry["role"], "content": content}
+
+    def _entry_tokens(self, entry: Dict[str, Any], full_context: bool) -> int:
+        """エントリの送信時トークン数"""
+        context_tokens = entry["context_tokens"] if full_context else entry["context_ref_tokens"]
+        return entry["tokens"] + context_tokens + MESSAGE_OVERHEAD_TOKENS
+
+    def _latest_context_index(self) -> int:
+        """検索結果ブロックを持つ最新エントリの位置（無ければ-1）"""
+        for i in range(len(self._entries) - 1, -1, -1):
+            if self._entries[i]["context"]:
+                return i
+        return -1
+
+    def compact(self):
+        """
+        トークン予算を超えていれば古いメッセージを削除（要約関数があれば要約に畳み込む）
+        add()のたびに呼ばれる。要約関数がLLMを呼ぶ場合はここでネットワーク呼び出しが発生する
+        """
+        latest = self._latest_context_index()
+        sizes = [
+            self._entry_tokens(entry, full_context=(i == latest))
+            for i, entry in enumerate(self._entries)
+        ]
+        summary_tokens = count_tokens(self.summary) + MESSAGE_OVERHEAD_TOKENS if self.summary else 0
+        total = summary_tokens + sum(sizes)
+
+        if total > self.token_budget:
+            # 毎ターン少しずつ削ると先頭が変わり続けてプロンプトキャッシュが効かないため、
+            # 予算を超えたら trim_ratio まで一度にまとめて削る（最新のメッセージは必ず残す）
+            target = self.token_budget * self.trim_ratio
+            count = 0
+            while count < len(sizes) - 1 and total > target:
+                total -= sizes[count]
+                count += 1
+            self._evict(count)
+
+    def messages(self) -> List[Dict[str, str]]:
+        """
+        送信用メッセージを取得（状態は変更しない、予算内への削減はadd()で済んでいる）
+
+        Returns:
+            {"role", "content"} のリスト（要約がある場合は先頭にsystemメッセージ）
+        """
+        latest = self._latest_context_index()
+        messages = [
+            self._render(entry, full_context=(i == latest))
+            for i, entry in enumerate(self._entries)
+        ]
+        if self.summary:
+            messages.insert(0, {"role": "system", "content": f"これまでの会話の要約:\n{self.summary}"})
+        return messages
+
+    def history(self) -> List[Dict[str, str]]:
+        """
+        検索結果ブロックを除いた会話履歴を取得（表示・記録用）
+
+        Returns:
+            {"role", "content"} のリスト
+        """
+        return [{"role": e["role"], "content": e["content"]} for e in self._entries]
+
+    def total_tokens(self) -> int:
+        """現在の送信用メッセージのトークン数"""
+        return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in self.messages())
+
+    def clear(self):
+        """履歴と要約を全削除"""
+        self._entries.clear()
+        self.summary = ""
@@ -4,7 +4,13 @@ NETISデータをExcelから読み込み、Azure AI Search用に整形するモ
 import pandas as pd
 from typing import List, Dict, Any
 import json
+import time
 from pathlib import Path
+from src.near_duplicate import find_near_duplicates
+from src.structured_logging import get_logger
+
+
+logger = get_logger(__name__)
 
 
 class NETISDataProcessor:
@@ -27,9 +33,12 @@ class NETISDataProcessor:
         Returns:
             pandas DataFrame
         """
-        print(f"Loading Excel file: {self.excel_path}")
+        start = time.perf_counter()
         self.df = pd.read_excel(self.excel_path)
-        print(f"Loaded {len(self.df)} records")
+        logger.info("Loaded Excel file", extra={
+            "path": str(self.excel_path), "records": len(self.df),
+            "duration_ms": round((time.perf_counter() - start) * 1000.0, 1)
+        })
         return self.df
 
     def clean_data(self) -> pd.DataFrame:
@@ -51,7 +60,7 @@ class NETISDataProcessor:
         # NaN値を空文字列に変換
         self.df = self.df.fillna('')
 
-        print("Data cleaned successfully")
+        logger.debug("Data cleaned", extra={"records": len(self.df)})
         return self.df
 
     def convert_to_search_documents(self) -> List[Dict[str, Any]]:
@@ -65,6 +74,7 @@ class NETISDataProcessor:
             raise ValueError("データが読み込まれていません。")
 
         documents = []
+        start = time.perf_counter()
 
         for idx, row in self.df.iterrows():
             # 一意のIDを生成（行番号ベース）
@@ -102,7 +112,35 @@ class NETISDataProcessor:
 
             documents.append(document)
 
-        print(f"Converted {len(documents)} documents")
+        logger.info("Converted documents", extra={
+            "documents": len(documents), "duration_ms": round((time.perf_counter() - start) * 1000.0, 1)
+        })
+        return documents
+
+    def assign_clusters(
+        self,
+        documents: List[Dict[str, Any]],
+        threshold: float = 0.8
+    ) -> List[Dict[str, Any]]:
+        """
+        ほぼ同一のドキュメント（再登録・型違いなど）をMinHash/LSHでクラスタリングし、cluster_idを付与
+        - cluster_idはクラスタ内で最初のドキュメントのID（代表はid == cluster_idのもの）
+
+        Args:
+            documents: 検索ドキュメントのリスト
+            threshold: 同一クラスタとみなす推定Jaccard類似度（searchable_textの文字5-gram）
+
+        Returns:
+            cluster_idを付与したドキュメントのリスト
+        """
+        labels = find_near_duplicates([doc['searchable_text'] for doc in documents], threshold=threshold)
+        for doc, label in zip(documents, labels):
+            doc['cluster_id'] = documents[label]['id']
+
+        num_clusters = len(set(labels))
+        logger.info("Clustered near-duplicate documents", extra={
+            "near_duplicates": len(documents) - num_clusters, "clusters": num_clusters, "threshold": threshold
+        })
         return documents
 
     def save_to_json(self, documents: List[Dict[str, Any]], output_path: str):
@@ -119,14 +157,19 @@ class NETISDataProcessor:
         with open(output_path, 'w', encoding='utf-8') as f:
             json.dump(documents, f, ensure_ascii=False, indent=2)
 
-        print(f"Saved documents to: {output_path}")
+        logger.info("Saved documents", extra={"path": str(output_path), "documents": len(documents)})
 
-    def process_all(self, output_json_path: str = None) -> List[Dict[str, Any]]:
+    def process_all(
+        self,
+        output_json_path: str = None,
+        near_duplicate_threshold: float = 0.8
+    ) -> List[Dict[str, Any]]:
         """
-        全処理を実行（読み込み → クリーンアップ → 変換）
+        全処理を実行（読み込み → クリーンアップ → 変換 → 重複クラスタリング）
 
         Args:
             output_json_path: JSON出力パス（オプション）
+            near_duplicate_threshold: 同一クラスタとみなす推定Jaccard類似度
 
         Returns:
             検索ドキュメントのリスト
@@ -134,6 +177,7 @@ class NETISDataProcessor:
         self.load_excel()
         self.clean_data()
         documents = self.convert_to_search_documents()
+        self.assign_clusters(documents, threshold=near_duplicate_threshold)
 
         if output_json_path:
             self.save_to_json(documents, output_json_path)
@@ -142,9 +186,10 @@ class NETISDataProcessor:
 
 
 if __name__ == "__main__":
-    # テスト実行
-    processor = NETISDataProcessor("../netisデータ.xlsx")
-    documents = processor.process_all("../data/processed/netis_documents.json")
+    # テスト実行（リポジトリのルートで python -m src.data_processor として実行）
+    root = Path(__file__).parent.parent
+    processor = NETISDataProcessor(str(root / "netisデータ.xlsx"))
+    documents = processor.process_all(str(root / "data" / "processed" / "netis_documents.json"))
 
     # サンプル表示
     print("\n=== Sample Document ===")
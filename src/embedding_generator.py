@@ -2,14 +2,45 @@
 Azure OpenAIを使用してテキストのエンベディングを生成するモジュール
 """
 from openai import AzureOpenAI
-from typing import List
+from typing import List, Dict, Tuple
+import numpy as np
 import os
 from dotenv import load_dotenv
 import time
+from src.token_counter import count_tokens, split_by_tokens
+from src.embedding_provider import EmbeddingProvider
+from src import tracing
+from src.structured_logging import get_logger
 
 
-class EmbeddingGenerator:
-    """エンベディング生成クラス"""
+# エンベディングモデルの1入力あたりの上限トークン数（text-embedding-3系）
+EMBEDDING_MAX_INPUT_TOKENS = 8191
+
+logger = get_logger(__name__)
+
+
+def create_embedding_generator(provider: str = None) -> EmbeddingProvider:
+    """
+    環境変数EMBEDDING_PROVIDERに応じたエンベディング生成クラスを作成
+
+    Args:
+        provider: "azure"（Azure OpenAI、既定）または "local"（オフライン用のハッシュ特徴）
+
+    Returns:
+        EmbeddingProvider
+    """
+    load_dotenv()
+    provider = provider or os.getenv('EMBEDDING_PROVIDER', 'azure')
+    if provider == 'local':
+        from src.local_embedding import LocalEmbeddingGenerator
+        return LocalEmbeddingGenerator()
+    if provider == 'azure':
+        return EmbeddingGenerator()
+    raise ValueError(f"Unknown embedding provider: {provider}")
+
+
+class EmbeddingGenerator(EmbeddingProvider):
+    """エンベディング生成クラス（Azure OpenAI）"""
 
     def __init__(
         self,
@@ -43,6 +74,19 @@ class EmbeddingGenerator:
             azure_endpoint=self.endpoint
         )
 
+        # 入力上限とバッチあたりのトークン上限
+        self.max_input_tokens = int(os.getenv('EMBEDDING_MAX_INPUT_TOKENS', str(EMBEDDING_MAX_INPUT_TOKENS)))
+        self.max_batch_tokens = int(os.getenv('EMBEDDING_MAX_BATCH_TOKENS', '100000'))
+
+        # 次元数を縮めたエンベディング（text-embedding-3系のdimensions指定、未設定ならモデルの既定）
+        self.requested_dimensions = int(os.getenv('EMBEDDING_DIMENSIONS', '0')) or None
+        if self.requested_dimensions:
+            self.dimensions = self.requested_dimensions
+
+        # トークン使用量の記録
+        self.total_tokens = 0
+        self.split_texts = 0
+
     def generate_embedding(self, text: str) -> List[float]:
         """
         単一テキストのエンベディングを生成
@@ -55,60 +99,177 @@ class EmbeddingGenerator:
         """
         if not text or not text.strip():
             # 空文字列の場合はゼロベクトルを返す
-            return [0.0] * 1536
+            return [0.0] * self.dimensions
 
-        response = self.client.embeddings.create(
-            input=text,
-            model=self.deployment_name
-        )
+        if count_tokens(text) > self.max_input_tokens:
+            # 入力上限を超える場合は窓に分割して1本にまとめる
+            return self.generate_embeddings([text])[0]
+
+        response = self._create(text)
 
         return response.data[0].embedding
 
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        複数テキスト（検索時のサブクエリなど少数）のエンベディングを1回のリクエストで生成
+
+        Args:
+            texts: エンベディング対象のテキストリスト
+
+        Returns:
+            textsと同じ順序のエンベディングベクトルのリスト
+        """
+        if not texts:
+            return []
+
+        inputs, owners, token_counts = self._split_long_texts(texts)
+        response = self._create(inputs)
+
+        # レスポンスの順序はindexで保証されているため並べ直す
+        vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        return self._combine(vectors, owners, token_counts, len(texts))
+
+    def _create(self, inputs):
+        """エンベディングAPIを呼び出す（次元数の指定があれば渡す）"""
+        with tracing.span("embedding.request", inputs=1 if isinstance(inputs, str) else len(inputs)) as span:
+            if self.requested_dimensions:
+                response = self.client.embeddings.create(
+                    input=inputs,
+                    model=self.deployment_name,
+                    dimensions=self.requested_dimensions
+                )
+            else:
+                response = self.client.embeddings.create(
+                    input=inputs,
+                    model=self.deployment_name
+                )
+            span.set(tokens=getattr(getattr(response, "usage", None), "total_tokens", None))
+            return response
+
+    def _split_long_texts(self, texts: List[str]) -> Tuple[List[str], List[int], List[int]]:
+        """
+        入力上限を超えるテキストをトークン単位の窓に分割（切り捨ては行わない）
+
+        Args:
+            texts: エンベディング対象のテキストリスト
+
+        Returns:
+            (APIに渡す入力, 各入力の元テキストの番号, 各入力のトークン数)
+        """
+        inputs, owners, token_counts = [], [], []
+        for i, text in enumerate(texts):
+            text = text if text and text.strip() else " "
+            tokens = count_tokens(text)
+            if tokens <= self.max_input_tokens:
+                windows = [(text, tokens)]
+            else:
+                windows = [(w, count_tokens(w)) for w in split_by_tokens(text, self.max_input_tokens)]
+                self.split_texts += 1
+            for window, window_tokens in windows:
+                inputs.append(window)
+                owners.append(i)
+                token_counts.append(max(window_tokens, 1))
+        return inputs, owners, token_counts
+
+    @staticmethod
+    def _combine(
+        vectors: List[List[float]],
+        owners: List[int],
+        token_counts: List[int],
+        num_texts: int
+    ) -> List[List[float]]:
+        """
+        窓に分割したテキストのベクトルをトークン数で重み付け平均して1本にまとめる（L2正規化）
+        """
+        combined: List[List[float]] = [None] * num_texts
+        if len(owners) == num_texts:
+            # 分割したテキストが無ければそのまま返す
+            for owner, vector in zip(owners, vectors):
+                combined[owner] = vector
+            return combined
+
+        groups: Dict[int, List[int]] = {}
+        for position, owner in enumerate(owners):
+            groups.setdefault(owner, []).append(position)
+        for owner, positions in groups.items():
+            if len(positions) == 1:
+                combined[owner] = vectors[positions[0]]
+                continue
+            matrix = np.asarray([vectors[p] for p in positions], dtype=np.float64)
+            weights = np.asarray([token_counts[p] for p in positions], dtype=np.float64)
+            mean = weights @ matrix / weights.sum()
+            combined[owner] = (mean / (np.linalg.norm(mean) or 1.0)).tolist()
+        return combined
+
     def generate_embeddings_batch(
         self,
         texts: List[str],
         batch_size: int = 16,
-        delay: float = 0.5
+        delay: float = 0.5,
+        max_batch_tokens: int = None
     ) -> List[List[float]]:
         """
         複数テキストのエンベディングをバッチ生成
 
+        入力上限（max_input_tokens）を超えるテキストは窓に分割して埋め込み、
+        トークン数で重み付け平均した1本のベクトルにする（APIエラーや暗黙の切り捨てを起こさない）。
+        バッチは件数とトークン数の両方の上限で区切る。
+
         Args:
             texts: エンベディング対象のテキストリスト
-            batch_size: バッチサイズ
+            batch_size: 1リクエストあたりの最大件数
             delay: バッチ間の待機時間（秒）
+            max_batch_tokens: 1リクエストあたりの最大トークン数（省略時はself.max_batch_tokens）
 
         Returns:
-            エンベディングベクトルのリスト
+            エンベディングベクトルのリスト（textsと同じ順序）
         """
-        embeddings = []
+        max_batch_tokens = max_batch_tokens or self.max_batch_tokens
         total = len(texts)
 
-        print(f"Generating embeddings for {total} texts...")
-
-        for i in range(0, total, batch_size):
-            batch = texts[i:i + batch_size]
-            batch_num = i // batch_size + 1
-            total_batches = (total + batch_size - 1) // batch_size
+        inputs, owners, token_counts = self._split_long_texts(texts)
+        if len(inputs) > total:
+            logger.info("Split long texts into windows", extra={
+                "extra_windows": len(inputs) - total, "max_input_tokens": self.max_input_tokens
+            })
 
-            print(f"Processing batch {batch_num}/{total_batches}...")
+        # 件数とトークン数の上限でバッチを区切る
+        batches = []
+        start = 0
+        while start < len(inputs):
+            end = start
+            batch_tokens = 0
+            while (end < len(inputs) and end - start < batch_size
+                   and (end == start or batch_tokens + token_counts[end] <= max_batch_tokens)):
+                batch_tokens += token_counts[end]
+                end += 1
+            batches.append((start, end, batch_tokens))
+            start = end
 
-            # 空文字列を除外
-            non_empty_texts = [t if t and t.strip() else " " for t in batch]
+        logger.info("Generating embeddings", extra={"texts": total, "batches": len(batches)})
+        run_start = time.perf_counter()
 
-            response = self.client.embeddings.create(
-                input=non_empty_texts,
-                model=self.deployment_name
-            )
+        vectors = []
+        for batch_num, (start, end, batch_tokens) in enumerate(batches, 1):
+            batch_start = time.perf_counter()
+            response = self._create(inputs[start:end])
+            logger.debug("Embedding batch done", extra={
+                "batch_id": batch_num, "batches": len(batches), "inputs": end - start,
+                "tokens": batch_tokens, "duration_ms": round((time.perf_counter() - batch_start) * 1000.0, 1)
+            })
 
-            batch_embeddings = [item.embedding for item in response.data]
-            embeddings.extend(batch_embeddings)
+            vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+            self.total_tokens += batch_tokens
 
             # レート制限対策
-            if i + batch_size < total:
+            if batch_num < len(batches):
                 time.sleep(delay)
 
-        print(f"Generated {len(embeddings)} embeddings")
+        embeddings = self._combine(vectors, owners, token_counts, total)
+        logger.info("Generated embeddings", extra={
+            "embeddings": len(embeddings), "tokens": sum(token_counts),
+            "duration_ms": round((time.perf_counter() - run_start) * 1000.0, 1)
+        })
         return embeddings
 
 
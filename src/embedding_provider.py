@@ -0,0 +1,33 @@
+"""
+エンベディング生成の共通インターフェース
+（Azure OpenAIのSDKに依存しないため、ローカル実装だけを使う環境でも読み込める）
+"""
+from abc import ABC, abstractmethod
+from typing import List
+
+
+class EmbeddingProvider(ABC):
+    """
+    エンベディング生成の共通インターフェース（EmbeddingGenerator / LocalEmbeddingGenerator）
+    generate_embeddings / generate_embeddings_batch を実装しないサブクラスは作成時にTypeErrorになる
+    """
+
+    dimensions = 1536
+
+    def generate_embedding(self, text: str) -> List[float]:
+        """単一テキストのエンベディングを生成"""
+        return self.generate_embeddings([text])[0]
+
+    @abstractmethod
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """複数テキストのエンベディングを1回で生成"""
+
+    @abstractmethod
+    def generate_embeddings_batch(
+        self,
+        texts: List[str],
+        batch_size: int = 16,
+        delay: float = 0.5,
+        max_batch_tokens: int = None
+    ) -> List[List[float]]:
+        """大量のテキストのエンベディングをバッチ生成"""
@@ -0,0 +1,112 @@
+"""
+正解付きクエリ集（ゴールデンセット）で検索結果の関連度を評価するモジュール
+"""
+from typing import List, Dict, Any
+import json
+import math
+
+
+def load_golden_queries(path: str) -> List[Dict[str, Any]]:
+    """
+    ゴールデンセット（JSON Lines）を読み込む
+
+    1行1クエリで {"query": "...", "relevant": {"netis_0000": 2, ...}} の形式。
+    relevantはIDのリストでもよい（その場合は関連度1として扱う）。
+
+    Args:
+        path: ファイルパス
+
+    Returns:
+        {"query", "relevant"（ID → 関連度）} のリスト
+    """
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            item = json.loads(line)
+            relevant = item.get("relevant", {})
+            if isinstance(relevant, list):
+                relevant = {doc_id: 1 for doc_id in relevant}
+            queries.append({"query": item["query"], "relevant": relevant})
+    return queries
+
+
+def recall_at_k(ranked_ids: List[str], relevant: Dict[str, int], k: int) -> float:
+    """
+    上位k件に含まれる正解の割合（正解がk件より多い場合はkで割る）
+
+    関連度0のIDは正解に数えない（分母にも含めない）。
+
+    Args:
+        ranked_ids: 検索結果のID（順位順）
+        relevant: 正解のID → 関連度
+        k: 評価する件数
+
+    Returns:
+        0.0〜1.0
+    """
+    positives = sum(1 for grade in relevant.values() if grade > 0)
+    if positives == 0:
+        return 0.0
+    hits = sum(1 for doc_id in ranked_ids[:k] if relevant.get(doc_id, 0) > 0)
+    return hits / min(positives, k)
+
+
+def reciprocal_rank(ranked_ids: List[str], relevant: Dict[str, int], k: int) -> float:
+    """
+    最初の正解の順位の逆数（上位k件に無ければ0）
+
+    Args:
+        ranked_ids: 検索結果のID（順位順）
+        relevant: 正解のID → 関連度
+        k: 評価する件数
+
+    Returns:
+        0.0〜1.0
+    """
+    for rank, doc_id in enumerate(ranked_ids[:k], 1):
+        if relevant.get(doc_id, 0) > 0:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at_k(ranked_ids: List[str], relevant: Dict[str, int], k: int) -> float:
+    """
+    関連度の段階（gain = 2^関連度 - 1）を使ったnDCG@k
+
+    Args:
+        ranked_ids: 検索結果のID（順位順）
+        relevant: 正解のID → 関連度
+        k: 評価する件数
+
+    Returns:
+        0.0〜1.0
+    """
+    dcg = sum(
+        (2 ** relevant.get(doc_id, 0) - 1) / math.log2(rank + 1)
+        for rank, doc_id in enumerate(ranked_ids[:k], 1)
+    )
+    ideal = sorted(relevant.values(), reverse=True)[:k]
+    idcg = sum((2 ** grade - 1) / math.log2(rank + 1) for rank, grade in enumerate(ideal, 1))
+    return dcg / idcg if idcg > 0 else 0.0
+
+
+def evaluate_ranking(ranked_ids: List[str], relevant: Dict[str, int], k: int = 10) -> Dict[str, float]:
+    """
+    1クエリの検索結果をまとめて評価
+
+    Args:
+        ranked_ids: 検索結果のID（順位順）
+        relevant: 正解のID → 関連度
+        k: 評価する件数
+
+    Returns:
+        {"recall", "mrr", "ndcg"}
+    """
+    return {
+        "recall": recall_at_k(ranked_ids, relevant, k),
+        "mrr": reciprocal_rank(ranked_ids, relevant, k),
+        "ndcg": ndcg_at_k(ranked_ids, relevant, k)
+    }
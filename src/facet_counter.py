@@ -0,0 +1,145 @@
+"""
+検索結果に対するファセット（分類ごとの件数）をローカルで集計するモジュール
+
+件数は常に「返した検索結果（上位top件）の中での件数」とする。
+Azureのfacets（一致した全件の件数）は使わないため、バックエンドによらず意味が変わらない。
+"""
+from collections import Counter
+import numpy as np
+from typing import List, Dict, Any, Iterable, Optional
+import json
+from pathlib import Path
+
+
+# インデックスでfacetableに設定しているフィールド
+FACET_FIELDS = [
+    "category1", "category2", "category3",
+    "category4", "category5", "evaluation"
+]
+
+
+class FacetCounter:
+    """分類コードを事前計算し、ファセット件数をベクトル化して集計するクラス"""
+
+    def __init__(self, documents: List[Dict[str, Any]], fields: List[str] = None):
+        """
+        初期化
+
+        Args:
+            documents: 検索ドキュメントのリスト（data_processorの出力形式）
+            fields: 集計対象フィールド（省略時はFACET_FIELDS）
+        """
+        self.fields = fields or FACET_FIELDS
+        self.id_to_row = {doc["id"]: row for row, doc in enumerate(documents)}
+
+        # フィールドごとに値の辞書とコード配列を作成
+        self.vocab: Dict[str, List[str]] = {}
+        self.codes: Dict[str, np.ndarray] = {}
+        for field in self.fields:
+            values, codes = np.unique(
+                np.array([str(doc.get(field, "")) for doc in documents], dtype=object),
+                return_inverse=True
+            )
+            self.vocab[field] = list(values)
+            self.codes[field] = codes.astype(np.int32)
+
+    @classmethod
+    def from_json(cls, json_path: str, fields: List[str] = None) -> "FacetCounter":
+        """
+        data_processorが出力したJSONから生成
+
+        Args:
+            json_path: 検索ドキュメントJSONのパス
+            fields: 集計対象フィールド
+
+        Returns:
+            FacetCounter
+        """
+        with open(Path(json_path), "r", encoding="utf-8") as f:
+            documents = json.load(f)
+        return cls(documents, fields)
+
+    def rows_for(self, doc_ids: Iterable[str]) -> np.ndarray:
+        """
+        ドキュメントIDを行番号の配列に変換（未知のIDは無視）
+
+        Args:
+            doc_ids: ドキュメントIDのリスト
+
+        Returns:
+            行番号の配列
+        """
+        rows = [self.id_to_row[doc_id] for doc_id in doc_ids if doc_id in self.id_to_row]
+        return np.asarray(rows, dtype=np.int64)
+
+    def count(
+        self,
+        doc_ids: Iterable[str],
+        fields: Optional[List[str]] = None,
+        top: int = 10
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        指定ドキュメント集合のファセット件数を集計
+
+        Args:
+            doc_ids: 集計対象のドキュメントID（検索結果）
+            fields: 集計対象フィールド（省略時は全フィールド）
+            top: フィールドごとに返す値の最大数
+
+        Returns:
+            Azure AI Searchのget_facets()と同じ形式の辞書
+            {field: [{"value": 値, "count": 件数}, ...]}
+        """
+        rows = self.rows_for(doc_ids)
+        facets = {}
+
+        for field in fields or self.fields:
+            if field not in self.codes:
+                continue
+            vocab = self.vocab[field]
+            counts = np.bincount(self.codes[field][rows], minlength=len(vocab))
+
+            # 件数の降順（同数は値の昇順）で上位を取り出す
+            order = np.lexsort((np.arange(len(vocab)), -counts))
+            facets[field] = [
+                {"value": vocab[i], "count": int(counts[i])}
+                for i in order
+                if counts[i] > 0 and vocab[i] != ""
+            ][:top]
+
+        return facets
+
+
+def count_result_facets(
+    results: List[Dict[str, Any]],
+    fields: List[str],
+    top: int = 10
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    検索結果の各フィールドの値から直接ファセット件数を集計（FacetCounterが無い場合の代替）
+
+    Args:
+        results: 検索結果（フィールド値を含む辞書のリスト）
+        fields: 集計対象フィールド（結果に含まれないフィールドは空）
+        top: フィールドごとに返す値の最大数
+
+    Returns:
+        FacetCounter.count()と同じ形式の辞書
+    """
+    facets = {}
+    for field in fields:
+        counts = Counter(str(r.get(field, "") or "") for r in results)
+        counts.pop("", None)
+        # 件数の降順（同数は値の昇順）
+        facets[field] = [
+            {"value": value, "count": count}
+            for value, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        ][:top]
+    return facets
+
+
+if __name__ == "__main__":
+    # テスト実行
+    counter = FacetCounter.from_json("../data/processed/netis_documents.json")
+    sample_ids = list(counter.id_to_row.keys())[:50]
+    print(json.dumps(counter.count(sample_ids, top=5), ensure_ascii=False, indent=2))
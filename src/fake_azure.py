@@ -0,0 +1,659 @@
+"""
+Azure AI SearchとAzure OpenAIのREST APIのうち本プロジェクトで使う部分を再現するローカルサーバー
+（負荷試験・ベンチマーク用）
+
+対応するAPI:
+    Azure AI Search
+        PUT    /indexes('{name}') または /indexes/{name}           インデックス作成・更新
+        DELETE /indexes('{name}') または /indexes/{name}           インデックス削除
+        GET    /indexes('{name}')/docs/$count                     ドキュメント数
+        POST   /indexes('{name}')/docs/search.index               ドキュメント投入（/docs/index も可）
+        POST   /indexes('{name}')/docs/search.post.search         検索（/docs/search も可、ベクトル・ファセット対応）
+        GET    /indexes('{name}')/docs('{key}')                   キー指定の取得
+    Azure OpenAI
+        POST   /openai/deployments/{name}/embeddings              エンベディング（LocalEmbeddingGenerator）
+        POST   /openai/deployments/{name}/chat/completions        チャット（stream・tool呼び出し対応）
+    管理用
+        GET    /_admin/stats                                      リクエスト数・スロットリング数など
+        POST   /_admin/config                                     遅延・スロットリング・障害注入の設定変更
+
+使用方法:
+    python -m src.fake_azure [--port 8765] [--latency-ms 50] [--throttle-rate 0.05] [--failure-rate 0.01]
+
+    AZURE_SEARCH_ENDPOINT=http://127.0.0.1:8765
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8765
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Optional, Tuple
+from dataclasses import dataclass, asdict, fields
+from urllib.parse import urlparse, parse_qs, unquote
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from src.local_embedding import LocalEmbeddingGenerator
+from src.token_counter import count_tokens, count_message_tokens
+
+
+@dataclass
+class FakeServiceConfig:
+    """遅延・スロットリング・障害注入の設定"""
+
+    latency_ms: float = 0.0          # 全リクエストに加える固定の遅延
+    jitter_ms: float = 0.0           # 遅延に加える一様乱数の幅
+    throttle_rate: float = 0.0       # 429を返す確率
+    retry_after: float = 1.0         # 429のretry-afterヘッダ（秒）
+    failure_rate: float = 0.0        # 503を返す確率
+    stream_chunk_ms: float = 0.0     # ストリーミング応答のチャンク間隔
+    seed: int = 0                    # 乱数シード（同じ設定なら同じ順序で障害が起きる）
+
+
+# 検索結果のスコアを統合するReciprocal Rank Fusionの定数（Azureのハイブリッド検索と同じ方式）
+_RRF_K = 60
+
+_INDEX_PATH_RE = re.compile(r"^/indexes(?:\('([^']+)'\)|/([^/('\s]+))(/.*)?$")
+_DOC_KEY_RE = re.compile(r"^/docs(?:\('([^']+)'\)|/([^/]+))$")
+_DEPLOYMENT_PATH_RE = re.compile(r"^/openai/deployments/([^/]+)/(embeddings|chat/completions)$")
+_EQ_FILTER_RE = re.compile(r"^(\w+)\s+eq\s+'((?:[^']|'')*)'$")
+_SEARCH_IN_RE = re.compile(r"^search\.in\((\w+),\s*'([^']*)'(?:,\s*'([^']*)')?\)$")
+
+
+class FakeServiceError(Exception):
+    """HTTPステータス付きのエラー"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class _FakeIndex:
+    """インメモリのインデックス（ドキュメントとベクトル行列を保持）"""
+
+    def __init__(self, definition: Dict[str, Any]):
+        self.definition = definition
+        self.fields = {f["name"]: f for f in definition.get("fields", [])}
+        self.key_field = next((f["name"] for f in definition.get("fields", []) if f.get("key")), "id")
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self._matrices: Dict[str, Tuple[List[str], np.ndarray]] = {}
+
+    def searchable_fields(self) -> List[str]:
+        """全文検索の対象フィールド（文字列でsearchable）"""
+        return [
+            name for name, f in self.fields.items()
+            if f.get("searchable") and f.get("type") == "Edm.String"
+        ]
+
+    def upsert(self, actions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """ドキュメントの投入・削除"""
+        results = []
+        for action in actions:
+            doc = {k: v for k, v in action.items() if k != "@search.action"}
+            key = str(doc.get(self.key_field, ""))
+            kind = action.get("@search.action", "upload")
+            if kind == "delete":
+                self.documents.pop(key, None)
+            elif kind in ("merge", "mergeOrUpload") and key in self.documents:
+                self.documents[key].update(doc)
+            else:
+                self.documents[key] = doc
+            results.append({"key": key, "status": True, "errorMessage": None, "statusCode": 200 if kind == "delete" else 201})
+        self._matrices.clear()
+        return results
+
+    def vector_matrix(self, field: str) -> Tuple[List[str], np.ndarray]:
+        """ベクトルフィールドの正規化済み行列（投入後に初回参照したときに作成）"""
+        if field not in self._matrices:
+            keys = [key for key, doc in self.documents.items() if doc.get(field)]
+            if keys:
+                matrix = np.asarray([self.documents[key][field] for key in keys], dtype=np.float32)
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                matrix = matrix / np.where(norms > 0, norms, 1.0)
+            else:
+                matrix = np.zeros((0, 0), dtype=np.float32)
+            self._matrices[field] = (keys, matrix)
+        return self._matrices[field]
+
+
+def _parse_filter(expression: Optional[str]):
+    """ODataフィルタ（eq / search.in をandで結合したもの）を判定関数に変換"""
+    if not expression:
+        return lambda doc: True
+
+    conditions = []
+    for clause in re.split(r"\s+and\s+", expression.strip()):
+        clause = clause.strip()
+        if clause.startswith("(") and clause.endswith(")"):
+            clause = clause[1:-1].strip()
+        match = _EQ_FILTER_RE.match(clause)
+        if match:
+            field, value = match.group(1), match.group(2).replace("''", "'")
+            conditions.append(lambda doc, f=field, v=value: str(doc.get(f, "")) == v)
+            continue
+        match = _SEARCH_IN_RE.match(clause)
+        if match:
+            field, values, delimiter = match.group(1), match.group(2), match.group(3)
+            # 区切り文字の省略時は空白とカンマ（Azureと同じ）
+            parts = values.split(delimiter) if delimiter else re.split(r"[\s,]+", values)
+            allowed = {v.strip() for v in parts if v.strip()}
+            conditions.append(lambda doc, f=field, a=allowed: str(doc.get(f, "")) in a)
+            continue
+        raise FakeServiceError(400, f"Unsupported filter clause: {clause}")
+
+    return lambda doc: all(condition(doc) for condition in conditions)
+
+
+def _query_terms(text: str) -> List[str]:
+    """全文検索の語（空白区切り、日本語は2文字ずつ）"""
+    terms = []
+    for word in (text or "").split():
+        if len(word) <= 2 or word.isascii():
+            terms.append(word.lower())
+        else:
+            terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return terms
+
+
+class FakeAzureState:
+    """サーバー全体の状態（インデックス・設定・統計）"""
+
+    def __init__(self, config: FakeServiceConfig):
+        self.config = config
+        self.indexes: Dict[str, _FakeIndex] = {}
+        self.embedder = LocalEmbeddingGenerator()
+        self.lock = threading.Lock()
+        self.rng = random.Random(config.seed)
+        self.stats = {"requests": 0, "throttled": 0, "failed": 0, "by_route": {}}
+
+    def configure(self, updates: Dict[str, Any]):
+        """設定を部分更新（seedを変えた場合は乱数列も作り直す）"""
+        names = {f.name for f in fields(FakeServiceConfig)}
+        with self.lock:
+            for key, value in updates.items():
+                if key in names:
+                    setattr(self.config, key, type(getattr(self.config, key))(value))
+            if "seed" in updates:
+                self.rng = random.Random(self.config.seed)
+
+    def admit(self, route: str) -> Tuple[Optional[int], float]:
+        """
+        リクエストの受付判定
+
+        Returns:
+            (返すべきエラーステータス（正常ならNone）, 加える遅延秒)
+        """
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["by_route"][route] = self.stats["by_route"].get(route, 0) + 1
+            delay = (self.config.latency_ms + self.rng.random() * self.config.jitter_ms) / 1000.0
+            roll = self.rng.random()
+            if roll < self.config.throttle_rate:
+                self.stats["throttled"] += 1
+                return 429, delay
+            if roll < self.config.throttle_rate + self.config.failure_rate:
+                self.stats["failed"] += 1
+                return 503, delay
+            return None, delay
+
+    # ---- Azure AI Search ----
+
+    def get_index(self, name: str) -> _FakeIndex:
+        index = self.indexes.get(name)
+        if index is None:
+            raise FakeServiceError(404, f"The index '{name}' was not found.")
+        return index
+
+    def search(self, index: _FakeIndex, body: Dict[str, Any]) -> Dict[str, Any]:
+        """全文検索とベクトル検索をRRFで統合（Azureのハイブリッド検索を簡略化）"""
+        matches = _parse_filter(body.get("filter"))
+        candidates = {key: doc for key, doc in index.documents.items() if matches(doc)}
+
+        rankings: List[List[str]] = []
+        search_text = body.get("search") or "*"
+        if search_text.strip() != "*":
+            terms = _query_terms(search_text)
+            fields_to_search = index.searchable_fields()
+            scored = []
+            for key, doc in candidates.items():
+                text = " ".join(str(doc.get(f, "")) for f in fields_to_search).lower()
+                score = sum(1 for term in terms if term in text)
+                if score:
+                    scored.append((score, key))
+            scored.sort(key=lambda item: -item[0])
+            rankings.append([key for _, key in scored])
+
+        for vector_query in body.get("vectorQueries") or []:
+            field = vector_query.get("fields", "")
+            keys, matrix = index.vector_matrix(field)
+            if not keys:
+                rankings.append([])
+                continue
+            query = np.asarray(vector_query.get("vector") or [], dtype=np.float32)
+            sims = matrix @ (query / (np.linalg.norm(query) or 1.0))
+            order = np.argsort(-sims)
+            k = int(vector_query.get("k") or vector_query.get("kNearestNeighborsCount") or 50)
+            rankings.append([keys[i] for i in order if keys[i] in candidates][:k])
+
+        if rankings:
+            scores: Dict[str, float] = {}
+            for ranking in rankings:
+                for rank, key in enumerate(ranking, 1):
+                    scores[key] = scores.get(key, 0.0) + 1.0 / (_RRF_K + rank)
+            ranked = sorted(scores, key=lambda key: -scores[key])
+        else:
+            scores = {key: 1.0 for key in candidates}
+            ranked = list(candidates)
+
+        response: Dict[str, Any] = {}
+        if body.get("count"):
+            response["@odata.count"] = len(ranked)
+
+        facet_specs = body.get("facets") or []
+        if facet_specs:
+            response["@search.facets"] = {}
+            for spec in facet_specs:
+                field, *options = spec.split(",")
+                limit = 10
+                for option in options:
+                    if option.startswith("count:"):
+                        limit = int(option.split(":", 1)[1])
+                counts: Dict[str, int] = {}
+                for key in ranked:
+                    value = candidates[key].get(field)
+                    counts[value] = counts.get(value, 0) + 1
+                response["@search.facets"][field] = [
+                    {"value": value, "count": count}
+                    for value, count in sorted(counts.items(), key=lambda item: -item[1])[:limit]
+                ]
+
+        skip = int(body.get("skip") or 0)
+        top = int(body.get("top") or 50)
+        select = body.get("select")
+        selected = [f.strip() for f in select.split(",")] if select else None
+        value = []
+        for key in ranked[skip:skip + top]:
+            doc = candidates[key]
+            item = {f: doc.get(f) for f in selected} if selected else dict(doc)
+            item["@search.score"] = scores[key]
+            value.append(item)
+        response["value"] = value
+        return response
+
+    # ---- Azure OpenAI ----
+
+    def embeddings(self, deployment: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        inputs = body.get("input")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        vectors = self.embedder.generate_embeddings(inputs or [])
+        dimensions = body.get("dimensions")
+        if dimensions:
+            # text-embedding-3系と同じく先頭の次元で切り詰めて正規化
+            matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)[:, :int(dimensions)]
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            vectors = (matrix / np.where(norms > 0, norms, 1.0)).tolist()
+        tokens = sum(count_tokens(text) for text in inputs or [])
+        return {
+            "object": "list",
+            "model": deployment,
+            "data": [
+                {"object": "embedding", "index": i, "embedding": vector}
+                for i, vector in enumerate(vectors)
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        }
+
+    def chat_reply(self, body: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        決定的な応答を作成
+
+        ツール定義があり最後のメッセージがユーザーの発話ならsearchツールを呼び、
+        それ以外はユーザーの発話を引用した定型文を返す。
+        """
+        messages = body.get("messages") or []
+        last = messages[-1] if messages else {}
+        user_text = next(
+            (m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), ""
+        )
+        tool_names = [t.get("function", {}).get("name") for t in body.get("tools") or []]
+        if "search" in tool_names and last.get("role") == "user" and body.get("tool_choice") != "none":
+            return "", [{
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": "search", "arguments": json.dumps({"query": user_text[:100]}, ensure_ascii=False)}
+            }]
+        snippet = user_text.strip().splitlines()[0][:60] if user_text.strip() else ""
+        return f"（ローカル応答）「{snippet}」について、検索結果の#1から順にご確認ください。", []
+
+    def chat_usage(self, body: Dict[str, Any], content: str) -> Dict[str, Any]:
+        prompt_tokens = count_message_tokens(body.get("messages") or [])
+        completion_tokens = count_tokens(content)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0}
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """リクエストをFakeAzureStateに振り分けるハンドラ"""
+
+    state: FakeAzureState = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # 負荷試験中のアクセスログは出さない
+        pass
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length).decode("utf-8"))
+        except ValueError:
+            raise FakeServiceError(400, "Invalid JSON body")
+
+    def _send(self, status: int, payload: Any = None, content_type: str = "application/json",
+              headers: Dict[str, str] = None):
+        if payload is None:
+            body = b""
+        elif isinstance(payload, (bytes, str)):
+            body = payload.encode("utf-8") if isinstance(payload, str) else payload
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("x-ms-request-id", uuid.uuid4().hex)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str, headers: Dict[str, str] = None):
+        self._send(status, {"error": {"code": str(status), "message": message}}, headers=headers)
+
+    def _handle(self, method: str):
+        parsed = urlparse(self.path)
+        path = unquote(parsed.path)
+        query = parse_qs(parsed.query)
+        try:
+            body = self._read_json() if method in ("POST", "PUT") else {}
+
+            if path.startswith("/_admin/"):
+                return self._admin(method, path, body)
+
+            route = self._route_name(method, path)
+            status, delay = self.state.admit(route)
+            if delay:
+                time.sleep(delay)
+            if status == 429:
+                retry_after = self.state.config.retry_after
+                return self._send_error(429, "Rate limit exceeded (injected)", headers={
+                    "Retry-After": f"{retry_after:g}",
+                    "retry-after-ms": str(int(retry_after * 1000))
+                })
+            if status == 503:
+                return self._send_error(503, "Service unavailable (injected)")
+
+            match = _DEPLOYMENT_PATH_RE.match(path)
+            if match and method == "POST":
+                return self._openai(match.group(1), match.group(2), body)
+
+            match = _INDEX_PATH_RE.match(path)
+            if match:
+                return self._search_service(method, match.group(1) or match.group(2), match.group(3) or "", body, query)
+
+            raise FakeServiceError(404, f"Unknown path: {path}")
+        except FakeServiceError as e:
+            self._send_error(e.status, str(e))
+        except Exception as e:  # 予期しない例外も500で返してサーバーは止めない
+            self._send_error(500, f"{type(e).__name__}: {e}")
+
+    @staticmethod
+    def _route_name(method: str, path: str) -> str:
+        """統計用のルート名（インデックス名・キーを除く）"""
+        match = _DEPLOYMENT_PATH_RE.match(path)
+        if match:
+            return f"{method} openai/{match.group(2)}"
+        match = _INDEX_PATH_RE.match(path)
+        if match:
+            rest = re.sub(r"\('[^']*'\)", "", match.group(3) or "")
+            return f"{method} indexes{rest}"
+        return f"{method} {path}"
+
+    def _admin(self, method: str, path: str, body: Dict[str, Any]):
+        if path == "/_admin/stats" and method == "GET":
+            with self.state.lock:
+                stats = json.loads(json.dumps(self.state.stats))
+            stats["indexes"] = {name: len(index.documents) for name, index in self.state.indexes.items()}
+            return self._send(200, stats)
+        if path == "/_admin/config" and method in ("POST", "PUT"):
+            self.state.configure(body)
+            return self._send(200, asdict(self.state.config))
+        if path == "/_admin/config" and method == "GET":
+            return self._send(200, asdict(self.state.config))
+        raise FakeServiceError(404, f"Unknown admin path: {path}")
+
+    def _search_service(self, method: str, name: str, rest: str, body: Dict[str, Any], query: Dict[str, List[str]]):
+        state = self.state
+        if rest == "":
+            if method == "PUT":
+                definition = dict(body, name=name)
+                with state.lock:
+                    created = name not in state.indexes
+                    existing = state.indexes.get(name)
+                    state.indexes[name] = _FakeIndex(definition)
+                    if existing is not None:
+                        state.indexes[name].documents = existing.documents
+                return self._send(201 if created else 200, definition)
+            if method == "DELETE":
+                with state.lock:
+                    if state.indexes.pop(name, None) is None:
+                        raise FakeServiceError(404, f"The index '{name}' was not found.")
+                return self._send(204)
+            if method == "GET":
+                return self._send(200, state.get_index(name).definition)
+
+        index = state.get_index(name)
+        if rest == "/docs/$count" and method == "GET":
+            return self._send(200, str(len(index.documents)), content_type="text/plain")
+        if rest in ("/docs/search.index", "/docs/index") and method == "POST":
+            with state.lock:
+                results = index.upsert(body.get("value") or [])
+            return self._send(200, {"value": results})
+        if rest in ("/docs/search.post.search", "/docs/search") and method == "POST":
+            with state.lock:
+                response = state.search(index, body)
+            return self._send(200, response)
+        if rest == "/docs" and method == "GET":
+            # GET形式の検索（search / $filter / $top / $select）
+            body = {
+                "search": query.get("search", ["*"])[0],
+                "filter": query.get("$filter", [None])[0],
+                "top": query.get("$top", [50])[0],
+                "select": query.get("$select", [None])[0],
+            }
+            with state.lock:
+                response = state.search(index, body)
+            return self._send(200, response)
+
+        match = _DOC_KEY_RE.match(rest)
+        if match and method == "GET":
+            key = match.group(1) or match.group(2)
+            doc = index.documents.get(key)
+            if doc is None:
+                raise FakeServiceError(404, f"Document '{key}' not found.")
+            select = query.get("$select", [None])[0]
+            if select:
+                doc = {f.strip(): doc.get(f.strip()) for f in select.split(",")}
+            return self._send(200, doc)
+
+        raise FakeServiceError(404, f"Unsupported operation: {method} {rest}")
+
+    def _openai(self, deployment: str, operation: str, body: Dict[str, Any]):
+        state = self.state
+        if operation == "embeddings":
+            return self._send(200, state.embeddings(deployment, body))
+
+        content, tool_calls = state.chat_reply(body)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        usage = state.chat_usage(body, content)
+        finish_reason = "tool_calls" if tool_calls else "stop"
+
+        if not body.get("stream"):
+            message: Dict[str, Any] = {"role": "assistant", "content": content or None}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            return self._send(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": deployment,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage
+            })
+
+        # Server-Sent Eventsで数文字ずつ返す（接続を閉じて終端を示す）
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta: Dict[str, Any], finish: Optional[str] = None, extra: Dict[str, Any] = None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": deployment,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]
+            }
+            chunk.update(extra or {})
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        event({"role": "assistant", "content": ""})
+        if tool_calls:
+            event({"tool_calls": [dict(call, index=i) for i, call in enumerate(tool_calls)]})
+        for i in range(0, len(content), 8):
+            if state.config.stream_chunk_ms:
+                time.sleep(state.config.stream_chunk_ms / 1000.0)
+            event({"content": content[i:i + 8]})
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+        event({}, finish=finish_reason)
+        if include_usage:
+            self.wfile.write(
+                f"data: {json.dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': deployment, 'choices': [], 'usage': usage})}\n\n".encode("utf-8")
+            )
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+class FakeAzureServer:
+    """ローカルのスタンドインサーバー（バックグラウンドスレッドで起動）"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: FakeServiceConfig = None):
+        """
+        初期化
+
+        Args:
+            host: 待ち受けアドレス
+            port: 待ち受けポート（0なら空きポート）
+            config: 遅延・スロットリング・障害注入の設定
+        """
+        self.state = FakeAzureState(config or FakeServiceConfig())
+        handler = type("FakeAzureHandler", (_Handler,), {"state": self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeAzureServer":
+        """バックグラウンドで起動"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def environment(self, index_name: str = "netis-index") -> Dict[str, str]:
+        """
+        このサーバーを指す環境変数（NETISSearchAgent・upload_to_search.py用）
+
+        Args:
+            index_name: インデックス名
+
+        Returns:
+            環境変数の辞書
+        """
+        return {
+            "AZURE_SEARCH_ENDPOINT": self.url,
+            "AZURE_SEARCH_API_KEY": "local",
+            "AZURE_SEARCH_INDEX_NAME": index_name,
+            "AZURE_OPENAI_ENDPOINT": self.url,
+            "AZURE_OPENAI_API_KEY": "local",
+            "AZURE_OPENAI_DEPLOYMENT_NAME": "local-chat",
+            "AZURE_OPENAI_EMBEDDING_DEPLOYMENT": "local-embedding",
+            "AZURE_OPENAI_API_VERSION": "2024-06-01",
+        }
+
+    def __enter__(self) -> "FakeAzureServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    """コマンドラインから起動"""
+    parser = argparse.ArgumentParser(description="Azure AI Search / Azure OpenAIのローカルスタンドイン")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    for f in fields(FakeServiceConfig):
+        parser.add_argument(f"--{f.name.replace('_', '-')}", type=type(f.default), default=f.default)
+    args = parser.parse_args()
+
+    config = FakeServiceConfig(**{f.name: getattr(args, f.name) for f in fields(FakeServiceConfig)})
+    server = FakeAzureServer(args.host, args.port, config)
+    print(f"Fake Azure services listening on {server.url}")
+    for key, value in server.environment().items():
+        print(f"  {key}={value}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+「N番目について詳しく」「AとBを比較して」などのフォローアップに、
+LLMを使わず直前の検索結果から直接回答するモジュール
+"""
+import re
+import unicodedata
+from typing import List, Dict, Any, Optional
+from src.context_packer import compact_text, short_id
+from src.intent_router import INTENT_DETAIL, INTENT_COMPARE
+
+
+# LLMによる文章での説明を求めていると判断する表現
+NARRATIVE_CUES = [
+    "まとめて", "要約", "説明して", "解説", "おすすめ", "お勧め", "どちらが良い", "どちらがいい",
+    "どれが良い", "どれがいい", "なぜ", "理由", "考えて", "提案", "アドバイス"
+]
+
+# 詳細表示の項目（ラベル, キー）
+DETAIL_SECTIONS = [
+    ("概要", "abstract"),
+    ("新規性・期待される効果", "innovation"),
+    ("適用条件", "conditions"),
+    ("適用範囲", "scope"),
+    ("留意事項", "notes")
+]
+
+# 比較表の行（ラベル, キー）
+COMPARISON_ROWS = [
+    ("分類", "category1"),
+    ("事後評価", "evaluation"),
+    ("適用条件", "conditions"),
+    ("適用範囲", "scope"),
+    ("留意事項", "notes")
+]
+
+_QUOTED_NAME_RE = re.compile(r"[「『]([^」』]+)[」』]")
+
+
+def wants_narrative(text: str) -> bool:
+    """
+    文章での説明・判断を求める発話かを判定
+
+    Args:
+        text: ユーザーの発話
+
+    Returns:
+        LLMで回答すべき場合True
+    """
+    return any(cue in text for cue in NARRATIVE_CUES)
+
+
+def _mention_position(text: str, tech_name: str, min_prefix: int = 4) -> int:
+    """
+    発話中で技術名が言及されている位置を返す（無ければ-1）
+
+    技術名全体と「」前の部分は完全一致、「」内の製品名は先頭min_prefix文字以上の一致で判定する
+    （「ガイナメッシュ工法Dタイプ」を「ガイナメッシュ」と呼ぶような省略に対応）
+    """
+    name = unicodedata.normalize("NFKC", tech_name)
+    positions = []
+
+    head = _QUOTED_NAME_RE.split(name)[0].strip()
+    for key in {name, head}:
+        if len(key) >= 3 and key in text:
+            positions.append(text.find(key))
+
+    for product in _QUOTED_NAME_RE.findall(name):
+        for length in range(len(product), min_prefix - 1, -1):
+            position = text.find(product[:length])
+            if position >= 0:
+                positions.append(position)
+                break
+
+    return min(positions) if positions else -1
+
+
+def resolve_targets(
+    text: str,
+    results: List[Dict[str, Any]],
+    ordinal_targets: Optional[List[int]] = None
+) -> List[int]:
+    """
+    発話が参照している検索結果の番号を特定（番号指定と技術名の両方に対応）
+
+    Args:
+        text: ユーザーの発話
+        results: 直前の検索結果
+        ordinal_targets: 番号指定から抽出済みの番号
+
+    Returns:
+        結果番号（1始まり）のリスト（発話中の出現順）
+    """
+    targets = list(ordinal_targets or [])
+    normalized = unicodedata.normalize("NFKC", text)
+
+    # 技術名での言及を、発話中の位置の順に追加
+    mentions = []
+    for number, result in enumerate(results, 1):
+        position = _mention_position(normalized, result.get("tech_name", ""))
+        if position >= 0:
+            mentions.append((position, number))
+    for _, number in sorted(mentions):
+        if number not in targets:
+            targets.append(number)
+
+    return targets
+
+
+def _cell(text: str, max_length: int = 120) -> str:
+    """Markdownの表のセル用に整形（改行・パイプを除去して切り詰め）"""
+    text = compact_text(text).replace("|", "｜")
+    if len(text) > max_length:
+        text = text[:max_length - 1] + "…"
+    return text or "-"
+
+
+def render_detail(number: int, result: Dict[str, Any]) -> str:
+    """
+    1件の技術の詳細をMarkdownで表示
+
+    Args:
+        number: 結果番号
+        result: 詳細フィールド付きの検索結果
+
+    Returns:
+        Markdown文字列
+    """
+    lines = [f"### 【{number}】{result.get('tech_name', '')}"]
+    lines.append(f"登録番号: {short_id(result)}　🔗 [NETISページを開く]({result.get('url', '')})")
+
+    categories = [result.get(f"category{j}", "") for j in range(1, 4)]
+    categories = [c for c in categories if c]
+    if categories:
+        lines.append(f"**分類:** {' / '.join(categories)}")
+    if result.get("evaluation"):
+        lines.append(f"**事後評価:** {result['evaluation']}")
+
+    for label, key in DETAIL_SECTIONS:
+        if result.get(key):
+            lines.append(f"\n**{label}**\n\n{result[key]}")
+
+    return "\n".join(lines)
+
+
+def render_comparison(numbers: List[int], results: List[Dict[str, Any]]) -> str:
+    """
+    複数の技術を比較表としてMarkdownで表示
+
+    Args:
+        numbers: 結果番号のリスト
+        results: numbersに対応する詳細フィールド付きの検索結果
+
+    Returns:
+        Markdown文字列
+    """
+    header = "| 項目 | " + " | ".join(f"【{n}】{_cell(r.get('tech_name', ''), 40)}" for n, r in zip(numbers, results)) + " |"
+    separator = "|---" * (len(results) + 1) + "|"
+    rows = [header, separator]
+    rows.append("| 登録番号 | " + " | ".join(short_id(r) for r in results) + " |")
+    for label, key in COMPARISON_ROWS:
+        rows.append(f"| {label} | " + " | ".join(_cell(r.get(key, "")) for r in results) + " |")
+    return "\n".join(rows)
+
+
+def plan_followup(
+    text: str,
+    intent: str,
+    results: List[Dict[str, Any]],
+    ordinal_targets: Optional[List[int]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    詳細・比較のフォローアップに回答できるか判定し、必要な結果番号を返す
+
+    Args:
+        text: ユーザーの発話
+        intent: 意図（INTENT_DETAIL または INTENT_COMPARE）
+        results: 直前の検索結果
+        ordinal_targets: 番号指定から抽出済みの番号
+
+    Returns:
+        {"intent", "targets"}（LLMに任せるべき場合はNone）
+    """
+    if not results or wants_narrative(text):
+        return None
+
+    targets = resolve_targets(text, results, ordinal_targets)
+    if intent == INTENT_COMPARE and len(targets) >= 2:
+        return {"intent": intent, "targets": targets}
+    if intent == INTENT_DETAIL and targets:
+        return {"intent": intent, "targets": targets}
+    return None
+
+
+def render_followup(plan: Dict[str, Any], results: List[Dict[str, Any]]) -> str:
+    """
+    plan_followupの結果に従って回答を作成
+
+    Args:
+        plan: plan_followupの戻り値
+        results: 詳細フィールド付きの直前の検索結果
+
+    Returns:
+        Markdown文字列
+    """
+    numbers = plan["targets"]
+    selected = [results[n - 1] for n in numbers]
+    if plan["intent"] == INTENT_COMPARE:
+        return render_comparison(numbers, selected)
+    return "\n\n---\n\n".join(render_detail(n, r) for n, r in zip(numbers, selected))
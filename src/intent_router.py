@@ -0,0 +1,214 @@
+"""
+ユーザー発話の意図（検索・詳細・比較・雑談）をネットワークを使わずに判定するモジュール
+"""
+import numpy as np
+from typing import List, Dict, Any
+import re
+import unicodedata
+import zlib
+
+
+INTENT_SEARCH = "search"
+INTENT_DETAIL = "detail"
+INTENT_COMPARE = "compare"
+INTENT_CHITCHAT = "chitchat"
+
+# 意図ごとの代表的な発話（文字n-gramの重心を作るための例文）
+SEED_EXAMPLES = {
+    INTENT_SEARCH: [
+        "トンネルの漏水対策技術を教えて",
+        "トンネル 漏水 対策工法",
+        "環境負荷が少ない工法は？",
+        "道路の舗装に使える技術を探している",
+        "橋梁の防食に関する新技術はありますか",
+        "コンクリートの剥落防止技術を検索して",
+        "防草対策の工法を探してください",
+        "騒音を抑える施工方法",
+        "法面保護に使える製品",
+        "別の条件で検索し直して",
+        "舗装のひび割れ補修",
+        "ICTを活用した施工管理技術",
+        "もっと安い技術はありますか",
+        "他に使える工法はある？",
+    ],
+    INTENT_DETAIL: [
+        "2番目について詳しく",
+        "1番目の技術について詳しく教えて",
+        "3番の適用条件は？",
+        "この技術の留意事項を教えて",
+        "さっきの技術の詳細を見せて",
+        "最初の技術の適用範囲は",
+        "それの新規性は何ですか",
+        "もっと詳しく説明して",
+    ],
+    INTENT_COMPARE: [
+        "1番と3番を比較して",
+        "AとBを比較して",
+        "2つの違いは何ですか",
+        "どちらが安いですか",
+        "1番目と2番目の違いを教えて",
+        "比べるとどう違う",
+        "上位3件を比較表にして",
+    ],
+    INTENT_CHITCHAT: [
+        "ありがとう",
+        "こんにちは",
+        "助かりました",
+        "わかりました",
+        "NETISとは何ですか",
+        "使い方を教えて",
+        "了解です",
+        "なるほど",
+    ],
+}
+
+# 「2番目」「１番」「3つ目」「二番目」などの番号指定
+# 接尾辞のない「番」は後ろが助詞・句読点・文末の場合のみ（「一番安い」の最上級を番号にしない）
+_ORDINAL_RE = re.compile(
+    r"(\d+|[一二三四五六七八九十]+)\s*(?:番目|つ目|件目|番(?=[のとをはもがで、。,，\s]|$))"
+)
+_KANJI_DIGITS = {"一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+
+_COMPARE_CUES = ["比較", "比べ", "違い", "どちらが", "どっちが", "差は"]
+_SEARCH_CUES = ["探して", "検索", "技術", "工法", "対策", "ありますか", "ある？"]
+# 新しい検索の依頼（番号指定よりも優先する）
+_SEARCH_REQUEST_CUES = ["探して", "探し", "検索", "教えて", "ありますか", "ある？", "他に", "別の"]
+# 直前の結果を参照していることを示す語（これがあれば詳細・比較として扱う）
+_DETAIL_CUES = ["詳しく", "詳細", "について", "適用", "留意", "新規性", "特徴", "概要", "説明",
+                "この", "その", "それ", "さっき", "上記"]
+_POSITION_WORDS = {"最初": 1, "一番上": 1, "トップ": 1}
+# 位置を表す語は単独の語としてのみ一致させる（「トップコート」の「トップ」は対象外）
+_POSITION_RES = {
+    word: re.compile(rf"(?<![\u30A0-\u30FF]){word}(?![\u30A0-\u30FF])")
+    for word in _POSITION_WORDS
+}
+
+
+def _kanji_to_int(text: str) -> int:
+    """漢数字（十まで、二十三などの組み合わせ含む）を整数に変換"""
+    if "十" not in text:
+        return _KANJI_DIGITS.get(text, 0)
+    tens, _, ones = text.partition("十")
+    return (_KANJI_DIGITS.get(tens, 1) if tens else 1) * 10 + (_KANJI_DIGITS.get(ones, 0) if ones else 0)
+
+
+def extract_ordinals(text: str) -> List[int]:
+    """
+    発話から結果の番号指定（1始まり）を出現順に抽出
+
+    Args:
+        text: ユーザーの発話
+
+    Returns:
+        番号のリスト（重複除去済み）
+    """
+    text = unicodedata.normalize("NFKC", text)
+    ordinals = []
+    for match in _ORDINAL_RE.finditer(text):
+        value = match.group(1)
+        number = int(value) if value.isdigit() else _kanji_to_int(value)
+        if number > 0 and number not in ordinals:
+            ordinals.append(number)
+    for word, number in _POSITION_WORDS.items():
+        if _POSITION_RES[word].search(text) and number not in ordinals:
+            ordinals.append(number)
+    return ordinals
+
+
+class IntentRouter:
+    """文字n-gramの重心分類とルールで発話の意図を判定するクラス"""
+
+    def __init__(self, dimensions: int = 2048, ngram_range: tuple = (1, 3)):
+        """
+        初期化
+
+        Args:
+            dimensions: ハッシュ化した特徴ベクトルの次元数
+            ngram_range: 使用する文字n-gramの長さの範囲
+        """
+        self.dimensions = dimensions
+        self.ngram_range = ngram_range
+        self.intents = list(SEED_EXAMPLES.keys())
+
+        # 意図ごとの重心を事前計算
+        centroids = []
+        for intent in self.intents:
+            vectors = np.stack([self._featurize(text) for text in SEED_EXAMPLES[intent]])
+            centroid = vectors.mean(axis=0)
+            centroids.append(centroid / (np.linalg.norm(centroid) or 1.0))
+        self.centroids = np.stack(centroids)
+
+    def _featurize(self, text: str) -> np.ndarray:
+        """発話を文字n-gramのハッシュ特徴ベクトル（L2正規化）に変換"""
+        text = unicodedata.normalize("NFKC", text).lower()
+        # 番号は具体的な値ではなく「数字がある」ことを特徴にする
+        text = re.sub(r"\d+", "0", text)
+
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(text) - n + 1):
+                gram = text[i:i + n]
+                if gram.isspace():
+                    continue
+                vector[zlib.crc32(gram.encode("utf-8")) % self.dimensions] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def classify(self, text: str) -> Dict[str, float]:
+        """
+        重心との類似度を意図ごとに計算
+
+        Args:
+            text: ユーザーの発話
+
+        Returns:
+            意図 → 類似度 の辞書
+        """
+        scores = self.centroids @ self._featurize(text)
+        return {intent: float(score) for intent, score in zip(self.intents, scores)}
+
+    def route(self, text: str, num_results: int = 0) -> Dict[str, Any]:
+        """
+        発話の意図を判定
+
+        Args:
+            text: ユーザーの発話
+            num_results: 直前の検索結果の件数（0なら詳細・比較は検索として扱う）
+
+        Returns:
+            {"intent": 意図, "targets": 対象の結果番号（1始まり）, "scores": 意図ごとの類似度}
+        """
+        scores = self.classify(text)
+        targets = [n for n in extract_ordinals(text) if n <= num_results]
+        has_compare_cue = any(cue in text for cue in _COMPARE_CUES)
+        has_detail_cue = any(cue in text for cue in _DETAIL_CUES)
+        # 技術・工法などを「探して」「教えて」と依頼し、結果を参照する語が無ければ新しい検索
+        is_search_request = (
+            any(cue in text for cue in _SEARCH_REQUEST_CUES)
+            and any(cue in text for cue in _SEARCH_CUES)
+            and not has_detail_cue and not has_compare_cue
+        )
+
+        if is_search_request:
+            intent = INTENT_SEARCH
+            targets = []
+        elif num_results and targets:
+            # 番号指定がある場合はルールで確定
+            if len(targets) >= 2 or has_compare_cue:
+                intent = INTENT_COMPARE
+            else:
+                intent = INTENT_DETAIL
+        else:
+            intent = max(scores, key=scores.get)
+            if intent == INTENT_DETAIL and has_compare_cue:
+                intent = INTENT_COMPARE
+            if intent == INTENT_CHITCHAT and any(cue in text for cue in _SEARCH_CUES):
+                intent = INTENT_SEARCH
+            if intent in (INTENT_DETAIL, INTENT_COMPARE) and (
+                not num_results or not (has_detail_cue or has_compare_cue)
+            ):
+                # 参照する結果・参照を示す語が無ければ検索として扱う（「橋梁の塗装」など）
+                intent = INTENT_SEARCH
+
+        return {"intent": intent, "targets": targets, "scores": scores}
@@ -0,0 +1,110 @@
+"""
+ネットワークを使わずに決定的なエンベディングを生成するモジュール（オフライン実行・ベンチマーク用）
+
+文字n-gramを符号付きでハッシュし、指定次元に射影したベクトルを返す。
+意味的な類似度はAzure OpenAIのモデルに及ばないが、語の重なりに応じた類似度になるため
+取り込み・インデックス・検索の経路全体を認証情報なしで動かせる。
+"""
+import numpy as np
+from typing import List
+import os
+import re
+import unicodedata
+import zlib
+from src.embedding_provider import EmbeddingProvider
+from src.structured_logging import get_logger
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+logger = get_logger(__name__)
+
+
+class LocalEmbeddingGenerator(EmbeddingProvider):
+    """文字n-gramのハッシュ特徴によるエンベディング生成クラス"""
+
+    def __init__(self, dimensions: int = None, ngram_range: tuple = (1, 3), seed: int = 0):
+        """
+        初期化
+
+        Args:
+            dimensions: ベクトルの次元数（省略時はEMBEDDING_DIMENSIONS、既定1536）
+            ngram_range: 使用する文字n-gramの長さの範囲
+            seed: ハッシュのシード（同じシードなら常に同じベクトル）
+        """
+        self.dimensions = dimensions or int(os.getenv('EMBEDDING_DIMENSIONS', '1536'))
+        self.ngram_range = ngram_range
+        self.seed = seed
+        self.total_tokens = 0  # EmbeddingGeneratorとの互換用（処理した文字数）
+
+    def _hash_ngrams(self, text: str) -> np.ndarray:
+        """テキストの文字n-gramをcrc32でハッシュした配列（uint32）"""
+        text = _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", text or "").lower()).strip()
+        low, high = self.ngram_range
+        grams = [
+            text[i:i + n].encode("utf-8")
+            for n in range(low, high + 1)
+            for i in range(len(text) - n + 1)
+        ]
+        self.total_tokens += len(text)
+        return np.fromiter(
+            (zlib.crc32(gram, self.seed) for gram in grams),
+            dtype=np.uint32, count=len(grams)
+        )
+
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        複数テキストのエンベディングを生成
+
+        全テキストのハッシュ値を連結し、1回のbincountで (件数, 次元) の行列に集計する。
+
+        Args:
+            texts: エンベディング対象のテキストリスト
+
+        Returns:
+            textsと同じ順序のエンベディングベクトルのリスト（L2正規化済み）
+        """
+        if not texts:
+            return []
+
+        hashes = [self._hash_ngrams(text) for text in texts]
+        rows = np.repeat(np.arange(len(texts), dtype=np.int64), [len(h) for h in hashes])
+        hashes = np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.uint32)
+
+        # 下位ビットで次元、最上位ビットで符号を決める（ハッシュの衝突を相殺する）
+        columns = (hashes % self.dimensions).astype(np.int64)
+        signs = np.where(hashes >> 31, 1.0, -1.0)
+        matrix = np.bincount(
+            rows * self.dimensions + columns,
+            weights=signs,
+            minlength=len(texts) * self.dimensions
+        ).reshape(len(texts), self.dimensions)
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms > 0, norms, 1.0)
+        return matrix.astype(np.float32).tolist()
+
+    def generate_embeddings_batch(
+        self,
+        texts: List[str],
+        batch_size: int = 256,
+        delay: float = 0.0,
+        max_batch_tokens: int = None
+    ) -> List[List[float]]:
+        """
+        複数テキストのエンベディングをバッチ生成（待機・トークン上限は不要なため無視）
+
+        Args:
+            texts: エンベディング対象のテキストリスト
+            batch_size: 1回に集計する件数（メモリ使用量の上限用）
+            delay: 未使用（EmbeddingGeneratorとの互換用）
+            max_batch_tokens: 未使用（EmbeddingGeneratorとの互換用）
+
+        Returns:
+            エンベディングベクトルのリスト
+        """
+        embeddings = []
+        for i in range(0, len(texts), batch_size):
+            embeddings.extend(self.generate_embeddings(texts[i:i + batch_size]))
+        logger.info("Generated local embeddings", extra={"embeddings": len(embeddings), "dimensions": self.dimensions})
+        return embeddings
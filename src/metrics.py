@@ -0,0 +1,429 @@
+"""
+カウンター・ヒストグラムを集計してPrometheusのテキスト形式で公開するモジュール
+
+段階ごとの所要時間・トークン数・アップロードの成否はsrc/tracing.pyのスパンから集計するため、
+計測箇所はトレーシングと共通（enable()でスパンのリスナーとして登録する）。
+キャッシュのヒット率は描画時にcollectorから各キャッシュのstats()を読んで設定する。
+
+環境変数:
+    NETIS_METRICS=1          集計を有効化
+    NETIS_METRICS_PORT=9464  /metrics を公開するポート（指定すると集計も有効化）
+    NETIS_PRICE_PROMPT / NETIS_PRICE_CACHED / NETIS_PRICE_COMPLETION / NETIS_PRICE_EMBEDDING
+                             100万トークンあたりの料金（USD、推定コストの計算用）
+"""
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import os
+import threading
+from src import tracing
+from src.structured_logging import get_logger
+
+
+logger = get_logger(__name__)
+
+# 所要時間のヒストグラムの境界（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 100万トークンあたりの料金（USD）の既定値
+DEFAULT_PRICES = {
+    "prompt": 2.50,
+    "cached": 1.25,
+    "completion": 10.00,
+    "embedding": 0.02,
+}
+
+
+def _escape(value: Any) -> str:
+    """ラベル値のエスケープ"""
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class _Metric:
+    """メトリクスの共通部分（ラベルの組ごとに値を保持）"""
+
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[Tuple[str, str], ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+        return tuple((name, str(labels.get(name, ""))) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value:g}")
+        return lines
+
+
+class Counter(_Metric):
+    """増加のみのカウンター"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        if amount <= 0:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    """任意の値を設定するゲージ"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    """境界ごとの件数・合計・件数を持つヒストグラム"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # 境界ごとの件数（最後は+Inf）、合計、件数
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """
+        境界内を線形補間した分位点の推定値（Prometheusのhistogram_quantileと同じ考え方）
+
+        Args:
+            q: 0.0〜1.0
+            **labels: ラベル
+
+        Returns:
+            推定値（観測が無ければNone）
+        """
+        entry = self._values.get(self._key(labels))
+        if entry is None or entry[2] == 0:
+            return None
+        counts, _, total = entry
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative + count >= rank and count > 0:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """ラベルの組ごとの件数・平均・p50・p95（表示用）"""
+        rows = []
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, (_, total_sum, count) in items:
+            labels = dict(key)
+            rows.append(dict(
+                labels,
+                count=count,
+                mean_ms=round(total_sum / count * 1000.0, 1) if count else None,
+                p50_ms=round((self.quantile(0.5, **labels) or 0.0) * 1000.0, 1),
+                p95_ms=round((self.quantile(0.95, **labels) or 0.0) * 1000.0, 1)
+            ))
+        return rows
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._values.items())
+            for key, (counts, total_sum, count) in items:
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_format_labels(key, (('le', le),))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total_sum:g}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """メトリクスの登録と出力"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: Dict[str, Callable[[], None]] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, help_text: str, **kwargs) -> _Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labelnames=labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text, labelnames=labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labelnames=labelnames, buckets=buckets)
+
+    def register_collector(self, key: str, collector: Callable[[], None]):
+        """
+        出力の直前に呼ぶ関数を登録（同じkeyは置き換え）
+
+        Args:
+            key: 登録名
+            collector: ゲージを最新の値に更新する関数
+        """
+        with self._lock:
+            self._collectors[key] = collector
+
+    def collect(self):
+        """collectorを実行してゲージを更新"""
+        with self._lock:
+            collectors = list(self._collectors.values())
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning("Metrics collector failed", extra={"error": str(e)})
+
+    def render(self) -> str:
+        """Prometheusのテキスト形式（version 0.0.4）"""
+        self.collect()
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        表示用の集計値（Streamlitのパネル用）
+
+        Returns:
+            {"histograms": {名前: [行]}, "values": {名前: [行]}}
+        """
+        self.collect()
+        snapshot = {"histograms": {}, "values": {}}
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            if isinstance(metric, Histogram):
+                snapshot["histograms"][metric.name] = metric.summary()
+            else:
+                with metric._lock:
+                    snapshot["values"][metric.name] = [
+                        dict(key, value=round(value, 6)) for key, value in sorted(metric._values.items())
+                    ]
+        return snapshot
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY = REGISTRY.histogram(
+    "netis_stage_duration_seconds", "Duration of each traced stage (turn, search, embedding, chat, upload)",
+    labelnames=("stage",)
+)
+STAGE_ERRORS = REGISTRY.counter(
+    "netis_stage_errors_total", "Stages that raised an exception", labelnames=("stage",)
+)
+EMBEDDING_BATCH_LATENCY = REGISTRY.histogram(
+    "netis_embedding_batch_duration_seconds", "Duration of one embedding API request",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+SEARCH_REQUESTS = REGISTRY.counter(
+    "netis_search_requests_total", "search() calls by cache outcome (exact / semantic / miss)",
+    labelnames=("cache",)
+)
+UPLOAD_BATCHES = REGISTRY.counter(
+    "netis_upload_batches_total", "Upload batches by outcome", labelnames=("index", "status")
+)
+UPLOAD_DOCUMENTS = REGISTRY.counter(
+    "netis_upload_documents_total", "Documents accepted by the search index", labelnames=("index",)
+)
+UPLOAD_RETRIES = REGISTRY.counter(
+    "netis_upload_retries_total", "Upload batch retries", labelnames=("index",)
+)
+TOKENS = REGISTRY.counter(
+    "netis_tokens_total", "Tokens by kind (prompt / cached / completion / embedding)", labelnames=("kind",)
+)
+ESTIMATED_COST = REGISTRY.counter(
+    "netis_estimated_cost_usd_total", "Estimated API cost from token counts and NETIS_PRICE_* rates",
+    labelnames=("kind",)
+)
+CACHE_HITS = REGISTRY.gauge("netis_cache_hits", "Cache hits since the agent started", labelnames=("cache",))
+CACHE_MISSES = REGISTRY.gauge("netis_cache_misses", "Cache misses since the agent started", labelnames=("cache",))
+CACHE_HIT_RATIO = REGISTRY.gauge("netis_cache_hit_ratio", "Cache hit ratio", labelnames=("cache",))
+
+
+def _price(kind: str) -> float:
+    """100万トークンあたりの料金"""
+    return float(os.getenv(f"NETIS_PRICE_{kind.upper()}", str(DEFAULT_PRICES[kind])))
+
+
+def _add_tokens(kind: str, tokens: int):
+    if tokens:
+        TOKENS.inc(tokens, kind=kind)
+        ESTIMATED_COST.inc(tokens * _price(kind) / 1_000_000, kind=kind)
+
+
+def observe_span(span):
+    """終了したスパンをメトリクスに反映（tracingのリスナー）"""
+    seconds = span.duration_ms / 1000.0
+    attributes = span.attributes
+    STAGE_LATENCY.observe(seconds, stage=span.name)
+    if span.status == "error":
+        STAGE_ERRORS.inc(stage=span.name)
+
+    if span.name == "search":
+        SEARCH_REQUESTS.inc(cache=attributes.get("cache", "miss"))
+    elif span.name == "embedding.request":
+        EMBEDDING_BATCH_LATENCY.observe(seconds)
+        _add_tokens("embedding", attributes.get("tokens") or 0)
+    elif span.name == "chat.completion":
+        cached = attributes.get("cached_tokens") or 0
+        _add_tokens("prompt", (attributes.get("prompt_tokens") or 0) - cached)
+        _add_tokens("cached", cached)
+        _add_tokens("completion", attributes.get("completion_tokens") or 0)
+    elif span.name == "upload.batch":
+        index = attributes.get("index", "")
+        succeeded = attributes.get("succeeded", 0)
+        ok = span.status == "ok" and succeeded == attributes.get("documents")
+        UPLOAD_BATCHES.inc(index=index, status="succeeded" if ok else "failed")
+        UPLOAD_DOCUMENTS.inc(succeeded, index=index)
+        UPLOAD_RETRIES.inc(attributes.get("retries", 0), index=index)
+
+
+def observe_cache_stats(stats: Dict[str, Any]):
+    """
+    NETISSearchAgent.get_cache_stats()の値をゲージに設定
+
+    Args:
+        stats: キャッシュ種別 → stats()の辞書
+    """
+    for cache, values in stats.items():
+        if not isinstance(values, dict) or "hits" not in values:
+            continue
+        CACHE_HITS.set(values["hits"], cache=cache)
+        CACHE_MISSES.set(values["misses"], cache=cache)
+        CACHE_HIT_RATIO.set(values.get("hit_ratio", 0.0), cache=cache)
+
+
+def enable():
+    """スパンの集計を有効化（何度呼んでもよい）"""
+    tracing.add_listener(observe_span)
+
+
+def enabled() -> bool:
+    """集計が有効か"""
+    return observe_span in tracing._listeners
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics にPrometheusのテキスト形式で応答"""
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    /metrics を公開するHTTPサーバーをバックグラウンドで起動（起動済みならそのまま返す）
+
+    Args:
+        port: 待ち受けポート
+        host: 待ち受けアドレス
+
+    Returns:
+        ThreadingHTTPServer
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            enable()
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+            logger.info("Metrics endpoint started", extra={"url": f"http://{host}:{port}/metrics"})
+        return _server
+
+
+def configure_from_env():
+    """NETIS_METRICS / NETIS_METRICS_PORT に応じて集計とHTTPサーバーを開始"""
+    port = os.getenv('NETIS_METRICS_PORT')
+    if port:
+        start_http_server(int(port), os.getenv('NETIS_METRICS_HOST', '127.0.0.1'))
+    elif os.getenv('NETIS_METRICS', '0') == '1':
+        enable()
+
+
+def write_textfile(path: str):
+    """
+    現在の値をテキスト形式でファイルに書き出す（バッチ処理の結果をnode_exporterのtextfile collectorで読む用途）
+
+    Args:
+        path: 出力先
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(REGISTRY.render())
+    os.replace(tmp_path, path)
@@ -0,0 +1,169 @@
+"""
+MinHash/LSHでほぼ同一のドキュメント（再登録・型違いなど）をクラスタリングするモジュール
+"""
+import numpy as np
+from typing import List, Sequence
+import unicodedata
+import re
+import zlib
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# ハッシュ値を一様にするためのメルセンヌ素数（2^61 - 1）
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def shingles(text: str, size: int = 5) -> np.ndarray:
+    """
+    テキストを文字size-gramのハッシュ値の集合に変換
+
+    Args:
+        text: 対象テキスト
+        size: shingleの文字数
+
+    Returns:
+        重複を除いたハッシュ値の配列（uint64）
+    """
+    text = _WHITESPACE_RE.sub("", unicodedata.normalize("NFKC", text or ""))
+    if len(text) < size:
+        grams = {text} if text else set()
+    else:
+        grams = {text[i:i + size] for i in range(len(text) - size + 1)}
+    return np.fromiter(
+        (zlib.crc32(gram.encode("utf-8")) for gram in grams),
+        dtype=np.uint64, count=len(grams)
+    )
+
+
+class MinHasher:
+    """num_perm個のハッシュ関数でMinHash署名を計算するクラス"""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        """
+        初期化
+
+        Args:
+            num_perm: 署名の長さ（ハッシュ関数の数）
+            shingle_size: shingleの文字数
+            seed: ハッシュ関数の係数の乱数シード
+        """
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # h(x) = (a * x + b) mod p の係数
+        # a, b, x（crc32）はいずれも2^32未満のため、a*x + b ≤ (2^32-1)^2 + (2^32-1) = 2^64 - 2^32 となり
+        # uint64で桁あふれせずに計算できる（aやxを2^32以上にすると桁あふれするので注意）
+        self.a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        1件のテキストのMinHash署名を計算
+
+        Args:
+            text: 対象テキスト
+
+        Returns:
+            署名（num_perm要素のuint64配列、空テキストは全要素が最大値でクラスタリングの対象外）
+        """
+        hashes = shingles(text, self.shingle_size)
+        if len(hashes) == 0:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        # (num_perm, shingle数) の行列で全ハッシュ関数を一度に適用
+        permuted = (np.outer(self.a, hashes) + self.b[:, None]) % _MERSENNE_PRIME
+        return (permuted & _MAX_HASH).min(axis=1)
+
+    def signatures(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        複数テキストの署名を計算
+
+        Args:
+            texts: 対象テキストのリスト
+
+        Returns:
+            署名の行列 (テキスト数, num_perm)
+        """
+        if not texts:
+            return np.zeros((0, self.num_perm), dtype=np.uint64)
+        return np.stack([self.signature(text) for text in texts])
+
+
+def _find(parent: List[int], i: int) -> int:
+    """Union-Findの根を取得（経路圧縮あり）"""
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def cluster_signatures(
+    signatures: np.ndarray,
+    bands: int = 32,
+    threshold: float = 0.8
+) -> List[int]:
+    """
+    LSHのバンドで候補ペアを作り、推定Jaccard類似度がthreshold以上のものを同じクラスタにまとめる
+
+    全ペアを比較せず、バンドのハッシュが一致したペアだけを検証するため、ほぼ線形時間で動く。
+    空テキスト（全要素が最大値の署名）は互いに同一の署名になるため、クラスタにまとめず単独とする。
+
+    Args:
+        signatures: MinHash署名の行列 (件数, num_perm)
+        bands: バンド数（num_permを割り切れる数）
+        threshold: 同一クラスタとみなす推定Jaccard類似度
+
+    Returns:
+        各ドキュメントのクラスタ代表（クラスタ内で最初の行番号）のリスト
+    """
+    n, num_perm = signatures.shape
+    rows = num_perm // bands
+    parent = list(range(n))
+    empty = (signatures == _MAX_HASH).all(axis=1) if n else np.zeros(0, dtype=bool)
+
+    for band in range(bands):
+        # バンド内の署名をまとめてハッシュ化し、同じ値の行をバケットにする
+        block = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        keys = block.view(np.dtype((np.void, block.dtype.itemsize * rows))).ravel()
+        _, bucket_ids = np.unique(keys, return_inverse=True)
+        order = np.argsort(bucket_ids, kind="stable")
+        boundaries = np.flatnonzero(np.diff(bucket_ids[order])) + 1
+
+        for bucket in np.split(order, boundaries):
+            bucket = bucket[~empty[bucket]]
+            if len(bucket) < 2:
+                continue
+            head = int(bucket[0])
+            # バケット内の先頭との推定類似度をまとめて検証
+            similarity = (signatures[bucket[1:]] == signatures[head]).mean(axis=1)
+            for member in bucket[1:][similarity >= threshold]:
+                root_a, root_b = _find(parent, head), _find(parent, int(member))
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    return [_find(parent, i) for i in range(n)]
+
+
+def find_near_duplicates(
+    texts: Sequence[str],
+    threshold: float = 0.8,
+    num_perm: int = 128,
+    bands: int = 32,
+    shingle_size: int = 5
+) -> List[int]:
+    """
+    ほぼ同一のテキストをクラスタリング
+
+    Args:
+        texts: 対象テキストのリスト
+        threshold: 同一クラスタとみなす推定Jaccard類似度
+        num_perm: MinHash署名の長さ
+        bands: LSHのバンド数
+        shingle_size: shingleの文字数
+
+    Returns:
+        各テキストのクラスタ代表の行番号のリスト
+    """
+    hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+    return cluster_signatures(hasher.signatures(texts), bands=bands, threshold=threshold)
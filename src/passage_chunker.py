@@ -0,0 +1,139 @@
+"""
+長いドキュメントをトークン数の上限付きパッセージに分割し、パッセージの検索結果を
+ドキュメント単位に集約するモジュール
+"""
+from typing import List, Dict, Any, Iterable, Tuple
+import re
+from src.token_counter import count_tokens, split_by_tokens
+
+
+# パッセージに含めるフィールド（searchable_textと同じ構成）
+PASSAGE_SOURCE_FIELDS = ["abstract", "overview", "innovation", "scope"]
+
+# 1パッセージの既定トークン数と、隣り合うパッセージの重複トークン数
+DEFAULT_PASSAGE_TOKENS = 512
+DEFAULT_OVERLAP_TOKENS = 64
+
+# 文の区切り（句点・改行の直後で分割）
+_SENTENCE_RE = re.compile(r"(?<=[。！？\n])")
+
+
+def split_into_passages(
+    text: str,
+    max_tokens: int = DEFAULT_PASSAGE_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS
+) -> List[str]:
+    """
+    テキストを文の境界でmax_tokens以内のパッセージにまとめる
+
+    1文がmax_tokensを超える場合だけトークン単位で分割する（切り捨ては行わない）。
+
+    Args:
+        text: 対象テキスト
+        max_tokens: 1パッセージの最大トークン数
+        overlap_tokens: 前のパッセージの末尾を次のパッセージの先頭に含めるトークン数の目安
+
+    Returns:
+        パッセージのリスト
+    """
+    text = (text or "").strip()
+    if not text:
+        return []
+    if count_tokens(text) <= max_tokens:
+        return [text]
+
+    # 文ごとのトークン数は1回だけ数える
+    sentences: List[Tuple[str, int]] = []
+    for sentence in _SENTENCE_RE.split(text):
+        if not sentence.strip():
+            continue
+        tokens = count_tokens(sentence)
+        if tokens > max_tokens:
+            for window in split_by_tokens(sentence, max_tokens, overlap_tokens):
+                sentences.append((window, count_tokens(window)))
+        else:
+            sentences.append((sentence, tokens))
+
+    passages = []
+    current: List[Tuple[str, int]] = []
+    current_tokens = 0
+    for sentence, tokens in sentences:
+        if current and current_tokens + tokens > max_tokens:
+            passages.append("".join(s for s, _ in current).strip())
+            # 末尾の文をoverlap_tokensに収まる範囲で次のパッセージに引き継ぐ
+            carried: List[Tuple[str, int]] = []
+            carried_tokens = 0
+            for previous, previous_tokens in reversed(current):
+                if carried_tokens + previous_tokens > overlap_tokens or carried_tokens + previous_tokens + tokens > max_tokens:
+                    break
+                carried.insert(0, (previous, previous_tokens))
+                carried_tokens += previous_tokens
+            current, current_tokens = carried, carried_tokens
+        current.append((sentence, tokens))
+        current_tokens += tokens
+    if current:
+        passages.append("".join(s for s, _ in current).strip())
+
+    return passages
+
+
+def build_passages(
+    documents: Iterable[Dict[str, Any]],
+    max_tokens: int = DEFAULT_PASSAGE_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS
+) -> List[Dict[str, Any]]:
+    """
+    検索ドキュメントをパッセージインデックス用のドキュメントに変換
+
+    Args:
+        documents: 検索ドキュメントのリスト
+        max_tokens: 1パッセージの最大トークン数
+        overlap_tokens: 隣り合うパッセージの重複トークン数
+
+    Returns:
+        {"id", "parent_id", "chunk_index", "tech_name", "content"} のリスト
+    """
+    passages = []
+    for doc in documents:
+        # フィールドごとに分割し、フィールドをまたいだパッセージは作らない
+        chunks = []
+        for field in PASSAGE_SOURCE_FIELDS:
+            chunks.extend(split_into_passages(doc.get(field, ""), max_tokens, overlap_tokens))
+
+        for chunk_index, content in enumerate(chunks):
+            passages.append({
+                "id": f"{doc['id']}_p{chunk_index:03d}",
+                "parent_id": doc["id"],
+                "chunk_index": chunk_index,
+                "tech_name": doc.get("tech_name", ""),
+                "content": content
+            })
+    return passages
+
+
+def aggregate_passage_hits(
+    hits: Iterable[Dict[str, Any]],
+    mode: str = "max",
+    top: int = 10
+) -> List[Tuple[str, float]]:
+    """
+    パッセージの検索結果を親ドキュメントごとに集約
+
+    Args:
+        hits: {"parent_id", "score"} を含むパッセージの検索結果
+        mode: "max"（最も良いパッセージのスコア）または "sum"（ヒットしたパッセージのスコアの合計）
+        top: 返すドキュメント数
+
+    Returns:
+        (親ドキュメントID, 集約スコア) のリスト（スコア順）
+    """
+    scores: Dict[str, float] = {}
+    for hit in hits:
+        parent_id = hit["parent_id"]
+        score = float(hit.get("score", 0.0))
+        if mode == "sum":
+            scores[parent_id] = scores.get(parent_id, 0.0) + score
+        else:
+            scores[parent_id] = max(scores.get(parent_id, score), score)
+
+    return sorted(scores.items(), key=lambda item: -item[1])[:top]
@@ -0,0 +1,301 @@
+"""
+取り込みの各ステップや会話1ターンをプロファイルするモジュール
+
+stage(name)で囲んだ区間ごとに以下を出力ディレクトリに書き出す:
+    <stage>.prof     cProfileの結果（mode="cprofile"、snakeviz・flameprof・gprof2dotで可視化できる）
+    <stage>.folded   サンプリングしたスタック（mode="sampling"、flamegraph.pl・speedscopeでフレームグラフにできる）
+    <stage>.txt      関数の上位N件（累積時間またはサンプル数）とtracemallocによる確保量の上位N件
+    summary.txt      ステージごとの所要時間・ピークメモリの一覧
+
+環境変数（profiler_from_env、Streamlitアプリで使う）:
+    NETIS_PROFILE         off（既定） / cprofile / sampling
+    NETIS_PROFILE_DIR     出力先の親ディレクトリ（既定 profiles、その下に実行・セッションごとのディレクトリを作る）
+    NETIS_PROFILE_MEMORY  0でtracemallocを使わない（既定 1）
+
+使い方:
+    profiler = StageProfiler("profiles/run1", mode="sampling")
+    with profiler.stage("convert"):
+        processor.convert_to_search_documents()
+    profiler.write_summary()
+"""
+from collections import Counter as CountMap
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from src.structured_logging import get_logger, get_run_id
+
+
+logger = get_logger(__name__)
+
+PROFILE_MODES = ("cprofile", "sampling")
+
+# ステージ名をファイル名にするときに置き換える文字
+_UNSAFE_CHARS_RE = re.compile(r"[^0-9A-Za-z._-]+")
+
+# tracemallocはプロセス全体で1つのため、使用中のステージ数を数えて最後の1つが止める
+# （Streamlitの複数セッションのターンが重なっても、先に終わったステージが止めないようにする）
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+
+
+def _acquire_tracemalloc():
+    """tracemallocの使用を開始（未開始なら開始する）"""
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_owned = True
+        _tracemalloc_users += 1
+        if _tracemalloc_users == 1:
+            # 重なったステージがある間はピークを戻さない（そのステージのピークが失われるため）
+            tracemalloc.reset_peak()
+
+
+def _release_tracemalloc():
+    """tracemallocの使用を終了（最後の使用者で、このモジュールが開始していれば停止する）"""
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+
+
+def _frame_name(frame) -> str:
+    """フレームの表示名（モジュール名.関数名、空白・セミコロンを含めない）"""
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{Path(code.co_filename).stem}.{name}".replace(";", ":").replace(" ", "_")
+
+
+class SamplingProfiler:
+    """別スレッドから対象スレッドのスタックを一定間隔で採取するプロファイラ"""
+
+    def __init__(self, interval: float = 0.005, thread_id: int = None):
+        """
+        初期化
+
+        Args:
+            interval: 採取間隔（秒）
+            thread_id: 対象スレッド（省略時はstart()を呼んだスレッド）
+        """
+        self.interval = interval
+        self.thread_id = thread_id
+        self.stacks: CountMap = CountMap()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="netis-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        """フレームグラフ用の折り畳み形式（"root;caller;callee 件数" を1行ずつ）"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, top: int = 20) -> List[Dict[str, Any]]:
+        """
+        関数ごとのサンプル数の上位
+
+        Returns:
+            {"function", "self"（末端にいたサンプル数）, "inclusive"（スタックに含まれたサンプル数）}のリスト
+        """
+        self_counts: CountMap = CountMap()
+        inclusive: CountMap = CountMap()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += count
+            for name in set(frames):
+                inclusive[name] += count
+        return [
+            {"function": name, "self": count, "inclusive": inclusive[name]}
+            for name, count in self_counts.most_common(top)
+        ]
+
+
+class StageProfiler:
+    """ステージ単位でプロファイルを取り、結果をファイルに書き出すクラス"""
+
+    def __init__(
+        self,
+        output_dir: str,
+        mode: str = "cprofile",
+        top: int = 20,
+        memory: bool = True,
+        interval: float = 0.005
+    ):
+        """
+        初期化
+
+        Args:
+            output_dir: 出力ディレクトリ
+            mode: "cprofile"（決定的、呼び出し回数が正確） / "sampling"（低オーバーヘッド、フレームグラフ用）
+            top: サマリーに出す件数
+            memory: tracemallocで確保量を追跡するか（実行が数倍遅くなる）
+            interval: samplingの採取間隔（秒）
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.mode = mode
+        self.top = top
+        self.memory = memory
+        self.interval = interval
+        self.results: List[Dict[str, Any]] = []
+        self._active = False
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        区間をプロファイル（入れ子にした場合は外側のステージにまとめて計測する）
+
+        別スレッドのステージと重なった場合、確保量・ピークメモリには重なった区間の
+        他のステージの分も含まれる（tracemallocはプロセス全体で1つのため）。
+
+        Args:
+            name: ステージ名（出力ファイル名に使う）
+        """
+        if self._active:
+            yield
+            return
+
+        self._active = True
+        memory_acquired = False
+        try:
+            stem = _UNSAFE_CHARS_RE.sub("_", name)
+            profile = cProfile.Profile() if self.mode == "cprofile" else None
+            sampler = SamplingProfiler(self.interval) if self.mode == "sampling" else None
+            memory_before = None
+            if self.memory:
+                _acquire_tracemalloc()
+                memory_acquired = True
+                memory_before = tracemalloc.take_snapshot()
+
+            start = time.perf_counter()
+            if profile is not None:
+                try:
+                    profile.enable()
+                except ValueError as e:
+                    # 別スレッドのcProfileが動作中（Python 3.12以降は同時に1つまで）
+                    logger.warning("cProfile unavailable for stage", extra={"stage": name, "error": str(e)})
+                    profile = None
+            if sampler is not None:
+                sampler.start()
+            try:
+                yield
+            finally:
+                if profile is not None:
+                    profile.disable()
+                if sampler is not None:
+                    sampler.stop()
+                elapsed = time.perf_counter() - start
+                try:
+                    self._write_stage(name, stem, elapsed, profile, sampler, memory_before)
+                except Exception:
+                    # プロファイルの書き出しに失敗しても計測対象の処理は止めない
+                    logger.exception("Failed to write stage profile", extra={"stage": name})
+        finally:
+            if memory_acquired:
+                _release_tracemalloc()
+            self._active = False
+
+    def _write_stage(self, name, stem, elapsed, profile, sampler, memory_before):
+        """ステージの結果をファイルに書き出し、サマリー用に記録"""
+        result = {"stage": name, "duration_ms": round(elapsed * 1000.0, 1)}
+        sections = [f"Stage: {name}", f"Duration: {elapsed * 1000.0:.1f} ms", ""]
+
+        if profile is not None:
+            profile.dump_stats(str(self.output_dir / f"{stem}.prof"))
+            buffer = io.StringIO()
+            pstats.Stats(profile, stream=buffer).sort_stats("cumulative").print_stats(self.top)
+            sections += [f"== Top {self.top} functions by cumulative time ==", buffer.getvalue()]
+        if sampler is not None:
+            (self.output_dir / f"{stem}.folded").write_text(sampler.folded(), encoding="utf-8")
+            result["samples"] = sampler.samples
+            sections.append(f"== Top {self.top} functions by samples ({sampler.samples} samples, "
+                            f"{self.interval * 1000:.0f} ms interval) ==")
+            sections += [f"{row['self']:>7} {row['inclusive']:>9}  {row['function']}"
+                         for row in sampler.top_functions(self.top)]
+            sections.append("")
+
+        if memory_before is not None:
+            _, peak = tracemalloc.get_traced_memory()
+            growth = tracemalloc.take_snapshot().compare_to(memory_before, "lineno")
+            result["peak_memory_mb"] = round(peak / 1024 / 1024, 1)
+            sections.append(f"== Top {self.top} allocation sites (net growth, peak {peak / 1024 / 1024:.1f} MB) ==")
+            sections += [str(stat) for stat in growth[:self.top]]
+
+        (self.output_dir / f"{stem}.txt").write_text("\n".join(sections) + "\n", encoding="utf-8")
+        self.results.append(result)
+        logger.info("Stage profiled", extra=dict(result, output_dir=str(self.output_dir)))
+
+    def write_summary(self) -> Path:
+        """
+        ステージごとの所要時間・ピークメモリの一覧を書き出す
+
+        Returns:
+            summary.txtのパス
+        """
+        lines = [f"{'stage':<32} {'duration_ms':>12} {'peak_mb':>9}"]
+        for result in self.results:
+            peak = result.get("peak_memory_mb")
+            lines.append(f"{result['stage']:<32} {result['duration_ms']:>12.1f} {peak if peak is not None else '-':>9}")
+        path = self.output_dir / "summary.txt"
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        return path
+
+
+def profiler_from_env(name: str = None) -> Optional[StageProfiler]:
+    """
+    環境変数からプロファイラを作成
+
+    Args:
+        name: 出力先のサブディレクトリ名（省略時は実行ID）
+
+    Returns:
+        StageProfiler（NETIS_PROFILEが未設定・offならNone）
+    """
+    mode = os.getenv('NETIS_PROFILE', 'off').lower()
+    if mode in ("", "0", "off"):
+        return None
+    if mode not in PROFILE_MODES:
+        logger.warning("Unknown NETIS_PROFILE; profiling disabled", extra={"mode": mode})
+        return None
+    return StageProfiler(
+        os.path.join(os.getenv('NETIS_PROFILE_DIR', 'profiles'), name or get_run_id()),
+        mode=mode,
+        memory=os.getenv('NETIS_PROFILE_MEMORY', '1') != '0'
+    )
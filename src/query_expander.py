@@ -0,0 +1,193 @@
+"""
+1つの発話に含まれる複数の要望をサブクエリに分解し、検索結果を統合するモジュール
+"""
+from typing import List, Dict, Any, Iterable
+import json
+import re
+import unicodedata
+
+
+# 並列の要望をつなぐ表現（「漏水と剥落」「漏水や剥落」「漏水、剥落」など）
+_CONNECTOR_RE = re.compile(r"(?:および|及び|並びに|と|や|、|，|,|／|/)")
+
+# 発話末尾の依頼表現（サブクエリからは除く）
+_REQUEST_SUFFIX_RE = re.compile(
+    r"(?:の)?(?:新)?(?:技術|工法|製品|方法)?(?:を|について|に関する|は)?"
+    r"(?:教えて(?:ください)?|探して(?:います|いる|ください)?|ください|ありますか|ある[？?]?|知りたい|[？?])*$"
+)
+
+# 分類名に現れない表記ゆれ
+ORTHOGRAPHIC_VARIANTS = {
+    "剥落": ["はく落"],
+    "はく落": ["剥落"],
+    "錆": ["さび", "サビ"],
+    "さび": ["錆"],
+    "ひび割れ": ["クラック"],
+    "クラック": ["ひび割れ"],
+}
+
+# 分類名の末尾の汎用語（語幹の比較では取り除く）
+_TERM_SUFFIXES = ("対策工", "補修工", "工事", "工")
+
+# サブクエリの統合に使うReciprocal Rank Fusionの定数
+RRF_K = 60
+
+
+def _stem(term: str) -> str:
+    """分類名から末尾の汎用語を除いた語幹を取得"""
+    for suffix in _TERM_SUFFIXES:
+        if term.endswith(suffix) and len(term) > len(suffix) + 1:
+            return term[:-len(suffix)]
+    return term
+
+
+class QueryExpander:
+    """分類フィールドから作った語彙でサブクエリを作るクラス"""
+
+    def __init__(self, category_values: Iterable[str] = (), max_queries: int = 4):
+        """
+        初期化
+
+        Args:
+            category_values: 分類フィールドの値（「トンネル工－トンネル補修補強工」など）
+            max_queries: 元のクエリを含めたサブクエリの最大数
+        """
+        self.max_queries = max_queries
+
+        # 分類名の語幹 → 分類名
+        self.category_terms: Dict[str, str] = {}
+        for value in category_values:
+            for term in str(value).split("－"):
+                term = term.strip()
+                if term and term != "その他":
+                    self.category_terms.setdefault(_stem(term), term)
+
+    @classmethod
+    def from_documents(cls, documents: List[Dict[str, Any]], max_queries: int = 4) -> "QueryExpander":
+        """
+        検索ドキュメントの分類フィールド（category1〜5）から生成
+
+        Args:
+            documents: 検索ドキュメントのリスト
+            max_queries: 元のクエリを含めたサブクエリの最大数
+
+        Returns:
+            QueryExpander
+        """
+        values = (doc.get(f"category{j}", "") for doc in documents for j in range(1, 6))
+        return cls(values, max_queries)
+
+    def _related_terms(self, keyword: str) -> List[str]:
+        """キーワードに対応する分類名（表記ゆれ含む）を取得"""
+        variants = [keyword] + ORTHOGRAPHIC_VARIANTS.get(keyword, [])
+        related = []
+        for stem, term in self.category_terms.items():
+            if len(stem) < 2:
+                continue
+            if any(stem in v or (len(v) >= 2 and v in stem) for v in variants) and term not in related:
+                related.append(term)
+        # 分類名に無い表記ゆれもサブクエリに使う
+        for variant in variants[1:]:
+            if variant not in related:
+                related.append(variant)
+        return related
+
+    def expand(self, query: str) -> List[str]:
+        """
+        発話をサブクエリに分解（先頭は常に元のクエリ）
+
+        「トンネルの漏水と剥落の対策」→ ["トンネルの漏水と剥落の対策", "トンネル 漏水", "トンネル 剥落", ...]
+
+        Args:
+            query: ユーザーの発話
+
+        Returns:
+            サブクエリのリスト
+        """
+        text = unicodedata.normalize("NFKC", query).strip()
+        body = _REQUEST_SUFFIX_RE.sub("", text) or text
+        segments = [s.strip() for s in _CONNECTOR_RE.split(body) if len(s.strip()) >= 2]
+
+        # 先頭の「〇〇の」を全サブクエリに共通する対象として扱う
+        context = ""
+        if segments and "の" in segments[0]:
+            context, _, segments[0] = segments[0].rpartition("の")
+        # 末尾の「〜の対策」などの共通部分を取り除く
+        segments = [s.split("の")[0] or s for s in segments]
+
+        queries = [query]
+        for keyword in segments:
+            sub_query = f"{context} {keyword}".strip()
+            if len(segments) > 1 and sub_query not in queries:
+                queries.append(sub_query)
+            for term in self._related_terms(keyword)[:1]:
+                expanded = f"{context} {term}".strip()
+                if expanded not in queries:
+                    queries.append(expanded)
+
+        return queries[:self.max_queries]
+
+    def expand_with_llm(self, query: str, openai_client, deployment_name: str) -> List[str]:
+        """
+        LLMで発話をサブクエリに分解（軽い呼び出し1回、失敗時はローカルの分解を使う）
+
+        Args:
+            query: ユーザーの発話
+            openai_client: AzureOpenAIクライアント
+            deployment_name: デプロイメント名
+
+        Returns:
+            サブクエリのリスト（先頭は元のクエリ）
+        """
+        try:
+            response = openai_client.chat.completions.create(
+                model=deployment_name,
+                messages=[
+                    {"role": "system", "content": (
+                        "建設技術の検索クエリを、含まれる要望ごとの短い検索クエリに分解してください。"
+                        f"JSON配列のみを返し、最大{self.max_queries - 1}件にしてください。"
+                    )},
+                    {"role": "user", "content": query}
+                ],
+                temperature=0,
+                max_tokens=150
+            )
+            sub_queries = json.loads(response.choices[0].message.content or "[]")
+        except Exception:
+            return self.expand(query)
+
+        queries = [query]
+        for sub_query in sub_queries if isinstance(sub_queries, list) else []:
+            if isinstance(sub_query, str) and sub_query.strip() and sub_query not in queries:
+                queries.append(sub_query.strip())
+        return queries[:self.max_queries]
+
+
+def reciprocal_rank_fusion(
+    result_lists: Iterable[List[Dict[str, Any]]],
+    top: int = 10,
+    k: int = RRF_K,
+    offset: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    複数の検索結果をReciprocal Rank Fusionで統合
+
+    Args:
+        result_lists: サブクエリごとの検索結果
+        top: 返す件数
+        k: RRFの定数（大きいほど下位の結果も重視）
+        offset: 各リストの先頭の順位のずれ（skipして取得した続きのページを統合する場合）
+
+    Returns:
+        統合した検索結果（scoreはRRFスコア）
+    """
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, offset + 1):
+            doc_id = result["id"]
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+            documents.setdefault(doc_id, result)
+
+    ranked = sorted(scores, key=lambda doc_id: -scores[doc_id])[:top]
+    return [dict(documents[doc_id], score=scores[doc_id]) for doc_id in ranked]
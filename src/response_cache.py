@@ -0,0 +1,70 @@
+"""
+同じ検索結果・同じ質問に対するチャット応答を再利用するキャッシュ
+"""
+from typing import List, Dict, Any, Optional
+import hashlib
+import json
+from src.search_cache import LRUCache, normalize_query
+
+
+class ChatResponseCache:
+    """モデル名・正規化したメッセージ・検索結果IDのハッシュをキーに応答を保持するクラス"""
+
+    def __init__(self, max_size: int = 256, ttl: float = 86400, deterministic: bool = True):
+        """
+        初期化
+
+        Args:
+            max_size: 保持する最大件数
+            ttl: 有効期限（秒）
+            deterministic: キャッシュ対象の呼び出しをtemperature 0で行うか
+        """
+        self.cache = LRUCache(max_size=max_size, ttl=ttl)
+        self.deterministic = deterministic
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]], result_ids: List[str]) -> str:
+        """
+        キャッシュキーを作成
+
+        Args:
+            model: デプロイメント名
+            messages: API送信用のメッセージ
+            result_ids: 直前の検索結果のドキュメントID
+
+        Returns:
+            SHA-256のハッシュ文字列
+        """
+        payload = {
+            "model": model,
+            "messages": [
+                [m.get("role", ""), normalize_query(m.get("content") or "")] for m in messages
+            ],
+            "result_ids": list(result_ids)
+        }
+        encoded = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """キャッシュされた応答を取得（無ければNone）"""
+        return self.cache.get(key)
+
+    def put(self, key: str, response: str):
+        """応答をキャッシュに格納"""
+        if response:
+            self.cache.put(key, response)
+
+    def clear(self):
+        """キャッシュを全削除"""
+        self.cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        統計情報を取得
+
+        Returns:
+            ヒット率などの辞書
+        """
+        stats = self.cache.stats()
+        stats["deterministic"] = self.deterministic
+        return stats
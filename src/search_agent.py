@@ -5,17 +5,388 @@ from azure.core.credentials import AzureKeyCredential
 from azure.search.documents import SearchClient
 from azure.search.documents.models import VectorizedQuery
 from openai import AzureOpenAI
-from typing import List, Dict, Any, Optional
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 import os
+import json
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from pathlib import Path
 from dotenv import load_dotenv
-from src.embedding_generator import EmbeddingGenerator
+from src.embedding_generator import create_embedding_generator
+from src.facet_counter import FacetCounter, count_result_facets
+from src.search_cache import LRUCache, IndexVersionWatcher, normalize_query
+from src.semantic_cache import SemanticQueryCache
+from src.conversation_memory import ConversationMemory
+from src.context_packer import pack_results_for_llm, format_results_for_display
+from src.intent_router import IntentRouter, INTENT_SEARCH, INTENT_DETAIL, INTENT_COMPARE
+from src.followup_handler import plan_followup, render_followup
+from src.response_cache import ChatResponseCache
+from src.agent_tools import AgentToolExecutor, TOOL_DEFINITIONS, TOOL_USAGE_PROMPT
+from src.query_expander import QueryExpander, reciprocal_rank_fusion
+from src.diversifier import mmr_rerank
+from src.similarity_graph import SimilarityGraph
+from src.passage_chunker import aggregate_passage_hits
+from src import tracing
+from src import metrics
+
+
+# data_processorが出力する検索ドキュメント（ローカル集計用）
+DEFAULT_DOCUMENTS_PATH = Path(__file__).parent.parent / "data" / "processed" / "netis_documents.json"
+
+# upload_to_search.pyがデータ投入後に書き出すインデックスのバージョンスタンプ
+DEFAULT_INDEX_VERSION_PATH = Path(__file__).parent.parent / "data" / "processed" / "index_version.json"
+
+# upload_to_search.pyが事前計算する類似技術の近傍グラフ
+DEFAULT_SIMILARITY_GRAPH_PATH = Path(__file__).parent.parent / "data" / "processed" / "similar_technologies.npz"
+
+# システムプロンプト（動的な値を含めず、プロンプトキャッシュの共通先頭部分にする）
+SYSTEM_PROMPT = """あなたはNETIS（新技術情報提供システム）の検索アシスタントです。
+建設業従事者が適切な新技術を見つけるお手伝いをします。
+
+【役割】
+1. ユーザーの質問から適切な検索クエリを判断する
+2. 検索結果を分かりやすく提示する
+3. フォローアップ質問で絞り込みをサポートする
+4. 技術の詳細について質問されたら、該当技術の詳細情報を提供する
+5. 技術の比較を求められたら、複数技術を比較して提示する
+
+【対応パターン】
+- 「〜の技術を探している」→ 検索を実行して結果を提示
+- 「もっと絞り込みたい」→ 分類や条件での絞り込みを提案
+- 「N番目について詳しく」→ 該当技術の詳細を表示
+- 「AとBを比較して」→ 2つの技術を比較
+
+【検索結果の形式】
+- 各技術は「#番号 [NETIS登録番号] 技術名」で示される
+- 技術に言及する際は #番号 と技術名を使う（URLは画面の検索結果欄に表示される）
+
+【出力形式】
+- 初回検索: 技術名 + 概要（最大10件）
+- 詳細表示: 適用条件、留意事項、新規性なども含める
+- フォローアップ質問を自然に提案する"""
+
+# パッセージ検索で結果1件あたりに取得するパッセージ数
+PASSAGE_CANDIDATES_PER_RESULT = 5
+
+# search()のmodeに指定できる検索方式
+SEARCH_MODES = ("hybrid", "vector", "keyword")
+
+# 一覧表示用に検索時に取得するフィールド
+LIST_FIELDS = [
+    "id", "tech_name", "abstract", "url",
+    "category1", "category2", "category3",
+    "evaluation", "subtitle"
+]
+
+# 詳細表示時にIDで遅延取得する長文フィールド
+DETAIL_FIELDS = ["overview", "innovation", "conditions", "scope", "notes"]
+
+
+class SearchCursor:
+    """検索結果をページ単位で順に取得するカーソル（取得済みページは保持しない）"""
+
+    def __init__(
+        self,
+        agent: "NETISSearchAgent",
+        query: str,
+        query_vector: Optional[List[float]] = None,
+        page_size: int = 20,
+        filters: Optional[str] = None,
+        max_results: int = 1000,
+        skip: int = 0,
+        mode: str = "hybrid",
+        expand: str = "off",
+        diversify: bool = False,
+        passages: bool = False,
+        k_nearest_neighbors: Optional[int] = None,
+        sub_queries: Optional[List[str]] = None,
+        sub_vectors: Optional[List[List[float]]] = None,
+        seen_ids: Optional[List[str]] = None,
+        can_fetch: bool = True
+    ):
+        """
+        初期化
+
+        Args:
+            agent: 検索を発行するエージェント
+            query: 検索クエリ
+            query_vector: クエリのエンベディング（全ページで再利用、省略時は最初の取得時に1回だけ生成）
+            page_size: 1ページの件数
+            filters: ODataフィルタ式
+            max_results: 取得する最大件数（ランキングの先頭からの件数）
+            skip: 開始位置（ランキングの先頭からの件数）
+            mode: 検索方式（hybrid / vector / keyword）
+            expand: サブクエリ展開（"off" / "local" / "llm"）
+            diversify: MMRで多様化するか
+            passages: パッセージインデックスを検索して親ドキュメントに集約するか
+            k_nearest_neighbors: ベクトル検索の候補数（全ページで固定してランキングを変えない、省略時はmax_results）
+            sub_queries: 展開済みのサブクエリ（省略時は最初の取得時に展開）
+            sub_vectors: サブクエリのエンベディング
+            seen_ids: 表示済みのドキュメントID（重複除外用）
+            can_fetch: 続きを取得できるか（キャッシュから再開する場合に指定）
+        """
+        self.agent = agent
+        self.query = query
+        self.query_vector = query_vector
+        self.page_size = page_size
+        self.filters = filters
+        self.max_results = max_results
+        self.skip = skip
+        self.mode = mode
+        self.expand = expand
+        self.diversify = diversify
+        self.passages = passages
+        self.k_nearest_neighbors = k_nearest_neighbors or max_results
+        self.sub_queries = sub_queries
+        self.sub_vectors = sub_vectors
+        self.seen_ids = set(seen_ids or [])
+        self.seen_clusters = set()
+        self._can_fetch = can_fetch and skip < max_results
+        # 取得済みでまだ返していない候補（関連度順、折りたたみ済み、MMR用のベクトルを含む）
+        self._pending: List[Dict[str, Any]] = []
+
+    @property
+    def has_more(self) -> bool:
+        """未取得・未返却の結果が残っているか"""
+        return self._can_fetch or bool(self._pending)
+
+    @property
+    def window_size(self) -> int:
+        """1回の取得で読む候補数（折りたたみ・MMRは1ページより大きい候補から選ぶ）"""
+        size = self.page_size * 2 if self.agent.collapse_clusters else self.page_size
+        if self.diversify:
+            size = max(size, self.agent.mmr_pool_size)
+        return size
+
+    def next_page(self) -> List[Dict[str, Any]]:
+        """
+        次のページを取得
+
+        Returns:
+            検索結果のリスト（末尾に達した場合は空リスト）
+        """
+        page: List[Dict[str, Any]] = []
+        while len(page) < self.page_size:
+            # 表示済み・折りたたみで除いた分が足りなければ続けて取得する
+            while self._can_fetch and len(self._pending) < self.page_size - len(page):
+                self._fetch()
+            if not self._pending:
+                break
+            page.extend(self._take(self.page_size - len(page)))
+        return page
+
+    def _fetch(self):
+        """ランキングの続きをskip件目から1回分取得して未返却の候補に加える"""
+        agent = self.agent
+        if self.sub_queries is None:
+            self.sub_queries = agent._expand_query(self.query, self.expand)
+        if self.query_vector is None:
+            with tracing.span("search.embedding", inputs=len(self.sub_queries)):
+                if len(self.sub_queries) > 1:
+                    self.sub_vectors = agent.embedding_generator.generate_embeddings(self.sub_queries)
+                    self.query_vector = self.sub_vectors[0]
+                else:
+                    self.query_vector = agent.embedding_generator.generate_embedding(self.query)
+
+        top = min(self.window_size, self.max_results - self.skip)
+        if len(self.sub_queries) > 1:
+            results, exhausted = agent._execute_expanded_search(
+                self.sub_queries, self.sub_vectors, top=top, filters=self.filters, skip=self.skip,
+                k_nearest_neighbors=self.k_nearest_neighbors, include_vectors=self.diversify, mode=self.mode
+            )
+        elif self.passages:
+            results, exhausted = agent._execute_passage_search(
+                self.query, self.query_vector, top=top, skip=self.skip,
+                k_nearest_neighbors=self.k_nearest_neighbors
+            )
+        else:
+            results = agent._execute_search(
+                self.query, self.query_vector, top=top, filters=self.filters, skip=self.skip,
+                k_nearest_neighbors=self.k_nearest_neighbors, include_vectors=self.diversify, mode=self.mode
+            )
+            exhausted = len(results) < top
+
+        self.skip += top
+        if exhausted or self.skip >= self.max_results:
+            self._can_fetch = False
+
+        pending_ids = {r["id"] for r in self._pending}
+        for result in results:
+            if result["id"] in self.seen_ids or result["id"] in pending_ids:
+                continue
+            if result.get("cluster_id") in self.seen_clusters:
+                continue
+            pending_ids.add(result["id"])
+            self._pending.append(result)
+        if agent.collapse_clusters:
+            self._pending = agent._collapse_clusters(self._pending)
+
+    def _take(self, count: int) -> List[Dict[str, Any]]:
+        """未返却の候補から最大count件を選んで返す（多様化する場合はMMRで選ぶ）"""
+        vectors = [r.get("vector") for r in self._pending]
+        if self.diversify and all(v is not None for v in vectors):
+            selected = mmr_rerank(
+                self.query_vector, np.stack(vectors), top=count,
+                lambda_mult=self.agent.mmr_lambda, normalized=True
+            )
+        else:
+            # ベクトルが取得できなかった場合は関連度順のまま返す
+            selected = list(range(min(count, len(self._pending))))
+
+        chosen = set(selected)
+        taken = [self._pending[i] for i in selected]
+        self._pending = [r for i, r in enumerate(self._pending) if i not in chosen]
+        for result in taken:
+            result.pop("vector", None)
+            self.seen_ids.add(result["id"])
+            if result.get("cluster_id"):
+                self.seen_clusters.add(result["cluster_id"])
+        return taken
+
+    def __iter__(self) -> Iterator[List[Dict[str, Any]]]:
+        """残りのページを順に返す"""
+        while self.has_more:
+            page = self.next_page()
+            if page:
+                yield page
+
+
+# /metricsではプロセス内の全キャッシュのヒット数・ミス数を合計して出力する
+_all_caches: "weakref.WeakSet[AgentCaches]" = weakref.WeakSet()
+
+
+class AgentCaches:
+    """同じインデックスを検索するエージェント（Streamlitの全セッション）で共有するキャッシュ"""
+
+    def __init__(self, dimensions: Optional[int] = None):
+        """
+        初期化
+
+        Args:
+            dimensions: セマンティックキャッシュのベクトル次元数（省略時は最初に格納したベクトルに合わせる）
+        """
+        # 検索結果キャッシュ（キーにインデックスのバージョンを含め、バージョンが変わったら破棄）
+        self.search = LRUCache(max_size=int(os.getenv('NETIS_SEARCH_CACHE_SIZE', '256')))
+        self.index_version = IndexVersionWatcher(
+            os.getenv('NETIS_INDEX_VERSION_PATH', str(DEFAULT_INDEX_VERSION_PATH))
+        )
+        self._version_lock = threading.Lock()
+
+        # 類似クエリのセマンティックキャッシュ（NETIS_SEMANTIC_CACHE=1で有効化）
+        # 別のクエリの結果を近似で返すため既定では無効
+        self.semantic: Optional[SemanticQueryCache] = None
+        if os.getenv('NETIS_SEMANTIC_CACHE', '0') == '1':
+            self.semantic = SemanticQueryCache(
+                capacity=int(os.getenv('NETIS_SEMANTIC_CACHE_SIZE', '128')),
+                dimensions=dimensions,
+                threshold=float(os.getenv('NETIS_SEMANTIC_CACHE_THRESHOLD', '0.95')),
+                audit_rate=float(os.getenv('NETIS_SEMANTIC_CACHE_AUDIT_RATE', '0.05')),
+                reuse_responses=os.getenv('NETIS_SEMANTIC_CACHE_REUSE_RESPONSES', '0') == '1'
+            )
+
+        # 詳細フィールドのキャッシュ（(インデックスのバージョン, ドキュメントID) → 長文フィールド）
+        self.details = LRUCache(max_size=int(os.getenv('NETIS_DETAIL_CACHE_SIZE', '512')))
+
+        # チャット応答キャッシュ（NETIS_RESPONSE_CACHE=1で有効化、有効時はtemperature 0で生成）
+        self.responses: Optional[ChatResponseCache] = None
+        if os.getenv('NETIS_RESPONSE_CACHE', '0') == '1':
+            self.responses = ChatResponseCache(
+                max_size=int(os.getenv('NETIS_RESPONSE_CACHE_SIZE', '256')),
+                ttl=float(os.getenv('NETIS_RESPONSE_CACHE_TTL', '86400')),
+                deterministic=os.getenv('NETIS_RESPONSE_CACHE_DETERMINISTIC', '1') == '1'
+            )
+        _all_caches.add(self)
+
+    def check_index_version(self) -> str:
+        """
+        スタンプファイルを確認し、インデックスが再投入されていればキャッシュを破棄
+
+        Returns:
+            現在のインデックスのバージョン
+        """
+        with self._version_lock:
+            if self.index_version.changed():
+                self.search.clear()
+                self.details.clear()
+                if self.semantic is not None:
+                    self.semantic.clear()
+                if self.responses is not None:
+                    self.responses.clear()
+            return self.index_version.version
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        キャッシュの統計情報を取得（このキャッシュを共有する全エージェントの合計）
+
+        Returns:
+            キャッシュ種別ごとの統計情報
+        """
+        stats = {
+            "index_version": self.index_version.version,
+            "search": self.search.stats(),
+            "details": self.details.stats()
+        }
+        if self.semantic is not None:
+            stats["semantic"] = self.semantic.stats()
+        if self.responses is not None:
+            stats["responses"] = self.responses.stats()
+        return stats
+
+
+def collect_cache_stats():
+    """プロセス内の全キャッシュのヒット数・ミス数を合計してメトリクスに設定"""
+    totals: Dict[str, Dict[str, Any]] = {}
+    for caches in list(_all_caches):
+        for name, values in caches.stats().items():
+            if isinstance(values, dict) and "hits" in values:
+                total = totals.setdefault(name, {"hits": 0, "misses": 0})
+                total["hits"] += values["hits"]
+                total["misses"] += values["misses"]
+    for total in totals.values():
+        lookups = total["hits"] + total["misses"]
+        total["hit_ratio"] = total["hits"] / lookups if lookups else 0.0
+    metrics.observe_cache_stats(totals)
+
+
+metrics.REGISTRY.register_collector("agent_caches", collect_cache_stats)
+
+
+_shared_caches: Dict[str, AgentCaches] = {}
+_shared_caches_lock = threading.Lock()
+
+
+def shared_caches(index_name: str, dimensions: Optional[int] = None) -> AgentCaches:
+    """
+    プロセス内で共有するキャッシュを取得（インデックスごとに1つ、最初の呼び出し時の環境変数で作成）
+
+    Args:
+        index_name: 検索するインデックス名
+        dimensions: セマンティックキャッシュのベクトル次元数
+
+    Returns:
+        AgentCaches
+    """
+    with _shared_caches_lock:
+        if index_name not in _shared_caches:
+            _shared_caches[index_name] = AgentCaches(dimensions)
+        return _shared_caches[index_name]
 
 
 class NETISSearchAgent:
     """NETIS技術検索エージェント"""
 
-    def __init__(self):
-        """初期化"""
+    def __init__(self, caches: Optional[AgentCaches] = None):
+        """
+        初期化
+
+        Args:
+            caches: 共有するキャッシュ（省略時はプロセス内でインデックスごとに共有するshared_caches()）
+        """
         load_dotenv()
 
         # Azure Search設定
@@ -42,77 +413,706 @@ class NETISSearchAgent:
             azure_endpoint=self.openai_endpoint
         )
 
-        self.embedding_generator = EmbeddingGenerator()
+        self.embedding_generator = create_embedding_generator()
+
+        # パッセージ単位の検索（NETIS_PASSAGE_SEARCH=max/sumで有効化、upload_to_search.py --passagesで投入）
+        self.passage_aggregation = os.getenv('NETIS_PASSAGE_SEARCH', 'off')
+        self.passage_client: Optional[SearchClient] = None
+        if self.passage_aggregation in ('max', 'sum'):
+            self.passage_client = SearchClient(
+                endpoint=self.search_endpoint,
+                index_name=f"{self.index_name}-passages",
+                credential=AzureKeyCredential(self.search_api_key)
+            )
+
+        # 複数の要望を含む発話のサブクエリ展開（NETIS_QUERY_EXPANSION=local/llm、既定はoff）
+        self.query_expansion = os.getenv('NETIS_QUERY_EXPANSION', 'off')
+
+        # ファセット集計・類似技術・サブクエリ展開に使うローカルデータ（インデックスの再投入時に読み直す）
+        self.facet_counter: Optional[FacetCounter] = None
+        self.list_rows: Dict[str, Dict[str, Any]] = {}
+        self.similarity_graph: Optional[SimilarityGraph] = None
+        self.query_expander: Optional[QueryExpander] = None
+        self._load_local_data()
+        self.last_sub_queries: List[str] = []
+
+        # 類似した製品の重複を抑えるMMR再ランキング（NETIS_MMR=1で有効化）
+        self.diversify = os.getenv('NETIS_MMR', '0') == '1'
+        self.mmr_pool_size = int(os.getenv('NETIS_MMR_POOL_SIZE', '50'))
+        self.mmr_lambda = float(os.getenv('NETIS_MMR_LAMBDA', '0.7'))
+
+        # 検索方式（hybrid / vector / keyword、評価・比較用にNETIS_SEARCH_MODEで切り替え）
+        self.search_mode = os.getenv('NETIS_SEARCH_MODE', 'hybrid')
+        if self.search_mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {self.search_mode}")
+
+        # ほぼ同一のドキュメント（同じcluster_id）を1件に折りたたむ
+        # （NETIS_COLLAPSE_CLUSTERS=1で有効化、cluster_idを含むインデックスの再投入が必要）
+        self.collapse_clusters = os.getenv('NETIS_COLLAPSE_CLUSTERS', '0') == '1'
+
+        # 「さらに読み込む」で辿れる件数（ベクトル検索の候補数もこの値に固定し、全ページを同じ順位付けで取得する）
+        self.paging_depth = int(os.getenv('NETIS_PAGING_DEPTH', '100'))
+        self.last_cursor: Optional[SearchCursor] = None
+
+        # 検索結果・詳細・類似クエリ・チャット応答のキャッシュ（全セッションで共有）
+        self.caches = caches or shared_caches(
+            self.index_name, dimensions=getattr(self.embedding_generator, 'dimensions', None)
+        )
+        self.search_cache = self.caches.search
+        self.detail_cache = self.caches.details
+        self.semantic_cache = self.caches.semantic
+        self.response_cache = self.caches.responses
+        self.index_version = self.caches.index_version
+        self._local_data_version = self.index_version.version
+        self.last_semantic_hit: Optional[Dict[str, Any]] = None
+        self.last_semantic_slot: Optional[Tuple[int, str]] = None
 
-        # 会話履歴
-        self.conversation_history: List[Dict[str, str]] = []
+        # 会話履歴（トークン予算で管理、NETIS_HISTORY_SUMMARIZE=1で古いターンを要約）
+        summarize = os.getenv('NETIS_HISTORY_SUMMARIZE', '0') == '1'
+        self.memory = ConversationMemory(
+            token_budget=int(os.getenv('NETIS_HISTORY_TOKEN_BUDGET', '4000')),
+            max_entries=int(os.getenv('NETIS_HISTORY_MAX_ENTRIES', '50')),
+            summarizer=self._summarize_history if summarize else None
+        )
         self.last_search_results: List[Dict[str, Any]] = []
 
+        # ツール呼び出しモード（NETIS_AGENT_MODE=toolsで検索の要否をモデルに任せる）
+        self.agent_mode = os.getenv('NETIS_AGENT_MODE', 'router')
+        self.max_tool_rounds = int(os.getenv('NETIS_MAX_TOOL_ROUNDS', '3'))
+        self.tool_executor = AgentToolExecutor(self)
+        self.last_tool_timings: List[Dict[str, Any]] = []
+
+        # 発話の意図判定（ローカルで完結）
+        self.intent_router = IntentRouter()
+
+        # チャット呼び出しごとのトークン使用量（プロンプトキャッシュの効果確認用）
+        self.usage_log = deque(maxlen=int(os.getenv('NETIS_USAGE_LOG_SIZE', '200')))
+        self.last_usage: Dict[str, Any] = {}
+        self.last_facets: Dict[str, List[Dict[str, Any]]] = {}
+
+    def _load_local_data(self):
+        """upload_to_search.pyが書き出すローカルの検索ドキュメントと近傍グラフを読み込む"""
+        # ファセット集計（ローカルJSONがあれば事前計算した分類コードで集計）
+        documents_path = Path(os.getenv('NETIS_DOCUMENTS_PATH', str(DEFAULT_DOCUMENTS_PATH)))
+        facet_counter = None
+        list_rows = {}
+        if documents_path.exists():
+            with open(documents_path, 'r', encoding='utf-8') as f:
+                documents = json.load(f)
+            facet_counter = FacetCounter(documents)
+            # 類似技術の表示用に一覧フィールドだけ保持
+            list_rows = {
+                doc["id"]: {field: doc.get(field, "") or "" for field in LIST_FIELDS}
+                for doc in documents
+            }
+
+        # 類似技術の近傍グラフ（upload_to_search.pyで事前計算）
+        graph_path = Path(os.getenv('NETIS_SIMILARITY_GRAPH_PATH', str(DEFAULT_SIMILARITY_GRAPH_PATH)))
+        similarity_graph = SimilarityGraph.load(str(graph_path)) if graph_path.exists() else None
+
+        # サブクエリ展開で分割の手がかりにする分類名
+        category_values = []
+        if facet_counter is not None:
+            for field in ["category1", "category2", "category3", "category4", "category5"]:
+                category_values.extend(facet_counter.vocab.get(field, []))
+        query_expander = QueryExpander(
+            category_values, max_queries=int(os.getenv('NETIS_QUERY_EXPANSION_MAX', '4'))
+        )
+
+        # 読み込みが終わってから差し替え、並行する検索が読み込み途中のデータを見ないようにする
+        self.facet_counter = facet_counter
+        self.list_rows = list_rows
+        self.similarity_graph = similarity_graph
+        self.query_expander = query_expander
+
+    def _refresh_index_version(self) -> str:
+        """
+        インデックスが再投入されていれば共有キャッシュを破棄し、ローカルデータも読み直す
+        （netis_XXXXのIDは行番号から振るため、古いデータのままだと別の技術を返す）
+
+        Returns:
+            現在のインデックスのバージョン
+        """
+        version = self.caches.check_index_version()
+        if version != self._local_data_version:
+            self._load_local_data()
+            self._local_data_version = version
+        return version
+
     def search(
         self,
         query: str,
         top: int = 10,
-        filters: Optional[str] = None
+        filters: Optional[str] = None,
+        facets: Optional[List[str]] = None,
+        expand: Optional[str] = None,
+        diversify: Optional[bool] = None,
+        mode: Optional[str] = None,
+        record: bool = True
     ) -> List[Dict[str, Any]]:
         """
-        ハイブリッド検索を実行
+        検索を実行し、最初のページ（top件）を返す
+
+        modeに応じてハイブリッド（全文検索＋ベクトル）・ベクトルのみ・全文検索のみで検索する。
+        expandを指定するとサブクエリごとに検索してRRFで統合し、diversifyではMMRで多様化する。
+        NETIS_COLLAPSE_CLUSTERS=1ではほぼ同一の登録技術を1件にまとめ、パッセージ索引がある場合の
+        フィルタなしのハイブリッド検索ではパッセージ単位で検索して技術ごとにまとめる。
+        結果はインデックスのバージョンをキーにしたキャッシュ（完全一致・セマンティック）を共有する。
+        続きのページはrecord=Trueの場合にself.last_cursor（SearchCursor）のnext_page()で取得する。
 
         Args:
             query: 検索クエリ
-            top: 取得件数
+            top: 取得件数（1ページの件数）
             filters: ODataフィルタ式
+            facets: 件数を集計するフィールド（返した結果の中での件数、結果はself.last_facetsに格納）
+            expand: サブクエリ展開（"off" / "local" / "llm"、省略時はself.query_expansion）
+            diversify: MMRで多様化するか（省略時はself.diversify）
+            mode: "hybrid" / "vector"（ベクトルのみ） / "keyword"（全文検索のみ）、省略時はself.search_mode
+            record: 結果・ファセット・続きのページのカーソルなどをself.last_*に記録するか
+                    （同じエージェントで並列に検索するツール呼び出し・評価ではFalse）
 
         Returns:
             検索結果のリスト
         """
-        # クエリのエンベディングを生成
-        query_vector = self.embedding_generator.generate_embedding(query)
+        with tracing.span("search", query_chars=len(query), top=top, filters=bool(filters)) as span:
+            outcome = self._search(query, top, filters, facets, expand, diversify, mode)
+            span.set(results=len(outcome["results"]))
+
+        if record:
+            self.last_search_results = outcome["results"]
+            self.last_facets = outcome["facets"]
+            self.last_sub_queries = outcome["sub_queries"]
+            self.last_semantic_hit = outcome["semantic_hit"]
+            self.last_semantic_slot = outcome["semantic_slot"]
+            self.last_cursor = outcome["cursor"]
+        return outcome["results"]
+
+    def _search(
+        self,
+        query: str,
+        top: int,
+        filters: Optional[str],
+        facets: Optional[List[str]],
+        expand: Optional[str],
+        diversify: Optional[bool],
+        mode: Optional[str]
+    ) -> Dict[str, Any]:
+        """
+        search()の本体（キャッシュ参照・エンベディング生成・検索・再ランキング）
+
+        並列に呼ばれても結果が混ざらないよう、エージェントの状態（self.last_*）は更新せず
+        呼び出しごとの値をまとめて返す。
+
+        Returns:
+            {"results", "facets", "sub_queries", "semantic_hit", "semantic_slot"}
+        """
+        # インデックスが再投入されていればキャッシュを破棄し、ローカルデータを読み直す
+        index_version = self._refresh_index_version()
+
+        expand = expand or self.query_expansion
+        diversify = self.diversify if diversify is None else diversify
+        mode = mode or self.search_mode
+        # パッセージインデックスには分類が無いため、フィルタ指定時はドキュメント単位で検索
+        passages = self.passage_client is not None and not filters and mode == "hybrid"
+        outcome = {
+            "results": [], "facets": {}, "sub_queries": [query],
+            "semantic_hit": None, "semantic_slot": None, "cursor": None
+        }
+
+        def resume_cursor(results, resume, query_vector=None):
+            """キャッシュした最初のページの続きから取得するカーソル（エンベディングは必要になったら生成）"""
+            skip, can_fetch = resume
+            cursor = SearchCursor(
+                self, query, query_vector, page_size=top, filters=filters,
+                max_results=self.paging_depth, skip=skip, mode=mode, expand=expand,
+                diversify=diversify, passages=passages, seen_ids=[r["id"] for r in results],
+                can_fetch=can_fetch
+            )
+            cursor.seen_clusters.update(r["cluster_id"] for r in results if r.get("cluster_id"))
+            return cursor
+
+        # 別のセッションからの同じ検索も共有キャッシュにヒットする（古いバージョンの結果には当たらない）
+        scope = (filters or "", top, tuple(facets) if facets else (), expand, diversify, mode)
+        cache_key = (index_version, normalize_query(query)) + scope
+        cached = self.search_cache.get(cache_key)
+        if cached is not None:
+            tracing.current_span().set(cache="exact")
+            cached_results, cached_facets, resume = cached
+            outcome.update(
+                results=[dict(r) for r in cached_results], facets=cached_facets,
+                cursor=resume_cursor(cached_results, resume)
+            )
+            return outcome
+
+        # サブクエリに展開し、全サブクエリのエンベディングを1回のリクエストで生成
+        sub_queries = self._expand_query(query, expand)
+        sub_vectors = None
+        with tracing.span("search.embedding", inputs=len(sub_queries)):
+            if len(sub_queries) > 1:
+                sub_vectors = self.embedding_generator.generate_embeddings(sub_queries)
+                query_vector = sub_vectors[0]
+            else:
+                query_vector = self.embedding_generator.generate_embedding(query)
+        outcome["sub_queries"] = sub_queries
+
+        # 言い換えられた類似クエリの結果があれば再利用
+        audit_entry = None
+        if self.semantic_cache is not None:
+            hit = self.semantic_cache.lookup(query, query_vector, scope)
+            if hit is not None:
+                slot, entry, similarity = hit
+                if not self.semantic_cache.should_audit():
+                    tracing.current_span().set(cache="semantic", similarity=round(float(similarity), 4))
+                    cached_facets = entry["extra"].get("facets", {})
+                    resume = entry["extra"].get("resume", (0, True))
+                    self.search_cache.put(cache_key, (entry["results"], cached_facets, resume))
+                    outcome.update(
+                        results=[dict(r) for r in entry["results"]], facets=cached_facets,
+                        semantic_hit=entry, semantic_slot=(slot, entry["query"]),
+                        cursor=resume_cursor(entry["results"], resume, query_vector)
+                    )
+                    return outcome
+                audit_entry = entry
+
+        # 最初のページも「さらに読み込む」と同じカーソルから取得し、続きのページの順位付けをそろえる
+        # （多様化・重複の折りたたみを行う場合は大きめの候補から選ぶ）
+        cursor = SearchCursor(
+            self, query, query_vector, page_size=top, filters=filters,
+            max_results=self.paging_depth, mode=mode, expand=expand, diversify=diversify,
+            passages=passages, sub_queries=sub_queries, sub_vectors=sub_vectors
+        )
+        formatted_results = cursor.next_page()
+        facet_results = self._count_facets(formatted_results, facets)
+        outcome["cursor"] = cursor
+        # キャッシュには続きの取得位置だけ残す（1回分の候補のうち返さなかった分は再開時には使わない）
+        resume = (cursor.skip, cursor.has_more)
+
+        # 監査対象のヒットは実検索の結果と照合して記録
+        if audit_entry is not None:
+            self.semantic_cache.record_audit(query, audit_entry, formatted_results)
+
+        cached_results = [dict(r) for r in formatted_results]
+        self.search_cache.put(cache_key, (cached_results, facet_results, resume))
+        if self.semantic_cache is not None:
+            slot = self.semantic_cache.add(
+                query, query_vector, cached_results,
+                scope=scope, extra={"facets": facet_results, "resume": resume}
+            )
+            outcome["semantic_slot"] = (slot, query)
+
+        outcome.update(results=formatted_results, facets=facet_results)
+        return outcome
+
+    @staticmethod
+    def _collapse_clusters(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        同じクラスタの結果は最上位の1件だけ残す（残した結果のduplicatesに折りたたんだ件数を記録）
+
+        Args:
+            results: cluster_id付きの検索結果（関連度順）
+
+        Returns:
+            折りたたんだ検索結果
+        """
+        collapsed = []
+        kept: Dict[str, Dict[str, Any]] = {}
+        for result in results:
+            cluster_id = result.get("cluster_id") or result["id"]
+            if cluster_id in kept:
+                kept[cluster_id]["duplicates"] = kept[cluster_id].get("duplicates", 0) + 1
+                continue
+            kept[cluster_id] = result
+            collapsed.append(result)
+        return collapsed
+
+    def _expand_query(self, query: str, mode: str) -> List[str]:
+        """
+        検索クエリをサブクエリに展開（先頭は元のクエリ）
+
+        Args:
+            query: 検索クエリ
+            mode: "off" / "local" / "llm"
+
+        Returns:
+            サブクエリのリスト
+        """
+        if mode == "local":
+            return self.query_expander.expand(query)
+        if mode == "llm":
+            return self.query_expander.expand_with_llm(query, self.openai_client, self.deployment_name)
+        return [query]
+
+    def _execute_expanded_search(
+        self,
+        sub_queries: List[str],
+        sub_vectors: List[List[float]],
+        top: int = 10,
+        filters: Optional[str] = None,
+        skip: int = 0,
+        k_nearest_neighbors: Optional[int] = None,
+        include_vectors: bool = False,
+        mode: str = "hybrid"
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        サブクエリごとの検索を並列に発行し、Reciprocal Rank Fusionで統合する
+
+        待ち時間は最も遅いサブクエリ1回分に収まる。
+
+        Args:
+            sub_queries: サブクエリ（先頭は元のクエリ）
+            sub_vectors: サブクエリのエンベディング
+            top: サブクエリごとの取得件数
+            filters: ODataフィルタ式
+            skip: サブクエリごとに読み飛ばす件数（ページング用）
+            k_nearest_neighbors: ベクトル検索の候補数
+            include_vectors: 結果にエンベディング（"vector"）を含めるか
+            mode: 検索方式（hybrid / vector / keyword）
+
+        Returns:
+            (統合した検索結果のリスト, 全サブクエリの結果が末尾に達したか)
+        """
+        with ThreadPoolExecutor(max_workers=len(sub_queries)) as executor:
+            futures = [
+                executor.submit(
+                    copy_context().run, self._execute_search, sub_query, vector, top=top, filters=filters,
+                    skip=skip, k_nearest_neighbors=k_nearest_neighbors,
+                    include_vectors=include_vectors, mode=mode
+                )
+                for sub_query, vector in zip(sub_queries, sub_vectors)
+            ]
+            outcomes = [future.result() for future in futures]
+
+        # 2ページ目以降は順位をskipだけずらして、先頭から統合した場合と同じRRFスコアにする
+        fused = reciprocal_rank_fusion(outcomes, top=sum(len(results) for results in outcomes), offset=skip)
+
+        return fused, all(len(results) < top for results in outcomes)
+
+    def _execute_passage_search(
+        self,
+        query: str,
+        query_vector: List[float],
+        top: int = 10,
+        skip: int = 0,
+        k_nearest_neighbors: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        パッセージインデックスをハイブリッド検索し、ヒットを親ドキュメントに集約する
+
+        Args:
+            query: 検索クエリ
+            query_vector: クエリのエンベディング
+            top: 取得するドキュメント数（パッセージはその PASSAGE_CANDIDATES_PER_RESULT 倍）
+            skip: 読み飛ばすドキュメント数（ページング用、パッセージも同じ倍率で読み飛ばす）
+            k_nearest_neighbors: ベクトル検索の候補数（ドキュメント数、省略時はskip + top）
+
+        Returns:
+            (検索結果のリスト（scoreは集約スコア、集約したドキュメントはすべて含む）, パッセージが末尾に達したか)
+        """
+        passages = top * PASSAGE_CANDIDATES_PER_RESULT
+        vector_query = VectorizedQuery(
+            vector=query_vector,
+            k_nearest_neighbors=(k_nearest_neighbors or skip + top) * PASSAGE_CANDIDATES_PER_RESULT,
+            fields="content_vector"
+        )
+        with tracing.span("search.passages", top=passages, skip=skip) as span:
+            hits = [
+                {"parent_id": hit["parent_id"], "score": hit.get("@search.score", 0)}
+                for hit in self.passage_client.search(
+                    search_text=query,
+                    vector_queries=[vector_query],
+                    top=passages,
+                    skip=skip * PASSAGE_CANDIDATES_PER_RESULT or None,
+                    select=["parent_id"]
+                )
+            ]
+            span.set(passages=len(hits))
+
+        ranked = aggregate_passage_hits(hits, mode=self.passage_aggregation, top=len(hits))
+        rows = self._get_list_rows([parent_id for parent_id, _ in ranked])
+        formatted_results = [
+            dict(rows[parent_id], score=score)
+            for parent_id, score in ranked
+            if parent_id in rows
+        ]
+
+        return formatted_results, len(hits) < passages
+
+    def _execute_search(
+        self,
+        query: str,
+        query_vector: List[float],
+        top: int = 10,
+        filters: Optional[str] = None,
+        skip: int = 0,
+        k_nearest_neighbors: Optional[int] = None,
+        include_vectors: bool = False,
+        mode: str = "hybrid"
+    ) -> List[Dict[str, Any]]:
+        """
+        Azure AI Searchにハイブリッド検索を1回発行する
 
+        Args:
+            query: 検索クエリ
+            query_vector: クエリのエンベディング
+            top: 取得件数
+            filters: ODataフィルタ式
+            skip: 読み飛ばす件数（ページング用）
+            k_nearest_neighbors: ベクトル検索の候補数（省略時はskip + top）
+            include_vectors: 結果にエンベディング（"vector"）を含めるか（MMR用）
+            mode: "hybrid" / "vector"（search_textを渡さない） / "keyword"（vector_queriesを渡さない）
+
+        Returns:
+            検索結果のリスト
+        """
         # ベクトル検索クエリを作成
         vector_query = VectorizedQuery(
             vector=query_vector,
-            k_nearest_neighbors=top,
+            k_nearest_neighbors=k_nearest_neighbors or skip + top,
             fields="searchable_text_vector"
         )
 
-        # ハイブリッド検索実行
-        results = self.search_client.search(
-            search_text=query,
-            vector_queries=[vector_query],
-            filter=filters,
-            top=top,
-            select=[
-                "id", "tech_name", "abstract", "url", "overview",
-                "innovation", "conditions", "scope", "notes",
-                "category1", "category2", "category3",
-                "evaluation", "subtitle"
-            ]
-        )
+        select = list(LIST_FIELDS)
+        if self.collapse_clusters:
+            select.append("cluster_id")
+        if include_vectors:
+            select.append("searchable_text_vector")
 
-        # 結果を整形
-        formatted_results = []
-        for result in results:
-            formatted_results.append({
-                "id": result.get("id", ""),
-                "tech_name": result.get("tech_name", ""),
-                "abstract": result.get("abstract", ""),
-                "url": result.get("url", ""),
-                "overview": result.get("overview", ""),
-                "innovation": result.get("innovation", ""),
-                "conditions": result.get("conditions", ""),
-                "scope": result.get("scope", ""),
-                "notes": result.get("notes", ""),
-                "category1": result.get("category1", ""),
-                "category2": result.get("category2", ""),
-                "category3": result.get("category3", ""),
-                "evaluation": result.get("evaluation", ""),
-                "subtitle": result.get("subtitle", ""),
-                "score": result.get("@search.score", 0)
-            })
+        with tracing.span("search.request", mode=mode, top=top, skip=skip) as span:
+            # ハイブリッド検索実行
+            results = self.search_client.search(
+                search_text=None if mode == "vector" else query,
+                vector_queries=None if mode == "keyword" else [vector_query],
+                filter=filters,
+                top=top,
+                skip=skip or None,
+                select=select
+            )
+
+            # 結果を整形（長文フィールドはget_details()で必要時に取得）
+            formatted_results = []
+            for result in results:
+                formatted_results.append({
+                    "id": result.get("id", ""),
+                    "tech_name": result.get("tech_name", ""),
+                    "abstract": result.get("abstract", ""),
+                    "url": result.get("url", ""),
+                    "category1": result.get("category1", ""),
+                    "category2": result.get("category2", ""),
+                    "category3": result.get("category3", ""),
+                    "evaluation": result.get("evaluation", ""),
+                    "subtitle": result.get("subtitle", ""),
+                    "score": result.get("@search.score", 0)
+                })
+                if self.collapse_clusters:
+                    formatted_results[-1]["cluster_id"] = result.get("cluster_id") or result.get("id", "")
+                if include_vectors:
+                    # 取得時に1回だけ正規化したfloat32配列にする（MMRで変換し直さず、ノルムも計算しない）
+                    vector = result.get("searchable_text_vector")
+                    if vector is not None:
+                        vector = np.asarray(vector, dtype=np.float32)
+                        norm = np.linalg.norm(vector)
+                        vector = vector / norm if norm else vector
+                    formatted_results[-1]["vector"] = vector
+            span.set(results=len(formatted_results))
 
-        self.last_search_results = formatted_results
         return formatted_results
 
+    def _count_facets(
+        self,
+        results: List[Dict[str, Any]],
+        facets: Optional[List[str]]
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        返した検索結果の中でのファセット件数を集計
+
+        ローカルJSONがあれば事前計算した分類コードで、無ければ結果のフィールド値から数える
+        （Azureのfacetsは一致した全件を数えるため使わない）。
+
+        Args:
+            results: 検索結果
+            facets: 集計対象フィールド
+
+        Returns:
+            {field: [{"value": 値, "count": 件数}, ...]}
+        """
+        if not facets:
+            return {}
+        if self.facet_counter is not None:
+            return self.facet_counter.count([r["id"] for r in results], fields=facets)
+        return count_result_facets(results, facets)
+
+    def open_cursor(
+        self,
+        query: str,
+        page_size: int = 20,
+        filters: Optional[str] = None,
+        max_results: int = 1000,
+        skip: int = 0,
+        mode: Optional[str] = None
+    ) -> SearchCursor:
+        """
+        ページ単位で検索結果を取得するカーソルを作成（エンベディングは最初の取得時に1回だけ生成）
+
+        画面の「さらに読み込む」はsearch()が最初のページを取得したカーソル（self.last_cursor）を使う。
+
+        Args:
+            query: 検索クエリ
+            page_size: 1ページの件数
+            filters: ODataフィルタ式
+            max_results: 取得する最大件数
+            skip: 開始位置
+            mode: 検索方式（省略時はself.search_mode）
+
+        Returns:
+            SearchCursor
+        """
+        return SearchCursor(
+            self, query, page_size=page_size, filters=filters, max_results=max_results,
+            skip=skip, mode=mode or self.search_mode
+        )
+
+    def iter_results(
+        self,
+        query: str,
+        page_size: int = 50,
+        filters: Optional[str] = None,
+        max_results: int = 1000
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        検索結果を1件ずつ返す（エクスポートなど大量取得用）
+
+        Args:
+            query: 検索クエリ
+            page_size: 1回のリクエストで取得する件数
+            filters: ODataフィルタ式
+            max_results: 取得する最大件数
+
+        Yields:
+            検索結果
+        """
+        cursor = self.open_cursor(query, page_size=page_size, filters=filters, max_results=max_results)
+        for page in cursor:
+            yield from page
+
+    def get_details(self, doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        詳細フィールドをドキュメントIDで取得（キャッシュに無いものだけまとめて取得）
+
+        Args:
+            doc_ids: ドキュメントIDのリスト
+
+        Returns:
+            ドキュメントID → 詳細フィールドの辞書
+        """
+        details = {}
+        missing = []
+        index_version = self._refresh_index_version()
+        for doc_id in dict.fromkeys(doc_ids):
+            cached = self.detail_cache.get((index_version, doc_id))
+            if cached is not None:
+                details[doc_id] = cached
+            else:
+                missing.append(doc_id)
+
+        with tracing.span("details.fetch", ids=len(details) + len(missing), cache_hits=len(details)):
+            if len(missing) == 1:
+                # 1件ならキー指定で取得
+                document = self.search_client.get_document(
+                    key=missing[0],
+                    selected_fields=["id"] + DETAIL_FIELDS
+                )
+                fetched = [document]
+            elif missing:
+                # 複数件はsearch.inフィルタで1回のリクエストにまとめる
+                id_list = ",".join(missing)
+                fetched = self.search_client.search(
+                    search_text="*",
+                    filter=f"search.in(id, '{id_list}', ',')",
+                    select=["id"] + DETAIL_FIELDS,
+                    top=len(missing)
+                )
+            else:
+                fetched = []
+
+            for document in fetched:
+                doc_details = {field: document.get(field, "") or "" for field in DETAIL_FIELDS}
+                self.detail_cache.put((index_version, document["id"]), doc_details)
+                details[document["id"]] = doc_details
+
+        return details
+
+    def similar(self, doc_id: str, top: int = 5) -> List[Dict[str, Any]]:
+        """
+        事前計算した近傍グラフから類似技術を取得（エンベディング・ベクトル検索は行わない）
+
+        Args:
+            doc_id: ドキュメントID
+            top: 取得件数
+
+        Returns:
+            類似技術のリスト（検索結果と同じ形式、scoreはコサイン類似度）
+        """
+        self._refresh_index_version()
+        if self.similarity_graph is None:
+            return []
+
+        neighbors = self.similarity_graph.similar(doc_id, top=top)
+        rows = self._get_list_rows([neighbor_id for neighbor_id, _ in neighbors])
+        return [
+            dict(rows[neighbor_id], score=score)
+            for neighbor_id, score in neighbors
+            if neighbor_id in rows
+        ]
+
+    def _get_list_rows(self, doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        一覧フィールドをドキュメントIDで取得（ローカルJSONに無いものだけsearch.inフィルタでまとめて取得）
+
+        Args:
+            doc_ids: ドキュメントIDのリスト
+
+        Returns:
+            ドキュメントID → 一覧フィールドの辞書
+        """
+        missing = [doc_id for doc_id in doc_ids if doc_id not in self.list_rows]
+        if missing:
+            id_list = ",".join(missing)
+            for document in self.search_client.search(
+                search_text="*",
+                filter=f"search.in(id, '{id_list}', ',')",
+                select=LIST_FIELDS,
+                top=len(missing)
+            ):
+                self.list_rows[document["id"]] = {field: document.get(field, "") or "" for field in LIST_FIELDS}
+
+        return {doc_id: self.list_rows[doc_id] for doc_id in doc_ids if doc_id in self.list_rows}
+
+    def attach_details(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        検索結果に詳細フィールドを付与（結果の辞書を直接更新）
+
+        Args:
+            results: 検索結果
+
+        Returns:
+            詳細フィールドを付与した検索結果
+        """
+        pending = [r["id"] for r in results if not all(field in r for field in DETAIL_FIELDS)]
+        if pending:
+            details = self.get_details(pending)
+            for result in results:
+                result.update(details.get(result["id"], {}))
+        return results
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """
+        キャッシュの統計情報を取得（キャッシュを共有する全セッションの合計）
+
+        Returns:
+            キャッシュ種別ごとの統計情報
+        """
+        return self.caches.stats()
+
     def format_search_results_for_display(
         self,
         results: List[Dict[str, Any]],
@@ -128,105 +1128,346 @@ class NETISSearchAgent:
         Returns:
             フォーマットされた文字列
         """
-        if not results:
-            return "該当する技術が見つかりませんでした。"
+        # 長文フィールドは表示時にIDで取得し、整形は比較スクリプトと共通の関数で行う
+        if show_details:
+            self.attach_details(results)
+        return format_results_for_display(results, show_details=show_details)
 
-        output = f"\n検索結果: {len(results)}件の技術が見つかりました\n"
-        output += "=" * 80 + "\n\n"
+    def format_search_results_for_llm(
+        self,
+        results: List[Dict[str, Any]],
+        include_details: bool = False,
+        token_budget: Optional[int] = None,
+        numbers: Optional[List[int]] = None
+    ) -> str:
+        """
+        検索結果をプロンプト用の密な形式にフォーマット
 
-        for i, result in enumerate(results, 1):
-            output += f"【{i}】{result['tech_name']}\n"
-            output += f"URL: {result['url']}\n"
-            output += f"\n【概要】\n{result['abstract']}\n"
-
-            if show_details:
-                if result.get('innovation'):
-                    output += f"\n【新規性・期待される効果】\n{result['innovation']}\n"
-                if result.get('conditions'):
-                    output += f"\n【適用条件】\n{result['conditions']}\n"
-                if result.get('scope'):
-                    output += f"\n【適用範囲】\n{result['scope']}\n"
-                if result.get('notes'):
-                    output += f"\n【留意事項】\n{result['notes']}\n"
-
-            # 分類情報
-            categories = []
-            for j in range(1, 4):
-                cat = result.get(f'category{j}', '')
-                if cat:
-                    categories.append(cat)
-            if categories:
-                output += f"\n【分類】{' > '.join(categories)}\n"
-
-            output += "\n" + "-" * 80 + "\n\n"
-
-        return output
-
-    def chat(self, user_message: str) -> str:
+        Args:
+            results: 検索結果
+            include_details: 詳細フィールドも含めるか
+            token_budget: 最大トークン数（省略時は件数に応じて決定）
+            numbers: 各結果の表示番号（一部の結果だけ渡す場合）
+
+        Returns:
+            フォーマットされた文字列
+        """
+        if include_details:
+            self.attach_details(results)
+        return pack_results_for_llm(
+            results, token_budget=token_budget,
+            include_details=include_details, numbers=numbers
+        )
+
+    def route_intent(self, user_input: str, num_results: Optional[int] = None) -> Dict[str, Any]:
+        """
+        発話の意図（search / detail / compare / chitchat）をローカルで判定
+
+        Args:
+            user_input: ユーザーの入力
+            num_results: 参照可能な検索結果の件数（省略時は直前の検索結果の件数）
+
+        Returns:
+            {"intent", "targets", "scores"} の辞書
+        """
+        if num_results is None:
+            num_results = len(self.last_search_results)
+        return self.intent_router.route(user_input, num_results)
+
+    def answer_followup(
+        self,
+        user_input: str,
+        route: Dict[str, Any],
+        results: Optional[List[Dict[str, Any]]] = None
+    ) -> Optional[str]:
+        """
+        詳細・比較のフォローアップにLLMを使わず直前の検索結果から回答
+
+        Args:
+            user_input: ユーザーの入力
+            route: route_intent()の結果
+            results: 参照する検索結果（省略時は直前の検索結果）
+
+        Returns:
+            Markdownの回答（文章での説明が必要などLLMに任せるべき場合はNone）
+        """
+        if results is None:
+            results = self.last_search_results
+
+        plan = plan_followup(user_input, route["intent"], results, route["targets"])
+        if plan is None:
+            return None
+
+        self.attach_details([results[n - 1] for n in plan["targets"]])
+        response = render_followup(plan, results)
+
+        # 履歴には表示内容の要約だけを残す
+        label = "比較表" if plan["intent"] == INTENT_COMPARE else "詳細"
+        shown = "、".join(f"#{n} {results[n - 1]['tech_name']}" for n in plan["targets"])
+        self.memory.add("user", user_input)
+        self.memory.add("assistant", f"（{shown} の{label}を表示しました）")
+        return response
+
+    def build_followup_context(
+        self,
+        results: List[Dict[str, Any]],
+        targets: List[int]
+    ) -> str:
+        """
+        詳細・比較のフォローアップ用に、対象の検索結果をコンテキストに整形（再検索はしない）
+
+        Args:
+            results: 直前の検索結果
+            targets: 対象の結果番号（1始まり、空なら全件を一覧形式で）
+
+        Returns:
+            コンテキスト文字列
+        """
+        if targets:
+            selected = [results[n - 1] for n in targets]
+            packed = self.format_search_results_for_llm(selected, include_details=True, numbers=targets)
+            return f"直前の検索結果のうち、対象の技術の詳細:\n\n{packed}"
+        return f"直前の検索結果:\n\n{self.format_search_results_for_llm(results)}"
+
+    @property
+    def conversation_history(self) -> List[Dict[str, str]]:
+        """会話履歴（検索結果ブロックを除く）"""
+        return self.memory.history()
+
+    def chat(
+        self,
+        user_message: str,
+        context: Optional[str] = None,
+        context_ref: Optional[str] = None
+    ) -> str:
         """
         ユーザーメッセージに対して応答を生成
 
         Args:
             user_message: ユーザーのメッセージ
+            context: メッセージの前に付ける検索結果などのコンテキスト
+            context_ref: 次の検索後にcontextの代わりに履歴へ残す短い参照
 
         Returns:
             エージェントの応答
         """
         # 会話履歴に追加
-        self.conversation_history.append({
-            "role": "user",
-            "content": user_message
-        })
+        self.memory.add("user", user_message, context=context, context_ref=context_ref)
 
-        # システムプロンプトを構築
-        system_prompt = self._build_system_prompt()
+        # メッセージ構築（固定部分を先頭に、履歴はトークン予算内に圧縮）
+        messages = self._build_messages()
 
-        # メッセージ構築
-        messages = [{"role": "system", "content": system_prompt}]
-        messages.extend(self.conversation_history[-10:])  # 最新10件のみ使用
+        # 同じメッセージ・同じ検索結果への応答がキャッシュにあれば再利用
+        cache_key = None
+        temperature = 0.7
+        if self.response_cache is not None:
+            cache_key = self.response_cache.make_key(
+                self.deployment_name, messages, [r["id"] for r in self.last_search_results]
+            )
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                tracing.current_span().set(response_cache="hit")
+                self.memory.add("assistant", cached)
+                return cached
+            if self.response_cache.deterministic:
+                temperature = 0
 
         # OpenAI呼び出し
-        response = self.openai_client.chat.completions.create(
-            model=self.deployment_name,
-            messages=messages,
-            temperature=0.7,
-            max_tokens=1500
-        )
+        with tracing.span("chat.completion", messages=len(messages)) as span:
+            if span.recording:
+                span.set(prompt_chars=sum(len(m.get("content") or "") for m in messages))
+            start = time.perf_counter()
+            response = self.openai_client.chat.completions.create(
+                model=self.deployment_name,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=1500
+            )
+            self._record_usage(response, time.perf_counter() - start)
 
         assistant_message = response.choices[0].message.content
 
+        if cache_key is not None:
+            self.response_cache.put(cache_key, assistant_message)
+
         # 会話履歴に追加
-        self.conversation_history.append({
-            "role": "assistant",
-            "content": assistant_message
-        })
+        self.memory.add("assistant", assistant_message)
 
         return assistant_message
 
+    def _summarize_history(self, summary: str, messages: List[Dict[str, str]]) -> str:
+        """
+        履歴から削除するメッセージをこれまでの要約に畳み込む
+
+        Args:
+            summary: これまでの要約
+            messages: 削除するメッセージ
+
+        Returns:
+            新しい要約
+        """
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        response = self.openai_client.chat.completions.create(
+            model=self.deployment_name,
+            messages=[
+                {"role": "system", "content": "会話の要約を更新してください。検索した技術名や番号、ユーザーの条件を残し、300字以内で簡潔にまとめてください。"},
+                {"role": "user", "content": f"これまでの要約:\n{summary or '(なし)'}\n\n追加の会話:\n{transcript}"}
+            ],
+            temperature=0,
+            max_tokens=400
+        )
+        return response.choices[0].message.content or summary
+
+    @staticmethod
+    def format_results_reference(results: List[Dict[str, Any]], max_name_length: int = 30) -> str:
+        """
+        古くなった検索結果ブロックの代わりに履歴へ残す短い参照を作成
+
+        Args:
+            results: 検索結果
+            max_name_length: 技術名の最大文字数
+
+        Returns:
+            参照文字列
+        """
+        if not results:
+            return "[検索結果: 0件]"
+        lines = [f"[以前の検索結果: {len(results)}件]"]
+        for i, result in enumerate(results, 1):
+            lines.append(f"{i}. {result['tech_name'][:max_name_length]} ({result['id']})")
+        return "\n".join(lines)
+
     def _build_system_prompt(self) -> str:
-        """システムプロンプトを構築"""
-        return """あなたはNETIS（新技術情報提供システム）の検索アシスタントです。
-建設業従事者が適切な新技術を見つけるお手伝いをします。
+        """システムプロンプトを構築（毎回同一の内容にしてプロンプトキャッシュを効かせる）"""
+        if self.agent_mode == "tools":
+            return SYSTEM_PROMPT + TOOL_USAGE_PROMPT
+        return SYSTEM_PROMPT
 
-【役割】
-1. ユーザーの質問から適切な検索クエリを判断する
-2. 検索結果を分かりやすく提示する
-3. フォローアップ質問で絞り込みをサポートする
-4. 技術の詳細について質問されたら、該当技術の詳細情報を提供する
-5. 技術の比較を求められたら、複数技術を比較して提示する
+    def _build_messages(self) -> List[Dict[str, str]]:
+        """
+        API送信用のメッセージを構築
 
-【対応パターン】
-- 「〜の技術を探している」→ 検索を実行して結果を提示
-- 「もっと絞り込みたい」→ 分類や条件での絞り込みを提案
-- 「N番目について詳しく」→ 該当技術の詳細を表示
-- 「AとBを比較して」→ 2つの技術を比較
+        先頭から「固定のシステムプロンプト → 履歴の要約 → 会話履歴（検索結果はそのターンの位置に固定）
+        → 今回のメッセージ」の順に並べ、前回の呼び出しと共通の先頭部分ができるだけ長くなるようにする
 
-【出力形式】
-- 初回検索: 技術名 + アブストラクト + URL（最大10件）
-- 詳細表示: 適用条件、留意事項、新規性なども含める
-- フォローアップ質問を自然に提案する
+        Returns:
+            メッセージのリスト
+        """
+        messages = [{"role": "system", "content": self._build_system_prompt()}]
+        messages.extend(self.memory.messages())
+        return messages
+
+    def _record_usage(self, response, elapsed: float):
+        """
+        APIレスポンスのトークン使用量（キャッシュされたトークン数を含む）を記録
+
+        Args:
+            response: chat.completions.createのレスポンス
+            elapsed: 呼び出しにかかった秒数
+        """
+        usage = getattr(response, "usage", None)
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.last_usage = {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+            "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+            "latency": elapsed
+        }
+        self.usage_log.append(self.last_usage)
+        tracing.current_span().set(
+            prompt_tokens=self.last_usage["prompt_tokens"],
+            completion_tokens=self.last_usage["completion_tokens"],
+            cached_tokens=self.last_usage["cached_tokens"]
+        )
+
+    def get_usage_stats(self) -> Dict[str, Any]:
+        """
+        チャット呼び出しのトークン使用量の集計を取得
+
+        Returns:
+            呼び出し回数・トークン数・キャッシュ率・平均レイテンシの辞書
+        """
+        calls = len(self.usage_log)
+        prompt_tokens = sum(u["prompt_tokens"] for u in self.usage_log)
+        cached_tokens = sum(u["cached_tokens"] for u in self.usage_log)
+        return {
+            "calls": calls,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": sum(u["completion_tokens"] for u in self.usage_log),
+            "cached_tokens": cached_tokens,
+            "cached_ratio": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+            "avg_latency": sum(u["latency"] for u in self.usage_log) / calls if calls else 0.0,
+            "last": self.last_usage
+        }
+
+    def run_agent_turn(self, user_input: str) -> str:
+        """
+        ツール呼び出しループで1ターンを処理（検索の要否はモデルが判断）
 
-現在の検索結果数: """ + str(len(self.last_search_results))
+        モデルがツールを呼ぶ限り最大max_tool_rounds回まで実行し、
+        1回の応答に含まれる複数のツール呼び出しは並列に実行する
+
+        Args:
+            user_input: ユーザーの入力
+
+        Returns:
+            エージェントの応答
+        """
+        self.memory.add("user", user_input)
+        messages = self._build_messages()
+        results_before = self.last_search_results
+        self.last_tool_timings = []
+
+        assistant_message = ""
+        for round_index in range(self.max_tool_rounds + 1):
+            # 上限に達したらツールを使わずに回答させる
+            tool_choice = "auto" if round_index < self.max_tool_rounds else "none"
+
+            with tracing.span("chat.completion", messages=len(messages), round=round_index):
+                start = time.perf_counter()
+                response = self.openai_client.chat.completions.create(
+                    model=self.deployment_name,
+                    messages=messages,
+                    tools=TOOL_DEFINITIONS,
+                    tool_choice=tool_choice,
+                    temperature=0.7,
+                    max_tokens=1500
+                )
+                self._record_usage(response, time.perf_counter() - start)
+
+            message = response.choices[0].message
+            if not message.tool_calls:
+                assistant_message = message.content or ""
+                break
+
+            messages.append({
+                "role": "assistant",
+                "content": message.content,
+                "tool_calls": [
+                    {
+                        "id": call.id,
+                        "type": "function",
+                        "function": {"name": call.function.name, "arguments": call.function.arguments}
+                    }
+                    for call in message.tool_calls
+                ]
+            })
+            tool_messages, timings = self.tool_executor.execute(message.tool_calls)
+            messages.extend(tool_messages)
+            for timing in timings:
+                timing["round"] = round_index
+            self.last_tool_timings.extend(timings)
+
+        # 新しく検索した場合は、以降のターンのために結果の参照を履歴に残す
+        if self.last_search_results is not results_before:
+            self.memory.add(
+                "assistant", assistant_message,
+                context_ref=self.format_results_reference(self.last_search_results)
+            )
+        else:
+            self.memory.add("assistant", assistant_message)
+
+        return assistant_message
 
     def process_query(self, user_input: str) -> str:
         """
@@ -238,27 +1479,77 @@ class NETISSearchAgent:
         Returns:
             応答メッセージ
         """
-        # 検索が必要かどうかを判定（簡易版）
-        search_keywords = ['探して', '検索', '教えて', '技術', '工法', '対策', 'ありますか', 'ください']
-        needs_search = any(keyword in user_input for keyword in search_keywords)
+        with tracing.span("turn", input_chars=len(user_input), agent_mode=self.agent_mode) as span:
+            response = self._process_query(user_input)
+            span.set(response_chars=len(response or ""))
+            return response
+
+    def _process_query(self, user_input: str) -> str:
+        """process_query()の本体（意図に応じて検索・詳細表示・雑談に振り分け）"""
+        # ツール呼び出しモードでは検索の要否をモデルに任せる
+        if self.agent_mode == "tools":
+            return self.run_agent_turn(user_input)
+
+        # 意図をローカルで判定（ネットワーク呼び出しなし）
+        route = self.route_intent(user_input)
+        tracing.current_span().set(intent=route["intent"])
 
         # 検索実行
-        if needs_search and not self.last_search_results:
+        if route["intent"] == INTENT_SEARCH:
             results = self.search(user_input, top=10)
-            results_text = self.format_search_results_for_display(results)
+
+            # 類似クエリのヒットで応答も保存済みならLLM呼び出しを省略
+            cached_response = self._cached_semantic_response()
+            if cached_response is not None:
+                self.memory.add("user", user_input, context_ref=self.format_results_reference(results))
+                self.memory.add("assistant", cached_response)
+                return cached_response
+
+            results_text = self.format_search_results_for_llm(results)
 
             # チャットで応答生成
             context = f"以下の検索結果を踏まえて、ユーザーに分かりやすく提示し、フォローアップ質問を提案してください:\n\n{results_text}"
-            return self.chat(context + "\n\nユーザーの質問: " + user_input)
+            response = self.chat(
+                "ユーザーの質問: " + user_input,
+                context=context,
+                context_ref=self.format_results_reference(results)
+            )
+            self._store_semantic_response(response)
+            return response
 
-        # 詳細表示や比較の場合
-        else:
-            return self.chat(user_input)
+        # 詳細表示や比較の場合は直前の検索結果から回答（再検索しない）
+        if route["intent"] in (INTENT_DETAIL, INTENT_COMPARE):
+            # 定型の詳細表示・比較表はLLMを使わずに作成
+            response = self.answer_followup(user_input, route)
+            if response is not None:
+                return response
+
+            context = self.build_followup_context(self.last_search_results, route["targets"])
+            return self.chat(user_input, context=context)
+
+        return self.chat(user_input)
+
+    def _cached_semantic_response(self) -> Optional[str]:
+        """直前の検索がセマンティックキャッシュにヒットし、応答の再利用が有効なら保存済みの応答を返す"""
+        if self.semantic_cache is None or not self.semantic_cache.reuse_responses:
+            return None
+        if self.last_semantic_hit is None:
+            return None
+        return self.last_semantic_hit.get("response")
+
+    def _store_semantic_response(self, response: str):
+        """直前の検索に対応するセマンティックキャッシュのエントリに応答を保存（まだ応答がない場合のみ）"""
+        if self.semantic_cache is None or self.last_semantic_slot is None:
+            return
+        slot, query = self.last_semantic_slot
+        self.semantic_cache.attach_response(slot, query, response)
 
     def reset_conversation(self):
         """会話履歴をリセット"""
-        self.conversation_history = []
+        self.memory.clear()
         self.last_search_results = []
+        self.last_facets = {}
+        self.last_cursor = None
 
 
 if __name__ == "__main__":
@@ -0,0 +1,207 @@
+"""
+検索結果キャッシュとインデックスバージョン管理を行うモジュール
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+from datetime import datetime
+from pathlib import Path
+import json
+import re
+import threading
+import time
+import unicodedata
+import uuid
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    キャッシュキー用にクエリを正規化
+    - NFKC正規化（全角英数・半角カナなどを統一）
+    - 連続する空白（全角空白含む）を1つにまとめる
+    - 英字を小文字化
+
+    Args:
+        query: 検索クエリ
+
+    Returns:
+        正規化されたクエリ
+    """
+    normalized = unicodedata.normalize("NFKC", query or "")
+    normalized = _WHITESPACE_RE.sub(" ", normalized).strip()
+    return normalized.lower()
+
+
+class LRUCache:
+    """件数上限付き（有効期限も指定可能）のLRUキャッシュ（ヒット率の統計付き）"""
+
+    def __init__(self, max_size: int = 256, ttl: Optional[float] = None):
+        """
+        初期化
+
+        Args:
+            max_size: 保持する最大件数
+            ttl: 有効期限（秒、Noneなら無期限）
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._expires: Dict[Hashable, float] = {}
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        キャッシュから取得（存在しない場合はNone）
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            キャッシュされた値
+        """
+        with self._lock:
+            if key in self._data and self.ttl is not None and self._expires[key] < time.monotonic():
+                # 期限切れは削除してミス扱い
+                del self._data[key]
+                del self._expires[key]
+                self.expirations += 1
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any):
+        """
+        キャッシュに格納（上限を超えたら最も古いものを削除）
+
+        Args:
+            key: キャッシュキー
+            value: 格納する値
+        """
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if self.ttl is not None:
+                self._expires[key] = time.monotonic() + self.ttl
+            while len(self._data) > self.max_size:
+                oldest, _ = self._data.popitem(last=False)
+                self._expires.pop(oldest, None)
+                self.evictions += 1
+
+    def clear(self):
+        """キャッシュを全削除（統計は保持）"""
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        統計情報を取得
+
+        Returns:
+            件数・ヒット数・ミス数・ヒット率・削除数・期限切れ数の辞書
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+def write_index_version(path: str, document_count: int = None) -> str:
+    """
+    インデックスのバージョンスタンプを書き出す（データ投入後に実行）
+
+    Args:
+        path: スタンプファイルのパス
+        document_count: 投入したドキュメント数（記録用）
+
+    Returns:
+        新しいバージョン文字列
+    """
+    version = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(
+            {"version": version, "document_count": document_count},
+            f, ensure_ascii=False, indent=2
+        )
+
+    return version
+
+
+def read_index_version(path: str) -> str:
+    """
+    インデックスのバージョンスタンプを読み込む
+
+    Args:
+        path: スタンプファイルのパス
+
+    Returns:
+        バージョン文字列（ファイルが無い場合は空文字列）
+    """
+    path = Path(path)
+    if not path.exists():
+        return ""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return str(json.load(f).get("version", ""))
+    except (OSError, ValueError):
+        return ""
+
+
+class IndexVersionWatcher:
+    """スタンプファイルの更新を検知するクラス（mtimeが変わった時だけ読み直す）"""
+
+    def __init__(self, path: str):
+        """
+        初期化
+
+        Args:
+            path: スタンプファイルのパス
+        """
+        self.path = Path(path)
+        self._mtime = None
+        self.version = ""
+        self.changed()
+
+    def changed(self) -> bool:
+        """
+        前回確認時からバージョンが変わったかを判定
+
+        Returns:
+            変わっていればTrue
+        """
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            mtime = None
+
+        if mtime == self._mtime:
+            return False
+
+        self._mtime = mtime
+        version = read_index_version(str(self.path))
+        if version == self.version:
+            return False
+
+        self.version = version
+        return True
@@ -14,9 +14,15 @@ from azure.search.documents.indexes.models import (
     VectorSearchProfile,
     HnswAlgorithmConfiguration,
 )
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Set
+import json
 import os
 from dotenv import load_dotenv
+from src import tracing
+from src.structured_logging import get_logger
+
+
+logger = get_logger(__name__)
 
 
 class AzureSearchIndexer:
@@ -37,6 +43,8 @@ class AzureSearchIndexer:
         self.endpoint = endpoint or os.getenv('AZURE_SEARCH_ENDPOINT')
         self.api_key = api_key or os.getenv('AZURE_SEARCH_API_KEY')
         self.index_name = index_name or os.getenv('AZURE_SEARCH_INDEX_NAME', 'netis-index')
+        # ベクトルフィールドの次元数（EMBEDDING_DIMENSIONSで縮めたエンベディングに合わせる）
+        self.dimensions = int(os.getenv('EMBEDDING_DIMENSIONS', '1536'))
 
         if not self.endpoint or not self.api_key:
             raise ValueError("Azure Search endpoint and API key are required")
@@ -184,12 +192,19 @@ class AzureSearchIndexer:
                 filterable=False
             ),
 
+            # ほぼ同一のドキュメントのクラスタ（代表のID、検索時の重複折りたたみ用）
+            SimpleField(
+                name="cluster_id",
+                type=SearchFieldDataType.String,
+                filterable=True
+            ),
+
             # ベクトル検索用（統合テキスト）
             SearchField(
                 name="searchable_text_vector",
                 type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
                 searchable=True,
-                vector_search_dimensions=1536,  # text-embedding-3-smallの次元数（デフォルト1536）
+                vector_search_dimensions=self.dimensions,  # text-embedding-3-smallの次元数（デフォルト1536）
                 vector_search_profile_name="netis-vector-profile"
             ),
 
@@ -209,27 +224,121 @@ class AzureSearchIndexer:
             vector_search=vector_search
         )
 
-        print(f"Creating index: {self.index_name}")
         result = self.index_client.create_or_update_index(index)
-        print(f"Index created: {result.name}")
+        logger.info("Index created", extra={"index": result.name, "dimensions": self.dimensions})
+
+        return result
+
+    def create_passage_index(self) -> SearchIndex:
+        """
+        パッセージ（長いドキュメントを分割したもの）用のインデックスを作成
+        - parent_idで親ドキュメント（メインのインデックスのid）を参照する
+
+        Returns:
+            作成されたSearchIndex
+        """
+        vector_search = VectorSearch(
+            profiles=[
+                VectorSearchProfile(
+                    name="netis-vector-profile",
+                    algorithm_configuration_name="netis-hnsw-config"
+                )
+            ],
+            algorithms=[
+                HnswAlgorithmConfiguration(
+                    name="netis-hnsw-config"
+                )
+            ]
+        )
+
+        fields = [
+            SimpleField(
+                name="id",
+                type=SearchFieldDataType.String,
+                key=True,
+                filterable=True
+            ),
+            SimpleField(
+                name="parent_id",
+                type=SearchFieldDataType.String,
+                filterable=True
+            ),
+            SimpleField(
+                name="chunk_index",
+                type=SearchFieldDataType.Int32,
+                filterable=False
+            ),
+            SearchableField(
+                name="tech_name",
+                type=SearchFieldDataType.String,
+                searchable=True
+            ),
+            SearchableField(
+                name="content",
+                type=SearchFieldDataType.String,
+                searchable=True,
+                analyzer_name="ja.microsoft"
+            ),
+            SearchField(
+                name="content_vector",
+                type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
+                searchable=True,
+                vector_search_dimensions=self.dimensions,
+                vector_search_profile_name="netis-vector-profile"
+            )
+        ]
+
+        index = SearchIndex(
+            name=self.index_name,
+            fields=fields,
+            vector_search=vector_search
+        )
+
+        result = self.index_client.create_or_update_index(index)
+        logger.info("Passage index created", extra={"index": result.name, "dimensions": self.dimensions})
 
         return result
 
     def delete_index(self):
         """インデックスを削除"""
-        print(f"Deleting index: {self.index_name}")
         self.index_client.delete_index(self.index_name)
-        print("Index deleted")
+        logger.info("Index deleted", extra={"index": self.index_name})
+
+    def get_field_names(self) -> Optional[Set[str]]:
+        """
+        既存インデックスのフィールド名を取得
+
+        Returns:
+            フィールド名の集合（インデックス定義を取得できない場合はNone）
+        """
+        try:
+            index = self.index_client.get_index(self.index_name)
+        except Exception as e:
+            logger.debug("Could not fetch index definition", extra={"index": self.index_name, "error": str(e)})
+            return None
+        return {field.name for field in index.fields}
 
     def upload_documents(self, documents: List[Dict[str, Any]], batch_size: int = 10):
         """
         ドキュメントをアップロード（リトライ機能付き）
 
+        既存インデックス（再作成しなかった場合）に無いフィールド（後から追加したcluster_idなど）は
+        送ると全バッチが失敗するため、警告を出して除いてから投入する。
+
         Args:
             documents: アップロードするドキュメントのリスト
             batch_size: バッチサイズ（デフォルト10に変更）
         """
         import time
+        field_names = self.get_field_names()
+        if field_names is not None:
+            missing = sorted({key for doc in documents for key in doc} - field_names)
+            if missing:
+                logger.warning("Index lacks fields; uploading without them (recreate the index to include them)", extra={
+                    "index": self.index_name, "fields": missing
+                })
+                documents = [{key: value for key, value in doc.items() if key in field_names} for doc in documents]
+
         search_client = SearchClient(
             endpoint=self.endpoint,
             index_name=self.index_name,
@@ -237,38 +346,85 @@ class AzureSearchIndexer:
         )
 
         total = len(documents)
-        print(f"Uploading {total} documents in batches of {batch_size}...")
+        logger.info("Uploading documents", extra={"index": self.index_name, "documents": total, "batch_size": batch_size})
+        run_start = time.perf_counter()
 
         for i in range(0, total, batch_size):
             batch = documents[i:i + batch_size]
             batch_num = i // batch_size + 1
 
-            # リトライ機能
-            max_retries = 3
-            for retry in range(max_retries):
-                try:
-                    result = search_client.upload_documents(documents=batch)
-                    succeeded = sum([1 for r in result if r.succeeded])
-                    print(f"Batch {batch_num}: {succeeded}/{len(batch)} documents uploaded")
-
-                    # 成功したらbreak
-                    if succeeded == len(batch):
-                        break
-                    else:
-                        print(f"  Warning: {len(batch) - succeeded} documents failed")
-
-                except Exception as e:
-                    if retry < max_retries - 1:
-                        print(f"  Batch {batch_num} failed (retry {retry + 1}/{max_retries}): {str(e)}")
-                        time.sleep(2)  # 2秒待機してリトライ
-                    else:
-                        print(f"  ERROR: Batch {batch_num} failed after {max_retries} retries: {str(e)}")
-                        raise
+            with tracing.span("upload.batch", index=self.index_name, batch=batch_num, documents=len(batch)) as span:
+                if span.recording:
+                    span.set(payload_bytes=len(json.dumps(batch, ensure_ascii=False).encode("utf-8")))
+
+                # リトライ機能
+                max_retries = 3
+                for retry in range(max_retries):
+                    span.set(retries=retry)
+                    batch_start = time.perf_counter()
+                    fields = {"index": self.index_name, "batch_id": batch_num, "retry": retry}
+                    try:
+                        result = search_client.upload_documents(documents=batch)
+                        succeeded = sum([1 for r in result if r.succeeded])
+                        span.set(succeeded=succeeded)
+                        fields.update(
+                            documents=len(batch), succeeded=succeeded,
+                            duration_ms=round((time.perf_counter() - batch_start) * 1000.0, 1)
+                        )
+
+                        # 成功したらbreak
+                        if succeeded == len(batch):
+                            logger.debug("Batch uploaded", extra=fields)
+                            break
+                        else:
+                            logger.warning("Some documents in the batch failed", extra=fields)
+
+                    except Exception as e:
+                        fields.update(error=str(e), max_retries=max_retries)
+                        if retry < max_retries - 1:
+                            logger.warning("Batch upload failed, retrying", extra=fields)
+                            time.sleep(2)  # 2秒待機してリトライ
+                        else:
+                            logger.error("Batch upload failed after retries", extra=fields)
+                            raise
 
             # バッチ間で少し待機（レート制限対策）
             time.sleep(0.5)
 
-        print("All documents uploaded successfully")
+        logger.info("All documents uploaded", extra={
+            "index": self.index_name, "documents": total,
+            "duration_ms": round((time.perf_counter() - run_start) * 1000.0, 1)
+        })
+
+    def delete_stale_documents(self, keep_ids: Set[str], batch_size: int = 1000) -> int:
+        """
+        keep_idsに含まれないドキュメントを削除
+
+        アップロードは同じIDを上書きするだけのため、分割数が減った技術の余ったパッセージや
+        データから消えた技術のパッセージが残る。アップロード後に呼び、今回投入しなかったIDを消す。
+
+        Args:
+            keep_ids: 残すドキュメントのID（今回アップロードしたもの）
+            batch_size: 1回の削除要求の件数
+
+        Returns:
+            削除した件数
+        """
+        search_client = SearchClient(
+            endpoint=self.endpoint,
+            index_name=self.index_name,
+            credential=self.credential
+        )
+
+        stale = [
+            doc["id"] for doc in search_client.search(search_text="*", select=["id"])
+            if doc["id"] not in keep_ids
+        ]
+        for i in range(0, len(stale), batch_size):
+            search_client.delete_documents(documents=[{"id": doc_id} for doc_id in stale[i:i + batch_size]])
+
+        logger.info("Stale documents deleted", extra={"index": self.index_name, "documents": len(stale)})
+        return len(stale)
 
     def get_index_stats(self) -> Dict[str, Any]:
         """
@@ -0,0 +1,248 @@
+"""
+クエリのエンベディングの類似度で検索結果を再利用するセマンティックキャッシュ
+"""
+import numpy as np
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple
+import random
+import threading
+
+
+class SemanticQueryCache:
+    """直近のクエリベクトルを行列で保持し、コサイン類似度で近いクエリの結果を返すクラス"""
+
+    def __init__(
+        self,
+        capacity: int = 128,
+        dimensions: Optional[int] = None,
+        threshold: float = 0.95,
+        audit_rate: float = 0.0,
+        audit_min_overlap: float = 0.5,
+        reuse_responses: bool = False
+    ):
+        """
+        初期化
+
+        Args:
+            capacity: 保持するクエリの最大数
+            dimensions: エンベディングの次元数（省略時は最初に追加したベクトルに合わせる）
+            threshold: ヒットとみなすコサイン類似度の下限
+            audit_rate: ヒット時に実検索で照合する割合（0〜1）
+            audit_min_overlap: 照合時に正しいヒットとみなす結果IDの重複率の下限
+            reuse_responses: ヒット時にLLMの応答も再利用するか
+        """
+        self.capacity = capacity
+        self.dimensions = dimensions
+        self.threshold = threshold
+        self.audit_rate = audit_rate
+        self.audit_min_overlap = audit_min_overlap
+        self.reuse_responses = reuse_responses
+
+        self._matrix: Optional[np.ndarray] = None
+        if dimensions:
+            self._matrix = np.zeros((capacity, dimensions), dtype=np.float32)
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+        self._entries: List[Optional[Dict[str, Any]]] = [None] * capacity
+        self._size = 0
+        self._tick = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.audits = 0
+        self.false_hits = 0
+        self.recent_hits = deque(maxlen=50)
+        self.false_hit_log = deque(maxlen=50)
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        """ベクトルを単位長に正規化"""
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm > 0 else v
+
+    def lookup(
+        self,
+        query: str,
+        vector: List[float],
+        scope: Tuple = ()
+    ) -> Optional[Tuple[int, Dict[str, Any], float]]:
+        """
+        類似クエリのキャッシュを検索
+
+        Args:
+            query: 検索クエリ（統計用）
+            vector: クエリのエンベディング
+            scope: 一致が必要な検索条件（フィルタ・件数など）
+
+        Returns:
+            (スロット番号, エントリ, 類似度) またはNone
+        """
+        v = self._normalize(vector)
+
+        with self._lock:
+            # 次元数の異なるベクトル（モデル・次元数の変更後など）は比較できないためミス扱い
+            if self._size == 0 or v.shape[0] != self._matrix.shape[1]:
+                self.misses += 1
+                return None
+
+            # 1回の行列ベクトル積で全エントリとの類似度を計算
+            sims = self._matrix[:self._size] @ v
+            scope_mask = np.array(
+                [entry["scope"] == scope for entry in self._entries[:self._size]]
+            )
+            sims = np.where(scope_mask, sims, -1.0)
+            slot = int(np.argmax(sims))
+            similarity = float(sims[slot])
+
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._tick += 1
+            self._last_used[slot] = self._tick
+            entry = self._entries[slot]
+            self.recent_hits.append({
+                "query": query,
+                "cached_query": entry["query"],
+                "similarity": round(similarity, 4)
+            })
+            return slot, entry, similarity
+
+    def add(
+        self,
+        query: str,
+        vector: List[float],
+        results: List[Dict[str, Any]],
+        scope: Tuple = (),
+        extra: Dict[str, Any] = None
+    ) -> int:
+        """
+        検索結果をキャッシュに追加（満杯なら最も使われていないものを削除）
+
+        Args:
+            query: 検索クエリ
+            vector: クエリのエンベディング
+            results: 検索結果
+            scope: 検索条件（フィルタ・件数など）
+            extra: 結果と一緒に保持する情報（ファセットなど）
+
+        Returns:
+            格納したスロット番号
+        """
+        v = self._normalize(vector)
+
+        with self._lock:
+            # 初回、または次元数が変わった場合は行列を作り直す（既存のエントリは破棄）
+            if self._matrix is None or v.shape[0] != self._matrix.shape[1]:
+                self.dimensions = v.shape[0]
+                self._matrix = np.zeros((self.capacity, self.dimensions), dtype=np.float32)
+                self._last_used[:] = 0
+                self._entries = [None] * self.capacity
+                self._size = 0
+
+            if self._size < self.capacity:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+                self.evictions += 1
+
+            self._tick += 1
+            self._matrix[slot] = v
+            self._last_used[slot] = self._tick
+            self._entries[slot] = {
+                "query": query,
+                "scope": scope,
+                "results": results,
+                "extra": extra or {},
+                "response": None
+            }
+            return slot
+
+    def attach_response(self, slot: int, query: str, response: str):
+        """
+        スロットのエントリにLLMの応答を紐付ける（応答が保存済みのエントリは上書きしない）
+
+        Args:
+            slot: スロット番号
+            query: エントリ作成時のクエリ（スロットが再利用されていないかの確認用）
+            response: LLMの応答
+        """
+        with self._lock:
+            entry = self._entries[slot] if 0 <= slot < self._size else None
+            if entry is not None and entry["query"] == query and entry["response"] is None:
+                entry["response"] = response
+
+    def should_audit(self) -> bool:
+        """ヒット時に実検索で照合するかを判定"""
+        return self.audit_rate > 0 and self._random.random() < self.audit_rate
+
+    def record_audit(
+        self,
+        query: str,
+        entry: Dict[str, Any],
+        fresh_results: List[Dict[str, Any]]
+    ) -> bool:
+        """
+        ヒットしたエントリと実検索の結果を照合
+
+        Args:
+            query: 新しいクエリ
+            entry: ヒットしたエントリ
+            fresh_results: 実検索の結果
+
+        Returns:
+            誤ヒットと判定された場合True
+        """
+        cached_ids = {r["id"] for r in entry["results"]}
+        fresh_ids = {r["id"] for r in fresh_results}
+        union = cached_ids | fresh_ids
+        overlap = len(cached_ids & fresh_ids) / len(union) if union else 1.0
+
+        with self._lock:
+            self.audits += 1
+            is_false_hit = overlap < self.audit_min_overlap
+            if is_false_hit:
+                self.false_hits += 1
+                self.false_hit_log.append({
+                    "query": query,
+                    "cached_query": entry["query"],
+                    "overlap": round(overlap, 4)
+                })
+            return is_false_hit
+
+    def clear(self):
+        """キャッシュを全削除（統計は保持）"""
+        with self._lock:
+            if self._matrix is not None:
+                self._matrix[:] = 0
+            self._last_used[:] = 0
+            self._entries = [None] * self.capacity
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        統計情報を取得
+
+        Returns:
+            ヒット率・削除数・誤ヒット監査結果などの辞書
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": self._size,
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "audits": self.audits,
+            "false_hits": self.false_hits,
+            "false_hit_ratio": self.false_hits / self.audits if self.audits else 0.0,
+            "recent_hits": list(self.recent_hits)[-10:],
+            "recent_false_hits": list(self.false_hit_log)[-10:]
+        }
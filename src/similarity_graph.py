@@ -0,0 +1,133 @@
+"""
+全ドキュメントの近傍（類似技術）を事前計算して保存・参照するモジュール
+"""
+import numpy as np
+from typing import List, Tuple, Sequence
+from pathlib import Path
+
+
+def build_knn_graph(
+    vectors: Sequence[Sequence[float]],
+    k: int = 10,
+    block_size: int = 512
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    全ドキュメントのコサイン類似度上位k件をブロック単位の行列積で計算
+
+    n×nの類似度行列全体は作らず、block_size行ずつ (block_size×n) の積を計算して上位k件だけ残す。
+
+    Args:
+        vectors: エンベディング（n件）
+        k: 残す近傍の数（自分自身は除く）
+        block_size: 1回の行列積で処理する行数
+
+    Returns:
+        (近傍の行番号 (n, k) int32, 類似度 (n, k) float16)
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    n = len(matrix)
+    k = min(k, max(n - 1, 0))
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms > 0, norms, 1.0)
+
+    neighbors = np.zeros((n, k), dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float16)
+    if k == 0:
+        return neighbors, scores
+
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        sims = matrix[start:end] @ matrix.T
+
+        # 自分自身を除外
+        rows = np.arange(end - start)
+        sims[rows, rows + start] = -np.inf
+
+        # 上位k件を部分ソートで抽出してから類似度順に並べる
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_sims, axis=1)
+        neighbors[start:end] = np.take_along_axis(top, order, axis=1)
+        scores[start:end] = np.take_along_axis(top_sims, order, axis=1)
+
+    return neighbors, scores
+
+
+def save_knn_graph(
+    path: str,
+    doc_ids: List[str],
+    neighbors: np.ndarray,
+    scores: np.ndarray
+):
+    """
+    近傍グラフを圧縮形式（npz）で保存
+
+    Args:
+        path: 保存先のパス
+        doc_ids: 行番号に対応するドキュメントID
+        neighbors: 近傍の行番号
+        scores: 類似度
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(
+        path,
+        doc_ids=np.asarray(doc_ids, dtype=str),
+        neighbors=neighbors.astype(np.int32),
+        scores=scores.astype(np.float16)
+    )
+
+
+class SimilarityGraph:
+    """事前計算した近傍グラフで類似技術を参照するクラス"""
+
+    def __init__(self, doc_ids: Sequence[str], neighbors: np.ndarray, scores: np.ndarray):
+        """
+        初期化
+
+        Args:
+            doc_ids: 行番号に対応するドキュメントID
+            neighbors: 近傍の行番号 (n, k)
+            scores: 類似度 (n, k)
+        """
+        self.doc_ids = [str(doc_id) for doc_id in doc_ids]
+        self.id_to_row = {doc_id: row for row, doc_id in enumerate(self.doc_ids)}
+        self.neighbors = neighbors
+        self.scores = scores
+
+    @classmethod
+    def load(cls, path: str) -> "SimilarityGraph":
+        """
+        save_knn_graphで保存したファイルから生成
+
+        Args:
+            path: npzファイルのパス
+
+        Returns:
+            SimilarityGraph
+        """
+        with np.load(Path(path)) as data:
+            return cls(data["doc_ids"], data["neighbors"], data["scores"])
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def similar(self, doc_id: str, top: int = 5) -> List[Tuple[str, float]]:
+        """
+        類似ドキュメントを取得（未知のIDは空リスト）
+
+        Args:
+            doc_id: ドキュメントID
+            top: 取得件数
+
+        Returns:
+            (ドキュメントID, 類似度) のリスト（類似度順）
+        """
+        row = self.id_to_row.get(doc_id)
+        if row is None:
+            return []
+        return [
+            (self.doc_ids[neighbor], float(score))
+            for neighbor, score in zip(self.neighbors[row, :top], self.scores[row, :top])
+        ]
@@ -0,0 +1,196 @@
+"""
+レベル付きの構造化ログ（JSON Lines）を非同期に出力するモジュール
+
+呼び出し側はQueueHandlerでキューに積むだけで、書き込みはQueueListenerのスレッドが行うため、
+標準出力がパイプで詰まってもバッチ処理のループは止まらない。
+
+環境変数:
+    NETIS_LOG_LEVEL   DEBUG / INFO（既定） / WARNING / ERROR
+    NETIS_LOG_FORMAT  json / text / auto（既定、端末ならtext、パイプ・ファイルならjson）
+    NETIS_LOG_FILE    指定すると標準エラー出力に加えてJSON Linesで追記
+
+使い方:
+    logger = get_logger(__name__)
+    logger.info("Batch uploaded", extra={"batch_id": 3, "documents": 10, "duration_ms": 120.5})
+"""
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import uuid
+
+
+ROOT_LOGGER_NAME = "netis"
+
+# LogRecordの標準属性（これ以外をextraのフィールドとして出力する）
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_run_id: ContextVar[str] = ContextVar("netis_run_id", default=uuid.uuid4().hex[:12])
+
+_EXCEPTION_FORMATTER = logging.Formatter()
+
+_listener: Optional[QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def new_run_id() -> str:
+    """
+    新しい実行IDを発行して以降のログに付与する（取り込み1回・会話1セッションなどの単位）
+
+    Returns:
+        実行ID
+    """
+    run_id = uuid.uuid4().hex[:12]
+    _run_id.set(run_id)
+    return run_id
+
+
+def get_run_id() -> str:
+    """現在の実行ID"""
+    return _run_id.get()
+
+
+class _ContextFilter(logging.Filter):
+    """呼び出し元のスレッドで実行ID・トレースIDを付与（キューに積む前に評価する）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run_id = _run_id.get()
+        from src import tracing
+        span = tracing.current_span()
+        if getattr(span, "trace_id", None):
+            record.trace_id = span.trace_id
+        return True
+
+
+def _extra_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {
+        key: value for key, value in vars(record).items()
+        if key not in _RESERVED_ATTRS and not key.startswith("_")
+    }
+
+
+class JsonFormatter(logging.Formatter):
+    """1レコード1行のJSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """端末向けの1行表示（追加フィールドはkey=valueで末尾に付ける）"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {k: v for k, v in _extra_fields(record).items() if k not in ("run_id", "trace_id")}
+        suffix = " ".join(f"{k}={v}" for k, v in fields.items())
+        line = f"{datetime.fromtimestamp(record.created).strftime('%H:%M:%S')} {record.levelname:<7} {record.getMessage()}"
+        if suffix:
+            line += f"  [{suffix}]"
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+class _QueueHandler(QueueHandler):
+    """
+    メッセージの引数と例外だけを呼び出し元で文字列にしてキューに積む
+    （標準のprepareはフォーマッター全体を適用するため、JSONとテキストで出し分けられない）
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _EXCEPTION_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level: str = None, fmt: str = None, log_file: str = None) -> logging.Logger:
+    """
+    netisロガーにキュー経由の出力を設定（2回目以降は何もしない）
+
+    Args:
+        level: ログレベル（省略時はNETIS_LOG_LEVEL）
+        fmt: "json" / "text" / "auto"（省略時はNETIS_LOG_FORMAT）
+        log_file: JSON Linesで追記するファイル（省略時はNETIS_LOG_FILE）
+
+    Returns:
+        netisロガー
+    """
+    global _listener
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    with _setup_lock:
+        if _listener is not None:
+            return root
+
+        level = (level or os.getenv('NETIS_LOG_LEVEL', 'INFO')).upper()
+        fmt = fmt or os.getenv('NETIS_LOG_FORMAT', 'auto')
+        if fmt == "auto":
+            fmt = "text" if sys.stderr.isatty() else "json"
+        log_file = log_file or os.getenv('NETIS_LOG_FILE')
+
+        console = logging.StreamHandler(sys.stderr)
+        console.setFormatter(TextFormatter() if fmt == "text" else JsonFormatter())
+        handlers = [console]
+        if log_file:
+            os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+            file_handler = logging.FileHandler(log_file, encoding="utf-8")
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+        queue_handler = _QueueHandler(log_queue)
+        queue_handler.addFilter(_ContextFilter())
+
+        root.setLevel(level)
+        for handler in [h for h in root.handlers if isinstance(h, _QueueHandler)]:
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.propagate = False
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    return root
+
+
+def shutdown_logging():
+    """キューに残ったログを書き出してリスナーを止める"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    モジュール用のロガーを取得（初回に出力を設定）
+
+    Args:
+        name: モジュール名（__name__）
+
+    Returns:
+        netis.<モジュール名> のロガー
+    """
+    setup_logging()
+    short_name = name.split(".")[-1] if name != "__main__" else "main"
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{short_name}")
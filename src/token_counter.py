@@ -0,0 +1,214 @@
+"""
+プロンプトのトークン数を数えるモジュール
+tiktokenが使えればそれを使い、使えない環境では文字種から概算する
+"""
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from typing import List, Dict, Optional
+import os
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken未導入の環境では概算で代用
+    tiktoken = None
+
+
+DEFAULT_ENCODING = os.getenv('NETIS_TOKENIZER_ENCODING', 'cl100k_base')
+
+# チャットメッセージ1件あたりのオーバーヘッド（role等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=4)
+def _get_encoding(encoding_name: str):
+    """
+    エンコーディングを取得（生成コストが高いのでキャッシュ）
+    tiktoken未導入、またはオフラインで語彙ファイルを取得できない場合はNone
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception:
+        return None
+
+
+def _estimate_tokens(text: str) -> int:
+    """
+    tiktokenが無い場合の概算（入力上限を超えないよう多めに見積もる）
+    cl100kでは漢字1文字が2〜3トークンになることもあるため、日本語などの非ASCII文字は1文字=2トークン、
+    ASCIIは3文字≒1トークンとみなす
+    """
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (len(text) - ascii_chars) * 2 + (ascii_chars + 2) // 3
+
+
+def _token_char_offsets(encoding, tokens: List[int]) -> List[Optional[int]]:
+    """
+    各トークンの開始位置（文字単位）
+    日本語などのマルチバイト文字はトークンの境界が文字の途中になることがあり、その位置はNone
+    （そこで切ってdecodeすると文字が壊れてU+FFFDになる）
+    """
+    offsets = []
+    chars = 0
+    for token in tokens:
+        data = encoding.decode_single_token_bytes(token)
+        # UTF-8の継続バイト（0b10xxxxxx）で始まるトークンは文字の途中
+        offsets.append(None if data and 0x80 <= data[0] < 0xC0 else chars)
+        chars += sum(1 for byte in data if not 0x80 <= byte < 0xC0)
+    return offsets
+
+
+def count_tokens(text: str, encoding_name: str = DEFAULT_ENCODING) -> int:
+    """
+    テキストのトークン数を数える
+
+    Args:
+        text: 対象テキスト
+        encoding_name: tiktokenのエンコーディング名
+
+    Returns:
+        トークン数
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(encoding_name)
+    if encoding is None:
+        return _estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding_name: str = DEFAULT_ENCODING) -> str:
+    """
+    テキストを指定トークン数以内に切り詰める
+
+    Args:
+        text: 対象テキスト
+        max_tokens: 最大トークン数
+        encoding_name: tiktokenのエンコーディング名
+
+    Returns:
+        切り詰めたテキスト（切り詰めた場合は末尾に「…」、「…」も入らない上限では付けない）
+    """
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text, encoding_name) <= max_tokens:
+        return text
+
+    encoding = _get_encoding(encoding_name)
+    if encoding is None:
+        # 概算の場合は「…」（非ASCIIのため2トークン）の分を残して二分探索で文字数を決める
+        ellipsis = "…" if _estimate_tokens("…") <= max_tokens else ""
+        budget = max_tokens - _estimate_tokens(ellipsis)
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if _estimate_tokens(text[:mid]) <= budget:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low] + ellipsis
+
+    # 「…」の分を残し、文字の途中にならない位置まで戻って元のテキストを切る
+    ellipsis_tokens = len(encoding.encode("…"))
+    ellipsis = "…" if ellipsis_tokens <= max_tokens else ""
+    tokens = encoding.encode(text, disallowed_special=())
+    offsets = _token_char_offsets(encoding, tokens[:max_tokens + 1])
+    cut = max_tokens - ellipsis_tokens if ellipsis else max_tokens
+    while cut > 0 and offsets[cut] is None:
+        cut -= 1
+    return text[:offsets[cut]] + ellipsis
+
+
+def split_by_tokens(
+    text: str,
+    max_tokens: int,
+    overlap_tokens: int = 0,
+    encoding_name: str = DEFAULT_ENCODING
+) -> List[str]:
+    """
+    テキストを指定トークン数ごとの窓に分割（切り捨ては行わない）
+
+    Args:
+        text: 対象テキスト
+        max_tokens: 1窓あたりの最大トークン数
+        overlap_tokens: 隣り合う窓で重複させるトークン数
+        encoding_name: tiktokenのエンコーディング名
+
+    Returns:
+        分割したテキストのリスト
+    """
+    if not text:
+        return []
+
+    encoding = _get_encoding(encoding_name)
+    if encoding is None:
+        # 概算の場合は先頭から窓に収まる最長の文字数を二分探索で決める
+        windows = []
+        start = 0
+        while start < len(text):
+            low, high = start + 1, len(text)
+            while low < high:
+                mid = (low + high + 1) // 2
+                if _estimate_tokens(text[start:mid]) <= max_tokens:
+                    low = mid
+                else:
+                    high = mid - 1
+            windows.append(text[start:low])
+            if low >= len(text):
+                break
+            # 重複分だけ戻して次の窓を開始
+            back = low
+            while back > start + 1 and _estimate_tokens(text[back:low]) < overlap_tokens:
+                back -= 1
+            start = back if back > start else low
+        return windows
+
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return [text]
+
+    # 文字の先頭から始まるトークンの位置（窓はここでだけ区切り、文字を壊さない）
+    offsets = _token_char_offsets(encoding, tokens)
+    boundaries = [i for i, offset in enumerate(offsets) if offset is not None] + [len(tokens)]
+    char_at = {i: offsets[i] for i in boundaries[:-1]}
+    char_at[len(tokens)] = len(text)
+
+    windows = []
+    start = 0
+    while True:
+        if start + max_tokens >= len(tokens):
+            windows.append(text[char_at[start]:])
+            break
+        # 窓の末尾を文字の境界まで戻す（1文字が窓より大きい場合はその文字まで含める）
+        index = bisect_right(boundaries, start + max_tokens) - 1
+        if boundaries[index] <= start:
+            index = bisect_right(boundaries, start)
+        end = boundaries[index]
+        window = text[char_at[start]:char_at[end]]
+        # 切り出した部分だけを数え直すとトークン化が変わることがあるため、超えた分は縮める
+        while index > 0 and boundaries[index - 1] > start and count_tokens(window, encoding_name) > max_tokens:
+            index -= 1
+            end = boundaries[index]
+            window = text[char_at[start]:char_at[end]]
+        windows.append(window)
+        # 重複分だけ戻した境界から次の窓を開始
+        start = boundaries[bisect_left(boundaries, max(end - overlap_tokens, start + 1))]
+    return windows
+
+
+def count_message_tokens(messages: List[Dict[str, str]], encoding_name: str = DEFAULT_ENCODING) -> int:
+    """
+    チャットメッセージのリスト全体のトークン数を数える
+
+    Args:
+        messages: {"role", "content"} のリスト
+        encoding_name: tiktokenのエンコーディング名
+
+    Returns:
+        トークン数
+    """
+    return sum(
+        count_tokens(m.get("content") or "", encoding_name) + MESSAGE_OVERHEAD_TOKENS
+        for m in messages
+    )
@@ -0,0 +1,297 @@
+"""
+処理段階ごとの所要時間を記録するトレーシングモジュール
+
+NETIS_TRACINGで出力先を切り替える:
+    off      記録しない（既定、span()は共有の空スパンを返すだけ）
+    console  ターンなどの最上位スパンが終わるたびに段階ごとの所要時間をツリー表示
+    json     1スパン1行のJSON Lines（NETIS_TRACE_FILE、既定 logs/traces.jsonl）
+    otel     OpenTelemetryのトレーサーに渡す（エクスポーターはOTEL_*環境変数・SDK側で設定）
+             opentelemetryが未導入ならjsonに切り替える
+
+add_listener()で登録した関数には終了したスパンが渡される（src/metrics.pyが集計に使う）。
+リスナーがあればNETIS_TRACING=offでもスパンを記録する（出力はしない）。
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import json
+import os
+import threading
+import time
+import uuid
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # OpenTelemetry未導入の環境ではローカル出力のみ
+    otel_trace = None
+
+
+class _NoopSpan:
+    """無効時に返す空スパン（withにもそのまま使え、属性の設定は何もしない）"""
+
+    recording = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+# 終了したスパンを受け取る関数
+_listeners: List[Callable[["Span"], None]] = []
+
+
+class Span:
+    """ローカル出力用のスパン"""
+
+    recording = True
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms = 0.0
+        self.status = "ok"
+
+    def set(self, **attributes):
+        """属性（件数・サイズ・トークン数・キャッシュヒットなど）を追加"""
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_time,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+
+class _OtelSpan:
+    """OpenTelemetryのスパンを同じインターフェースで包む（リスナー用に属性と所要時間も保持）"""
+
+    recording = True
+    status = "ok"
+
+    def __init__(self, name: str, span):
+        self.name = name
+        self._span = span
+        self.attributes: Dict[str, Any] = {}
+        self._start = time.perf_counter()
+        self.duration_ms = 0.0
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        for key, value in attributes.items():
+            if value is not None:
+                self._span.set_attribute(key, value if isinstance(value, (bool, int, float, str)) else str(value))
+
+
+class _ConsoleExporter:
+    """最上位スパンの終了時にトレース全体をツリー表示"""
+
+    def __init__(self):
+        self._pending: Dict[str, List[Span]] = {}
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            spans = self._pending.setdefault(span.trace_id, [])
+            spans.append(span)
+            if span.parent_id is not None:
+                return
+            del self._pending[span.trace_id]
+
+        children: Dict[Optional[str], List[Span]] = {}
+        for s in spans:
+            children.setdefault(s.parent_id, []).append(s)
+
+        lines = []
+
+        def walk(parent_id, depth):
+            for s in sorted(children.get(parent_id, []), key=lambda s: s.start_time):
+                attrs = " ".join(f"{k}={v}" for k, v in s.attributes.items())
+                lines.append(f"{'  ' * depth}{s.name:<{max(28 - 2 * depth, 1)}} {s.duration_ms:9.1f} ms  {attrs}")
+                walk(s.span_id, depth + 1)
+
+        walk(None, 0)
+        print("[trace] " + span.trace_id + "\n" + "\n".join(lines))
+
+
+class _JsonExporter:
+    """1スパン1行のJSON Linesでファイルに追記"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class Tracer:
+    """スパンを作成して出力先に渡すクラス"""
+
+    def __init__(self, mode: str = "off", path: str = None):
+        """
+        初期化
+
+        Args:
+            mode: "off" / "console" / "json" / "otel"
+            path: jsonの出力先
+        """
+        if mode == "otel" and otel_trace is None:
+            _logger().warning("opentelemetry is not installed; writing traces as JSON instead")
+            mode = "json"
+        self.mode = mode
+        self.enabled = mode != "off"
+        self._current: ContextVar[Optional[Any]] = ContextVar("netis_current_span", default=None)
+        self._exporter = None
+        self._otel_tracer = None
+        if mode == "console":
+            self._exporter = _ConsoleExporter()
+        elif mode == "json":
+            self._exporter = _JsonExporter(path or os.getenv('NETIS_TRACE_FILE', 'logs/traces.jsonl'))
+        elif mode == "otel":
+            self._otel_tracer = otel_trace.get_tracer("netis-agent")
+
+    def span(self, name: str, **attributes):
+        """
+        スパンを開始（withブロックの終了で記録）
+
+        無効時は共有の空スパンをそのまま返すため、計測箇所のコストは関数呼び出し1回分になる。
+
+        Args:
+            name: 段階の名前（"search.embedding" など）
+            **attributes: 開始時点で分かっている属性
+
+        Returns:
+            set(**attributes)で属性を追加できるスパンのコンテキストマネージャー
+        """
+        if not self.enabled and not _listeners:
+            return _NOOP_SPAN
+        return self._record(name, attributes)
+
+    @contextmanager
+    def _record(self, name: str, attributes: Dict[str, Any]):
+        """有効時のスパン（OpenTelemetryまたはローカル出力）"""
+        if self._otel_tracer is not None:
+            with self._otel_tracer.start_as_current_span(name) as otel_span:
+                span = _OtelSpan(name, otel_span)
+                span.set(**attributes)
+                token = self._current.set(span)
+                try:
+                    yield span
+                except BaseException:
+                    span.status = "error"
+                    raise
+                finally:
+                    self._current.reset(token)
+                    span.duration_ms = (time.perf_counter() - span._start) * 1000.0
+                    _notify(span)
+            return
+
+        parent = self._current.get()
+        span = Span(
+            name,
+            trace_id=parent.trace_id if parent is not None else uuid.uuid4().hex,
+            parent_id=parent.span_id if parent is not None else None,
+            attributes=dict(attributes)
+        )
+        token = self._current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.attributes["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self._current.reset(token)
+            span.duration_ms = (time.perf_counter() - span._start) * 1000.0
+            if self._exporter is not None:
+                self._exporter.export(span)
+            _notify(span)
+
+    def current_span(self):
+        """実行中のスパン（無ければ空スパン）"""
+        if not self.enabled and not _listeners:
+            return _NOOP_SPAN
+        return self._current.get() or _NOOP_SPAN
+
+
+def _logger():
+    """ロガー（structured_loggingがトレースIDの付与にこのモジュールを使うため遅延して取得）"""
+    from src.structured_logging import get_logger
+    return get_logger(__name__)
+
+
+def _notify(span):
+    """リスナーに終了したスパンを渡す（リスナーの例外は処理を止めない）"""
+    for listener in _listeners:
+        try:
+            listener(span)
+        except Exception as e:
+            _logger().warning("Span listener failed", extra={"span": span.name, "error": str(e)})
+
+
+_tracer = Tracer(os.getenv('NETIS_TRACING', 'off'))
+
+
+def configure(mode: str, path: str = None) -> Tracer:
+    """
+    出力先を切り替える（環境変数より優先）
+
+    Args:
+        mode: "off" / "console" / "json" / "otel"
+        path: jsonの出力先
+
+    Returns:
+        新しいTracer
+    """
+    global _tracer
+    _tracer = Tracer(mode, path)
+    return _tracer
+
+
+def span(name: str, **attributes):
+    """現在のトレーサーでスパンを開始（tracing.span("search") のように使う）"""
+    return _tracer.span(name, **attributes)
+
+
+def current_span():
+    """実行中のスパン（無効時・スパン外では空スパン）"""
+    return _tracer.current_span()
+
+
+def enabled() -> bool:
+    """トレーシングが有効か"""
+    return _tracer.enabled
+
+
+def add_listener(listener: Callable[[Span], None]):
+    """
+    終了したスパンを受け取る関数を登録（同じ関数は1回だけ）
+
+    Args:
+        listener: Spanを受け取る関数（name / duration_ms / status / attributesを参照できる）
+    """
+    if listener not in _listeners:
+        _listeners.append(listener)
@@ -0,0 +1,56 @@
+"""
+mmr_rerankが素朴なMMRと同じ順に選ぶことの確認
+"""
+import numpy as np
+import pytest
+
+from src.diversifier import mmr_rerank
+
+
+def naive_mmr(query, candidates, top, lambda_mult):
+    """候補同士の類似度を毎回すべて計算する素朴なMMR（比較用）"""
+    candidates = np.asarray(candidates, dtype=np.float64)
+    query = np.asarray(query, dtype=np.float64)
+    unit = candidates / np.linalg.norm(candidates, axis=1, keepdims=True)
+    relevance = unit @ (query / np.linalg.norm(query))
+    selected = []
+    for _ in range(min(top, len(candidates))):
+        best, best_score = None, -np.inf
+        for i in range(len(candidates)):
+            if i in selected:
+                continue
+            redundancy = max((unit[i] @ unit[j] for j in selected), default=0.0)
+            score = lambda_mult * relevance[i] - (1.0 - lambda_mult) * redundancy if selected else relevance[i]
+            if score > best_score:
+                best, best_score = i, score
+        selected.append(best)
+    return selected
+
+
+def clustered_pool(size, dimensions, seed):
+    """ほぼ同一の候補の集まりを含む候補（同じ製品系列の変種を模したもの）"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(size // 10, 1), dimensions))
+    pool = centers[rng.integers(0, len(centers), size)] + 0.3 * rng.standard_normal((size, dimensions))
+    query = centers[0] + 0.5 * rng.standard_normal(dimensions)
+    return query.astype(np.float32), pool.astype(np.float32)
+
+
+@pytest.mark.parametrize("size,top", [(1, 10), (5, 10), (50, 10), (300, 10), (300, 40)])
+@pytest.mark.parametrize("lambda_mult", [0.3, 0.7, 1.0])
+def test_mmr_rerank_matches_naive(size, top, lambda_mult):
+    query, pool = clustered_pool(size, 64, seed=size + top)
+    expected = naive_mmr(query, pool, top, lambda_mult)
+    assert mmr_rerank(query, pool, top=top, lambda_mult=lambda_mult) == expected
+    assert mmr_rerank(query, list(pool), top=top, lambda_mult=lambda_mult) == expected
+
+
+def test_mmr_rerank_normalized_input():
+    query, pool = clustered_pool(200, 64, seed=1)
+    unit = pool / np.linalg.norm(pool, axis=1, keepdims=True)
+    expected = naive_mmr(query, pool, 10, 0.7)
+    assert mmr_rerank(query, unit, top=10, lambda_mult=0.7, normalized=True) == expected
+
+
+def test_mmr_rerank_empty():
+    assert mmr_rerank([1.0, 0.0], [], top=10) == []
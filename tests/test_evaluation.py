@@ -0,0 +1,28 @@
+"""
+評価指標（recall・MRR・nDCG）の確認
+"""
+import pytest
+
+from src.evaluation import recall_at_k, evaluate_ranking
+
+
+def test_recall_ignores_grade_zero_ids():
+    relevant = {"a": 2, "b": 1, "x": 0, "y": 0}
+    assert recall_at_k(["a", "b", "c"], relevant, k=10) == pytest.approx(1.0)
+    assert recall_at_k(["a", "c", "d"], relevant, k=10) == pytest.approx(0.5)
+
+
+def test_recall_caps_denominator_at_k():
+    relevant = {doc_id: 1 for doc_id in "abcdef"}
+    assert recall_at_k(["a", "b", "z"], relevant, k=3) == pytest.approx(2 / 3)
+
+
+def test_recall_without_positive_ids_is_zero():
+    assert recall_at_k(["a"], {}, k=5) == 0.0
+    assert recall_at_k(["a"], {"a": 0}, k=5) == 0.0
+
+
+def test_evaluate_ranking_perfect_order():
+    relevant = {"a": 2, "b": 1, "x": 0}
+    scores = evaluate_ranking(["a", "b"], relevant, k=5)
+    assert scores == pytest.approx({"recall": 1.0, "mrr": 1.0, "ndcg": 1.0})
@@ -0,0 +1,65 @@
+"""
+token_counterの切り詰め・分割がトークン上限を超えないことの確認
+"""
+import pytest
+
+from src import token_counter
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+SAMPLES = [
+    "トンネル覆工コンクリートの漏水箇所に注入材を充填し、止水する工法。" * 8,
+    "Waterproofing method for tunnel lining concrete, NETIS KT-123456-A. " * 8,
+    "橋梁の防食塗装（Rc-I塗装系）に用いる低VOC塗料で、既設塗膜の上から施工できる。" * 8,
+]
+
+
+def byte_level_encoding():
+    """1バイト=1トークンのエンコーディング（語彙ファイルのダウンロード不要、マルチバイト文字が必ず分割される）"""
+    return tiktoken.Encoding(
+        "netis-test-bytes",
+        pat_str=r"\S+|\s+",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={}
+    )
+
+
+@pytest.fixture(params=["estimate", "tiktoken"])
+def encoding_path(request, monkeypatch):
+    """概算（tiktokenなし）とtiktokenの両方の経路で実行"""
+    if request.param == "estimate":
+        monkeypatch.setattr(token_counter, "_get_encoding", lambda name: None)
+    else:
+        if tiktoken is None:
+            pytest.skip("tiktoken is not installed")
+        encoding = byte_level_encoding()
+        monkeypatch.setattr(token_counter, "_get_encoding", lambda name: encoding)
+    return request.param
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+@pytest.mark.parametrize("max_tokens", [1, 2, 3, 5, 10, 37, 64, 200])
+def test_truncate_to_tokens_stays_within_budget(encoding_path, text, max_tokens):
+    result = token_counter.truncate_to_tokens(text, max_tokens)
+    assert token_counter.count_tokens(result) <= max_tokens
+    assert "�" not in result
+    if token_counter.count_tokens(text) > max_tokens and result.endswith("…"):
+        assert text.startswith(result[:-1])
+
+
+def test_truncate_to_tokens_keeps_short_text(encoding_path):
+    text = "トンネル"
+    assert token_counter.truncate_to_tokens(text, 100) == text
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+@pytest.mark.parametrize("max_tokens,overlap", [(16, 0), (16, 4), (50, 10)])
+def test_split_by_tokens_windows_within_budget(encoding_path, text, max_tokens, overlap):
+    windows = token_counter.split_by_tokens(text, max_tokens, overlap_tokens=overlap)
+    assert windows
+    assert all(token_counter.count_tokens(window) <= max_tokens for window in windows)
+    assert all("�" not in window for window in windows)
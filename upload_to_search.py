@@ -3,96 +3,236 @@
 NETISデータをAzure AI Searchに投入するメインスクリプト
 
 使用方法:
-    python upload_to_search.py
+    python upload_to_search.py [--embed-representatives-only] [--passages] [--metrics-file PATH]
+                               [--profile {cprofile,sampling}] [--profile-dir DIR]
 """
 from src.data_processor import NETISDataProcessor
-from src.embedding_generator import EmbeddingGenerator
+from src.embedding_generator import create_embedding_generator
 from src.search_indexer import AzureSearchIndexer
+from src.search_cache import write_index_version
+from src.similarity_graph import build_knn_graph, save_knn_graph
+from src.passage_chunker import build_passages, DEFAULT_PASSAGE_TOKENS
+from src import tracing
+from src import metrics
+from src.profiling import PROFILE_MODES, StageProfiler
+from src.structured_logging import get_logger, new_run_id
+from contextlib import contextmanager
 from pathlib import Path
+import argparse
+import os
 import sys
+import time
+
+
+logger = get_logger(__name__)
+
+
+@contextmanager
+def log_step(step: str, profiler: StageProfiler = None, total_steps: int = 4):
+    """ステップの開始・終了を所要時間付きで記録（profiler指定時はステップごとにプロファイル）"""
+    start = time.perf_counter()
+    logger.info("Step started", extra={"step": step, "total_steps": total_steps})
+    if profiler is not None:
+        with profiler.stage(step):
+            yield
+    else:
+        yield
+    logger.info("Step finished", extra={
+        "step": step, "total_steps": total_steps,
+        "duration_ms": round((time.perf_counter() - start) * 1000.0, 1)
+    })
+
+
+def parse_args():
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="NETISデータをAzure AI Searchに投入")
+    parser.add_argument(
+        "--embed-representatives-only",
+        action="store_true",
+        help="ほぼ同一のドキュメントのクラスタごとに代表1件だけエンベディングを生成し、他はそのベクトルを共有する"
+    )
+    parser.add_argument(
+        "--passages",
+        action="store_true",
+        help="長いフィールドをトークン数上限付きのパッセージに分割し、パッセージ用インデックス（<index>-passages）にも投入する"
+    )
+    parser.add_argument(
+        "--passage-tokens",
+        type=int,
+        default=DEFAULT_PASSAGE_TOKENS,
+        help="1パッセージの最大トークン数"
+    )
+    parser.add_argument(
+        "--metrics-file",
+        default=None,
+        help="終了時にメトリクス（バッチの所要時間・成否・リトライ・トークン数）をPrometheusのテキスト形式で書き出すファイル"
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="cprofile",
+        default=None,
+        choices=PROFILE_MODES,
+        help="ステップごとにプロファイルを取る（cprofile: 呼び出し回数・累積時間、sampling: フレームグラフ用の折り畳みスタック）"
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default=None,
+        help="プロファイルの出力先（既定 profiles/<実行ID>）"
+    )
+    parser.add_argument(
+        "--no-profile-memory",
+        action="store_true",
+        help="プロファイル時にtracemallocでメモリ確保を追跡しない（計測のオーバーヘッドを減らす）"
+    )
+    return parser.parse_args()
 
 
 def main():
     """メイン処理"""
-    print("=" * 60)
-    print("NETIS Data Upload to Azure AI Search")
-    print("=" * 60)
+    args = parse_args()
+    metrics.configure_from_env()
+    if args.metrics_file:
+        metrics.enable()
+
+    run_id = new_run_id()
+    profiler = None
+    if args.profile:
+        profiler = StageProfiler(
+            args.profile_dir or os.path.join("profiles", run_id),
+            mode=args.profile,
+            memory=not args.no_profile_memory
+        )
+    run_start = time.perf_counter()
+    logger.info("NETIS data upload to Azure AI Search started", extra={"options": vars(args)})
 
     try:
         # ステップ1: Excelデータの読み込みと整形
-        print("\n[Step 1/4] Loading and processing Excel data...")
         excel_path = Path(__file__).parent / "netisデータ.xlsx"
 
         if not excel_path.exists():
-            print(f"Error: Excel file not found: {excel_path}")
+            logger.error("Excel file not found", extra={"path": str(excel_path)})
             sys.exit(1)
 
-        processor = NETISDataProcessor(str(excel_path))
-        documents = processor.process_all(
-            output_json_path="data/processed/netis_documents.json"
-        )
-
-        print(f"✓ Processed {len(documents)} documents")
+        with log_step("load", profiler):
+            processor = NETISDataProcessor(str(excel_path))
+            with tracing.span("ingest.process") as span:
+                documents = processor.process_all(
+                    output_json_path="data/processed/netis_documents.json"
+                )
+                span.set(documents=len(documents))
 
         # ステップ2: エンベディングの生成
-        print("\n[Step 2/4] Generating embeddings...")
-        generator = EmbeddingGenerator()
-
-        # searchable_textからエンベディングを生成
-        texts = [doc['searchable_text'] for doc in documents]
-        embeddings = generator.generate_embeddings_batch(
-            texts,
-            batch_size=16,
-            delay=0.5
-        )
-
-        # ドキュメントにエンベディングを追加
-        for doc, embedding in zip(documents, embeddings):
-            doc['searchable_text_vector'] = embedding
-
-        print(f"✓ Generated embeddings for {len(embeddings)} documents")
+        with log_step("embed", profiler):
+            generator = create_embedding_generator()
+
+            # searchable_textからエンベディングを生成（オプション指定時はクラスタの代表のみ）
+            if args.embed_representatives_only:
+                targets = [doc for doc in documents if doc['cluster_id'] == doc['id']]
+                logger.info("Embedding cluster representatives only", extra={
+                    "representatives": len(targets), "skipped": len(documents) - len(targets)
+                })
+            else:
+                targets = documents
+            texts = [doc['searchable_text'] for doc in targets]
+            with tracing.span("ingest.embeddings", texts=len(texts)):
+                vectors = generator.generate_embeddings_batch(
+                    texts,
+                    batch_size=16,
+                    delay=0.5
+                )
+
+            # ドキュメントにエンベディングを追加（代表以外は代表のベクトルを共有）
+            vector_by_id = {doc['id']: vector for doc, vector in zip(targets, vectors)}
+            embeddings = []
+            for doc in documents:
+                doc['searchable_text_vector'] = vector_by_id.get(doc['id']) or vector_by_id[doc['cluster_id']]
+                embeddings.append(doc['searchable_text_vector'])
+
+            # 類似技術の近傍グラフを事前計算（アプリの「類似技術」で使用）
+            neighbors, scores = build_knn_graph(embeddings, k=10)
+            save_knn_graph(
+                "data/processed/similar_technologies.npz",
+                [doc['id'] for doc in documents],
+                neighbors,
+                scores
+            )
+            logger.info("Saved similar technologies graph", extra={
+                "documents": len(documents), "neighbors_per_document": int(neighbors.shape[1])
+            })
 
         # ステップ3: インデックスの作成
-        print("\n[Step 3/4] Creating search index...")
-        indexer = AzureSearchIndexer()
-
-        # 既存インデックスがあれば削除確認
-        try:
-            stats = indexer.get_index_stats()
-            print(f"Existing index found with {stats['document_count']} documents")
-            response = input("Delete and recreate index? (yes/no): ")
-            if response.lower() == 'yes':
-                indexer.delete_index()
+        with log_step("index", profiler):
+            indexer = AzureSearchIndexer()
+
+            # 既存インデックスがあれば削除確認
+            try:
+                stats = indexer.get_index_stats()
+                logger.info("Existing index found", extra={
+                    "index": indexer.index_name, "documents": stats['document_count']
+                })
+                response = input("Delete and recreate index? (yes/no): ")
+                if response.lower() == 'yes':
+                    indexer.delete_index()
+                    indexer.create_index()
+                else:
+                    logger.info("Using existing index", extra={"index": indexer.index_name})
+            except Exception:
+                # インデックスが存在しない場合は新規作成
                 indexer.create_index()
-            else:
-                print("Using existing index")
-        except Exception:
-            # インデックスが存在しない場合は新規作成
-            indexer.create_index()
-
-        print("✓ Index ready")
 
         # ステップ4: ドキュメントのアップロード
-        print("\n[Step 4/4] Uploading documents to search index...")
-        indexer.upload_documents(documents, batch_size=10)
+        with log_step("upload", profiler):
+            with tracing.span("ingest.upload", documents=len(documents)):
+                indexer.upload_documents(documents, batch_size=10)
+
+        # パッセージ用インデックスへの投入（オプション）
+        if args.passages:
+            with log_step("passages", profiler):
+                passages = build_passages(documents, max_tokens=args.passage_tokens)
+                passage_vectors = generator.generate_embeddings_batch(
+                    [p['content'] for p in passages],
+                    batch_size=16,
+                    delay=0.5
+                )
+                for passage, vector in zip(passages, passage_vectors):
+                    passage['content_vector'] = vector
+
+                passage_indexer = AzureSearchIndexer(index_name=f"{indexer.index_name}-passages")
+                passage_indexer.create_passage_index()
+                passage_indexer.upload_documents(passages, batch_size=50)
+                # 上書きされずに残った古いパッセージ（分割数が減った・技術が消えた分）を削除
+                passage_indexer.delete_stale_documents({p['id'] for p in passages})
+                logger.info("Uploaded passages", extra={"passages": len(passages), "documents": len(documents)})
 
         # 最終統計
         final_stats = indexer.get_index_stats()
-        print(f"\n✓ Upload completed")
-        print(f"  Total documents in index: {final_stats['document_count']}")
 
-        print("\n" + "=" * 60)
-        print("SUCCESS: All data uploaded to Azure AI Search!")
-        print("=" * 60)
+        # 検索キャッシュ無効化用のバージョンスタンプを更新
+        version = write_index_version(
+            "data/processed/index_version.json",
+            document_count=final_stats['document_count']
+        )
+        logger.info("Upload completed", extra={
+            "index": indexer.index_name,
+            "documents_in_index": final_stats['document_count'],
+            "index_version": version,
+            "duration_ms": round((time.perf_counter() - run_start) * 1000.0, 1)
+        })
 
     except KeyboardInterrupt:
-        print("\n\nProcess interrupted by user")
+        logger.warning("Process interrupted by user")
         sys.exit(1)
-    except Exception as e:
-        print(f"\n\nERROR: {str(e)}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Upload failed")
         sys.exit(1)
+    finally:
+        if profiler is not None:
+            summary_path = profiler.write_summary()
+            logger.info("Profiles written", extra={"path": str(summary_path.parent)})
+        if args.metrics_file:
+            metrics.write_textfile(args.metrics_file)
+            logger.info("Metrics written", extra={"path": args.metrics_file})
 
 
 if __name__ == "__main__":